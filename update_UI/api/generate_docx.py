@@ -1,5 +1,4 @@
 from http.server import BaseHTTPRequestHandler
-import json
 import sys
 import os
 
@@ -7,6 +6,8 @@ import os
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
 from lib.docx.render_with_docxtpl import render_report
+from lib.python import json_codec
+from lib.docx.payload_container import PayloadContainer, is_container
 
 class handler(BaseHTTPRequestHandler):
     def do_POST(self):
@@ -14,8 +15,13 @@ class handler(BaseHTTPRequestHandler):
         post_data = self.rfile.read(content_length)
         
         try:
-            payload = json.loads(post_data.decode('utf-8'))
-            docx_bytes = render_report(payload)
+            # Binary container bodies carry figures as raw frames; plain JSON bodies use base64 buffers.
+            if is_container(post_data):
+                with PayloadContainer.from_bytes(post_data) as container:
+                    docx_bytes = render_report(container.payload, container.attachments)
+            else:
+                payload = json_codec.loads(post_data)
+                docx_bytes = render_report(payload)
             
             self.send_response(200)
             self.send_header('Content-Type', 'application/vnd.openxmlformats-officedocument.wordprocessingml.document')
@@ -27,5 +33,4 @@ class handler(BaseHTTPRequestHandler):
             self.send_response(500)
             self.send_header('Content-Type', 'application/json')
             self.end_headers()
-            error_msg = json.dumps({"error": str(e)})
-            self.wfile.write(error_msg.encode('utf-8'))
+            self.wfile.write(json_codec.dumps({"error": str(e)}))
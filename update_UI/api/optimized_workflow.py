@@ -1,82 +1,89 @@
 from http.server import BaseHTTPRequestHandler
 import asyncio
 import base64
-import json
+import hashlib
 import os
 import sys
-import tempfile
+from typing import Optional
 
 # Add project root to sys.path for imports
 sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 
 from lib.python import optimized_workflow as ow
+from lib.python import json_codec
+from lib.python.remote_file import DownloadError, fetch_file
 
 
-async def run_optimized_workflow(file_path: str) -> dict:
-  full_text = await ow.extract_text_from_file(file_path)
-  splitter = ow.SmartSplitter()
-  contexts = splitter.split(full_text)
+async def run_optimized_workflow(file_bytes: bytes, filename: str, file_sha256: Optional[str] = None,
+                                 plan_only: bool = False) -> bytes:
+  """
+  Run the workflow and return the response body (UTF-8 JSON) serialized once by pydantic.
+  With plan_only, return the token / cost / latency plan instead of calling the API.
+  """
+  # Repeat uploads of the same manual reuse the cached extraction (keyed by content hash)
+  contexts, entry = await ow.extract_contexts_cached(file_bytes, filename, sha256=file_sha256)
 
-  summary_task = ow.generate_summary(contexts.full_text)
-  methods_task = ow.extract_methods(contexts.method_text)
-  discussion_task = ow.normalize_discussion(contexts.discussion_text)
-
-  summary_res, methods_res, discussion_res = await asyncio.gather(
-    summary_task,
-    methods_task,
-    discussion_task,
-  )
+  # Refuses (BudgetExceeded) or chunks over-budget tasks before any API call
+  plan = ow.plan_workflow(contexts, token_counts=ow.cached_token_counts(entry))
+  if plan_only:
+    return json_codec.dumps(plan.to_dict())
+  summary_res, methods_res, discussion_res = await ow.run_tasks(contexts, plan)
 
   builder = ow.LabReportBuilder(chapter=5)
   structured_experiments = builder.build_experiments(methods_res.experiments)
 
-  final_json_str = builder.assemble_final_json(
+  root = builder.assemble_final(
     summary=summary_res.summary,
     units=discussion_res.units,
     experiments=structured_experiments,
     refs=discussion_res.references,
   )
 
-  return json.loads(final_json_str)
+  return root.model_dump_json().encode("utf-8")
 
 
 class handler(BaseHTTPRequestHandler):
   def do_POST(self):
-    temp_path = None
     try:
       content_length = int(self.headers.get("Content-Length", "0"))
       body = self.rfile.read(content_length)
-      payload = json.loads(body.decode("utf-8"))
+      payload = json_codec.loads(body)
 
       file_url = payload.get("file_url")
       file_b64 = payload.get("file_base64")
       filename = payload.get("filename") or "upload.pdf"
-      
-      suffix = os.path.splitext(filename)[1] or ".pdf"
-      
+      if not os.path.splitext(filename)[1]:
+        filename += ".pdf"
+
+      # The upload stays in memory; the extractors read bytes directly (no temp file).
       if file_url:
-        import urllib.request
-        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-          temp_path = tmp.name
-        urllib.request.urlretrieve(file_url, temp_path)
+        # Streamed with a size limit and timeouts over a pooled connection, hashed while reading
+        fetched = fetch_file(file_url)
+        file_bytes, file_sha256 = fetched.data, fetched.sha256
       elif file_b64:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-          tmp.write(base64.b64decode(file_b64))
-          temp_path = tmp.name
+        file_bytes = base64.b64decode(file_b64)
+        file_sha256 = hashlib.sha256(file_bytes).hexdigest()
       else:
         raise ValueError("file_url or file_base64 is required")
 
-      result = asyncio.run(run_optimized_workflow(temp_path))
+      result_body = asyncio.run(
+        run_optimized_workflow(file_bytes, filename, file_sha256, plan_only=bool(payload.get("plan")))
+      )
 
       self.send_response(200)
-      self.send_header("Content-Type", "application/json")
+      self.send_header("Content-Type", "application/json; charset=utf-8")
+      self.send_header("X-Content-SHA256", file_sha256)
       self.end_headers()
-      self.wfile.write(json.dumps(result).encode("utf-8"))
+      self.wfile.write(result_body)
     except Exception as e:
-      self.send_response(500)
+      if isinstance(e, DownloadError):
+        # 400 bad file_url, 413 over the size limit, 502 the storage request failed
+        status = e.status
+      elif isinstance(e, ow.token_budget.BudgetExceeded):
+        status = 413
+      else:
+        status = 500
+      self.send_response(status)
       self.send_header("Content-Type", "application/json")
       self.end_headers()
-      self.wfile.write(json.dumps({"error": str(e)}).encode("utf-8"))
-    finally:
-      if temp_path and os.path.exists(temp_path):
-        os.remove(temp_path)
+      self.wfile.write(json_codec.dumps({"error": str(e)}))
@@ -1,60 +1,55 @@
 from http.server import BaseHTTPRequestHandler
 import asyncio
 import base64
-import json
+import hashlib
 import os
 import sys
-import tempfile
 
 # Add project root to sys.path for imports
 sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 
 from lib.python import past_report_workflow as pr
+from lib.python import json_codec
+from lib.python.remote_file import DownloadError, fetch_file
 
 
-async def run_past_report(file_path: str) -> dict:
-  text = pr.read_docx_text(file_path)
-  structure = await pr.extract_hint_with_llm(text)
-  return structure.model_dump()
+async def run_past_report(file_bytes: bytes) -> bytes:
+  """Run the extraction and return the response body (UTF-8 JSON) serialized once by pydantic."""
+  structure = await pr.extract_hint_hybrid(file_bytes)
+  return structure.model_dump_json().encode("utf-8")
 
 
 class handler(BaseHTTPRequestHandler):
   def do_POST(self):
-    temp_path = None
     try:
       content_length = int(self.headers.get("Content-Length", "0"))
       body = self.rfile.read(content_length)
-      payload = json.loads(body.decode("utf-8"))
+      payload = json_codec.loads(body)
 
       file_url = payload.get("file_url")
       file_b64 = payload.get("file_base64")
-      filename = payload.get("filename") or "reference.docx"
-      
-      suffix = os.path.splitext(filename)[1] or ".docx"
 
+      # The upload stays in memory; the extractors read bytes directly (no temp file).
       if file_url:
-        import urllib.request
-        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-          temp_path = tmp.name
-        urllib.request.urlretrieve(file_url, temp_path)
+        # Streamed with a size limit and timeouts over a pooled connection, hashed while reading
+        fetched = fetch_file(file_url)
+        file_bytes, file_sha256 = fetched.data, fetched.sha256
       elif file_b64:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-          tmp.write(base64.b64decode(file_b64))
-          temp_path = tmp.name
+        file_bytes = base64.b64decode(file_b64)
+        file_sha256 = hashlib.sha256(file_bytes).hexdigest()
       else:
         raise ValueError("file_url or file_base64 is required")
 
-      result = asyncio.run(run_past_report(temp_path))
+      result_body = asyncio.run(run_past_report(file_bytes))
 
       self.send_response(200)
-      self.send_header("Content-Type", "application/json")
+      self.send_header("Content-Type", "application/json; charset=utf-8")
+      self.send_header("X-Content-SHA256", file_sha256)
       self.end_headers()
-      self.wfile.write(json.dumps(result).encode("utf-8"))
+      self.wfile.write(result_body)
     except Exception as e:
-      self.send_response(500)
+      # 400 bad file_url, 413 over the size limit, 502 the storage request failed
+      self.send_response(e.status if isinstance(e, DownloadError) else 500)
       self.send_header("Content-Type", "application/json")
       self.end_headers()
-      self.wfile.write(json.dumps({"error": str(e)}).encode("utf-8"))
-    finally:
-      if temp_path and os.path.exists(temp_path):
-        os.remove(temp_path)
+      self.wfile.write(json_codec.dumps({"error": str(e)}))
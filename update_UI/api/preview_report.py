@@ -0,0 +1,36 @@
+from http.server import BaseHTTPRequestHandler
+import sys
+import os
+
+# Add the project root to sys.path so we can import from lib
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from lib.docx.preview_html import render_preview_html
+from lib.python import json_codec
+from lib.docx.payload_container import PayloadContainer, is_container
+
+class handler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        content_length = int(self.headers['Content-Length'])
+        post_data = self.rfile.read(content_length)
+        
+        try:
+            # Same request body as /api/generate_docx; only `context` is used.
+            if is_container(post_data):
+                with PayloadContainer.from_bytes(post_data) as container:
+                    html = render_preview_html(container.payload.get("context") or {}, container.attachments, standalone=True)
+            else:
+                payload = json_codec.loads(post_data)
+                html = render_preview_html(payload.get("context") or {}, standalone=True)
+            
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Cache-Control', 'no-store')
+            self.end_headers()
+            self.wfile.write(html.encode("utf-8"))
+            
+        except Exception as e:
+            self.send_response(500)
+            self.send_header('Content-Type', 'application/json')
+            self.end_headers()
+            self.wfile.write(json_codec.dumps({"error": str(e)}))
@@ -0,0 +1,63 @@
+import sys
+import os
+import glob
+import time
+import argparse
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lib", "python"))
+from docx_text import read_docx_text  # noqa: E402
+
+
+def read_with_python_docx(path: str) -> str:
+    """旧実装（past_report_workflow / optimized_workflow）と同じ python-docx による抽出。"""
+    from docx import Document
+
+    doc = Document(path)
+    return "\n".join(p.text for p in doc.paragraphs if p.text.strip())
+
+
+def bench(fn, path: str, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(path)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="DOCX テキスト抽出のベンチマーク（raw XML vs python-docx）")
+    parser.add_argument("paths", nargs="*", help="対象の DOCX（省略時は templates/*.docx）")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    paths = args.paths or sorted(glob.glob(os.path.join(root, "templates", "*.docx")))
+
+    try:
+        import docx  # noqa: F401
+        has_python_docx = True
+    except ImportError:
+        has_python_docx = False
+        print("python-docx is not installed; timing raw XML extraction only", file=sys.stderr)
+
+    print(f"{'file':<40} {'chars':>7} {'raw xml':>10} {'python-docx':>12} {'speedup':>8}")
+    for path in paths:
+        name = os.path.basename(path)
+        if name.startswith("~$"):
+            continue
+        try:
+            chars = len(read_docx_text(path))
+        except Exception as e:
+            print(f"{name:<40} skipped: {e}")
+            continue
+        fast = bench(read_docx_text, path, args.repeat)
+        if has_python_docx:
+            slow = bench(read_with_python_docx, path, args.repeat)
+            print(f"{name:<40} {chars:>7} {fast * 1000:>8.2f}ms {slow * 1000:>10.2f}ms {slow / fast:>7.1f}x")
+        else:
+            print(f"{name:<40} {chars:>7} {fast * 1000:>8.2f}ms {'-':>12} {'-':>8}")
+
+
+if __name__ == "__main__":
+    main()
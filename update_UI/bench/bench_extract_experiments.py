@@ -0,0 +1,86 @@
+import sys
+import os
+import re
+import time
+import tempfile
+import argparse
+from zipfile import ZipFile, ZIP_DEFLATED
+from xml.sax.saxutils import escape
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lib", "python"))
+import extract_experiments_from_docx as ex  # noqa: E402
+
+
+def build_paragraphs(sections: int, subs: int, body_lines: int):
+    paras = ["1.実験目的", "本実験では…", "2.実験結果"]
+    for s in range(1, sections + 1):
+        paras.append(f"2.{s}　反転増幅回路の特性その{s}")
+        for u in range(1, subs + 1):
+            paras.append(f"({s}-{u})　入力電圧と出力電圧の関係")
+            for i in range(body_lines):
+                paras.append(f"測定結果を以下に示す。入力電圧 {i} V のとき出力電圧は {-2 * i} V であった。")
+            paras.append(f"表2.{s}.{u}　入力電圧と出力電圧")
+            paras.append(f"図 2.{s}.{u}　入力電圧-出力電圧特性")
+    paras.append("3.考察")
+    paras.extend(f"考察本文 {i}" for i in range(body_lines * sections))
+    return paras
+
+
+def write_docx(path: str, paras) -> None:
+    body = "".join(
+        f'<w:p><w:r><w:t>{escape(p)}</w:t></w:r></w:p>' for p in paras
+    )
+    xml = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        f'<w:document xmlns:w="{ex.W_NS}"><w:body>{body}</w:body></w:document>'
+    )
+    with ZipFile(path, "w", ZIP_DEFLATED) as z:
+        z.writestr("word/document.xml", xml)
+
+
+def classify_legacy(para: str):
+    """旧実装と同じく、文字列パターンの re.match を最大4回試す。"""
+    if re.match(r"^(\d+\.\d+)", para):
+        return "section"
+    if re.match(r"^[\(\（](\d+-\d+)[\)\）]", para):
+        return "sub"
+    if re.match(r"^(表\s*\d+\.\d+(?:\.\d+)?)(.+)", para):
+        return "table"
+    if re.match(r"^(図\s*\d+\.\d+(?:\.\d+)?)(.+)", para):
+        return "figure"
+    return None
+
+
+def bench(label: str, fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    print(f"{label:<28} {best * 1000:9.2f} ms")
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="extract_experiments_from_docx の段落分類ベンチマーク")
+    parser.add_argument("--sections", type=int, default=40)
+    parser.add_argument("--subs", type=int, default=10)
+    parser.add_argument("--body-lines", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    paras = build_paragraphs(args.sections, args.subs, args.body_lines)
+    print(f"paragraphs: {len(paras)}")
+
+    legacy = bench("classify (legacy 4x match)", lambda: [classify_legacy(p) for p in paras], args.repeat)
+    single = bench("classify (single pass)", lambda: [ex._classify_paragraph(p) for p in paras], args.repeat)
+    print(f"speedup: {legacy / single:.2f}x")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "synthetic.docx")
+        write_docx(path, paras)
+        bench("extract_experiments_from_docx", lambda: ex.extract_experiments_from_docx(path), args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Content rules shared by the DOCX renderer and the HTML preview (preview_html.py), so both show the
+same diagonal cells, unit cells, consideration lines and reference lines.
+"""
+import re
+from typing import List
+
+UNIT_SYMBOLS = frozenset({
+  "m", "kg", "s", "A", "K", "mol", "cd", "Hz", "N", "Pa", "J", "W", "C", "V", "F", "Ω", "S", "Wb", "T", "H",
+  "℃", "Bq", "Gy", "Sv", "rad", "sr", "lm", "lx", "dyn", "erg", "atm", "Torr", "cal", "eV", "Å"
+})
+
+_PARENTHESIZED = re.compile(r'\((.+?)\)')
+
+
+def should_draw_diagonal_cell(value: str, row_index: int, col_index: int) -> bool:
+  """
+  Decide whether to draw a diagonal (top-left to bottom-right) line in the cell.
+  """
+  if row_index == 0 or col_index == 0:
+    return False
+
+  text = (value or "").strip()
+  if not text:
+    return True
+
+  if text in {"-", "ー", "―"}:
+    return True
+
+  return False
+
+
+def is_unit_text(text: str) -> bool:
+  """
+  Check if the text looks like a unit definition.
+  Supports:
+  - Square brackets: Vbe[V]
+  - Parentheses with known units: Length (m)
+  - Standalone known units: m
+  """
+  text = (text or "").strip()
+  if not text:
+    return False
+
+  # Simple heuristic: contains square brackets
+  if "[" in text and "]" in text:
+    return True
+
+  # Exact match
+  if text in UNIT_SYMBOLS:
+    return True
+
+  # Any parenthesized part that is a known unit, e.g. "Length (m)"
+  for part in _PARENTHESIZED.findall(text):
+    if part.strip() in UNIT_SYMBOLS:
+      return True
+
+  return False
+
+
+def clean_text(value) -> str:
+  """Strip leading/trailing whitespace to avoid xml:space=\"preserve\"."""
+  return "" if value is None else str(value).strip()
+
+
+def consideration_unit_parts(units) -> List[str]:
+  """Lines of the consideration section; "\\n" parts separate units."""
+  parts: List[str] = []
+  if not isinstance(units, list):
+    return parts
+
+  for unit in units:
+    if not isinstance(unit, dict):
+      continue
+    idx = clean_text(unit.get("index"))
+    discussion = clean_text(unit.get("discussion_active"))
+    answer = clean_text(unit.get("answer"))
+
+    body = f"（{idx}）{discussion}".strip()
+    if answer:
+      body = f"{body}\n{answer}"
+
+    if body:
+      if parts:
+        parts.append("\n")
+      parts.append(body)
+  return parts
+
+
+def reference_parts(value) -> List[str]:
+  """Lines of the reference list from a consideration dict; "\\n" parts separate entries."""
+  parts: List[str] = []
+  if isinstance(value, dict):
+    refs_formatted = value.get("reference_list_formatted")
+    if isinstance(refs_formatted, list) and len(refs_formatted) > 0:
+      for idx, item in enumerate(refs_formatted):
+          text = clean_text(item)
+          if text:
+              if idx > 0:
+                  parts.append("\n")
+              parts.append(text)
+      return parts
+
+    refs = value.get("references")
+    if isinstance(refs, list) and len(refs) > 0:
+      for ref in refs:
+        if not isinstance(ref, dict):
+          continue
+        _id = clean_text(ref.get("id"))
+        title = clean_text(ref.get("title"))
+        year = clean_text(ref.get("year"))
+        line = f"[{_id}] {title} {year}".strip()
+        if line:
+          if parts:
+              parts.append("\n")
+          parts.append(line)
+      if parts: # If we added at least one line
+        return parts
+
+  parts.append("（参考文献の記載なし）")
+  return parts
@@ -0,0 +1,158 @@
+"""
+DOCX writer with a per-member compression policy.
+
+python-docx deflates every zip member. Figures added through InlineImage are PNG/JPEG, which are
+usually already compressed, so deflating them costs CPU for no size gain. save_docx writes the same
+package as Document.save, but stores media as-is when a quick deflate probe shows no gain, and deflates
+everything else at a configurable level (-1 = zlib default as in Document.save, 0 = none, 1 = fast ... 9 = small).
+"""
+import os
+import posixpath
+import zipfile
+import zlib
+from dataclasses import dataclass
+from typing import IO, Any, Iterable, Optional, Union
+
+from docx.opc.packuri import PACKAGE_URI
+from docx.opc.pkgwriter import PackageWriter, _ContentTypesItem
+
+# Members with these extensions are usually already compressed and may be stored without deflate
+STORED_EXTENSIONS = frozenset({".png", ".jpg", ".jpeg", ".jpe", ".gif", ".webp", ".docx", ".xlsx", ".pptx", ".zip"})
+
+# Template media (thumbnails, small icons) often still deflate well, so such a member is stored only
+# when a fast deflate of its first bytes saves less than this fraction.
+_PROBE_BYTES = 64 * 1024
+_MIN_PROBE_SAVING = 0.1
+
+# zlib's default (level 6), the level Document.save uses; the output matches it byte for byte
+DEFAULT_LEVEL = int(os.getenv("DOCX_DEFLATE_LEVEL", str(zlib.Z_DEFAULT_COMPRESSION)))
+
+# Rough deflate ratios for WordprocessingML parts, used only for estimate_docx_size
+_XML_RATIO_BY_LEVEL = ((1, 0.10), (5, 0.08), (9, 0.07))
+# Local file header + central directory entry, excluding the member name (twice)
+_ZIP_ENTRY_OVERHEAD = 30 + 46
+_ZIP_END_OVERHEAD = 22
+
+
+@dataclass
+class DocxSaveStats:
+  members: int = 0
+  stored: int = 0
+  deflated: int = 0
+  raw_size: int = 0
+  # None unless save_docx was asked for an estimate
+  estimated_size: Optional[int] = None
+  size: int = 0
+
+  def describe(self) -> str:
+    estimated = "" if self.estimated_size is None else f", estimated {self.estimated_size}"
+    return (
+      f"{self.members} members ({self.stored} stored, {self.deflated} deflated), "
+      f"{self.raw_size} bytes raw{estimated}, written {self.size}"
+    )
+
+
+def _is_stored(membername: str, blob: bytes, store_media: bool) -> bool:
+  if not store_media or posixpath.splitext(membername)[1].lower() not in STORED_EXTENSIONS:
+    return False
+  probe = blob[:_PROBE_BYTES]
+  return len(zlib.compress(probe, 1)) > len(probe) * (1 - _MIN_PROBE_SAVING)
+
+
+def _xml_ratio(level: int) -> float:
+  if level < 0:
+    level = 6
+  for max_level, ratio in _XML_RATIO_BY_LEVEL:
+    if level <= max_level:
+      return ratio
+  return _XML_RATIO_BY_LEVEL[-1][1]
+
+
+class _PolicyZipPkgWriter:
+  """Same interface as python-docx's _ZipPkgWriter, choosing STORED / DEFLATED per member and recording stats."""
+
+  def __init__(self, pkg_file: Union[str, IO[bytes]], level: int, store_media: bool, stats: DocxSaveStats):
+    self._zipf = zipfile.ZipFile(pkg_file, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=level)
+    self._level = level
+    self._store_media = store_media
+    self._stats = stats
+
+  def write(self, pack_uri, blob: bytes) -> None:
+    name = pack_uri.membername
+    stats = self._stats
+    stats.members += 1
+    stats.raw_size += len(blob)
+    if _is_stored(name, blob, self._store_media):
+      stats.stored += 1
+      self._zipf.writestr(name, blob, compress_type=zipfile.ZIP_STORED)
+    else:
+      stats.deflated += 1
+      self._zipf.writestr(name, blob, compress_type=zipfile.ZIP_DEFLATED, compresslevel=self._level)
+
+  def close(self) -> None:
+    self._zipf.close()
+
+
+def _package(document: Any):
+  """The OpcPackage of a python-docx Document or a DocxTemplate."""
+  docx_obj = getattr(document, "docx", None) or document
+  return docx_obj.part.package
+
+
+def _members(package) -> Iterable[tuple]:
+  """(membername, blob) of every member Document.save would write, without writing anything."""
+  parts = list(package.parts)
+  yield "[Content_Types].xml", _ContentTypesItem.from_parts(parts).blob
+  yield PACKAGE_URI.rels_uri.membername, package.rels.xml
+  for part in parts:
+    yield part.partname.membername, part.blob
+    if len(part.rels):
+      yield part.partname.rels_uri.membername, part.rels.xml
+
+
+def estimate_docx_size(document: Any, level: int = DEFAULT_LEVEL, store_media: bool = True) -> int:
+  """
+  Estimate the saved size: stored members at full size, XML at a typical deflate ratio.
+  Serialises part XML to measure it, so it costs about as much as building the blobs, not zipping them.
+  """
+  ratio = _xml_ratio(level)
+  total = _ZIP_END_OVERHEAD
+  for name, blob in _members(_package(document)):
+    total += _ZIP_ENTRY_OVERHEAD + 2 * len(name.encode("utf-8"))
+    total += len(blob) if _is_stored(name, blob, store_media) else int(len(blob) * ratio) + 1
+  return total
+
+
+def save_docx(document: Any, pkg_file: Union[str, IO[bytes]], level: int = DEFAULT_LEVEL,
+              store_media: bool = True, estimate: bool = False) -> DocxSaveStats:
+  """
+  Save a python-docx Document (or a rendered DocxTemplate) like Document.save, with the compression policy.
+  Returns size statistics; `estimated_size` is filled only when estimate=True.
+  DocxTemplate media/zip-name replacements need docxtpl's own post-processing, so those fall back to doc.save.
+  """
+  stats = DocxSaveStats()
+  if hasattr(document, "pre_processing"):
+    if document.crc_to_new_media or document.crc_to_new_embedded or document.zipname_to_replace:
+      document.save(pkg_file)
+      return stats
+    document.pre_processing()
+
+  package = _package(document)
+  if estimate:
+    stats.estimated_size = estimate_docx_size(document, level, store_media)
+
+  for part in package.parts:
+    part.before_marshal()
+  writer = _PolicyZipPkgWriter(pkg_file, level, store_media, stats)
+  PackageWriter._write_content_types_stream(writer, package.parts)
+  PackageWriter._write_pkg_rels(writer, package.rels)
+  PackageWriter._write_parts(writer, package.parts)
+  writer.close()
+
+  if hasattr(document, "is_saved"):
+    document.is_saved = True
+  if hasattr(pkg_file, "tell"):
+    stats.size = pkg_file.tell()
+  elif isinstance(pkg_file, str):
+    stats.size = os.path.getsize(pkg_file)
+  return stats
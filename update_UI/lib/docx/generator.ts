@@ -64,7 +64,8 @@ const sanitizeDeep = (input: unknown): unknown => {
   return input
 }
 
-type SerializableFigureImage = Omit<DocTemplateFigureImage, "buffer"> & { buffer: string }
+// Figures reference raw image frames of the payload container by id instead of carrying base64 buffers.
+type SerializableFigureImage = Omit<DocTemplateFigureImage, "buffer"> & { ref: string }
 type SerializableFigure = Omit<DocTemplateFigure, "figure_image"> & { figure_image?: SerializableFigureImage }
 type SerializableExperiment = Omit<DocTemplateExperiment, "figures"> & { figures: SerializableFigure[] }
 type SerializableDocTemplateData = Omit<DocTemplateData, "experiments"> & {
@@ -129,21 +130,30 @@ const applyFigureImages = (
   }
 }
 
-const toBase64Figures = (data: DocTemplateData): SerializableDocTemplateData => {
+type SerializedPayload = {
+  context: SerializableDocTemplateData
+  attachments: Map<string, Buffer>
+}
+
+const toContainerFigures = (data: DocTemplateData): SerializedPayload => {
+  const attachments = new Map<string, Buffer>()
   const experiments = data.experiments.map<SerializableExperiment>((experiment) => {
     const figures = experiment.figures.map<SerializableFigure>((figure) => {
-      if (!figure.figure_image) {
+      const buffer = figure.figure_image?.buffer
+      if (!figure.figure_image || !(buffer instanceof Buffer) || buffer.length === 0) {
         return {
           ...figure,
           figure_image: undefined,
         }
       }
-      const buffer = figure.figure_image.buffer
+      const { buffer: _buffer, ...image } = figure.figure_image
+      const ref = `figure-${attachments.size + 1}`
+      attachments.set(ref, buffer)
       return {
         ...figure,
         figure_image: {
-          ...figure.figure_image,
-          buffer: buffer instanceof Buffer ? buffer.toString("base64") : "",
+          ...image,
+          ref,
         },
       }
     })
@@ -154,12 +164,38 @@ const toBase64Figures = (data: DocTemplateData): SerializableDocTemplateData =>
   })
 
   return {
-    ...data,
-    experiments,
+    context: {
+      ...data,
+      experiments,
+    },
+    attachments,
+  }
+}
+
+// Binary payload container (see lib/docx/payload_container.py):
+// MAGIC, then frames of [name length u16 BE][name][data length u64 BE][data]; the first frame is payload.json.
+const CONTAINER_MAGIC = Buffer.from("RPAYLD\x00\x01", "latin1")
+const CONTAINER_CONTENT_TYPE = "application/x-report-payload"
+
+const encodePayloadContainer = (payload: unknown, attachments: Map<string, Buffer>): Buffer => {
+  const frames: Array<[string, Buffer]> = [["payload.json", Buffer.from(JSON.stringify(payload), "utf-8")]]
+  for (const [name, data] of attachments) {
+    frames.push([name, data])
+  }
+
+  const chunks: Buffer[] = [CONTAINER_MAGIC]
+  for (const [name, data] of frames) {
+    const nameBytes = Buffer.from(name, "utf-8")
+    const header = Buffer.alloc(2 + nameBytes.length + 8)
+    header.writeUInt16BE(nameBytes.length, 0)
+    nameBytes.copy(header, 2)
+    header.writeBigUInt64BE(BigInt(data.length), 2 + nameBytes.length)
+    chunks.push(header, data)
   }
+  return Buffer.concat(chunks)
 }
 
-const runPythonRenderer = async (context: SerializableDocTemplateData): Promise<Buffer> => {
+const runPythonRenderer = async ({ context, attachments }: SerializedPayload): Promise<Buffer> => {
   // [DEBUG] Save the context to a file in the project root for inspection
   try {
     await writeFile(path.join(process.cwd(), "debug_template_data.json"), JSON.stringify(context, null, 2), "utf-8")
@@ -188,7 +224,7 @@ const runPythonRenderer = async (context: SerializableDocTemplateData): Promise<
 
     console.log(`Sending request to ${apiUrl}`)
 
-    const headers: Record<string, string> = { "Content-Type": "application/json" }
+    const headers: Record<string, string> = { "Content-Type": CONTAINER_CONTENT_TYPE }
     if (PROTECTION_BYPASS_TOKEN) {
       headers["x-vercel-protection-bypass"] = PROTECTION_BYPASS_TOKEN
     }
@@ -196,7 +232,7 @@ const runPythonRenderer = async (context: SerializableDocTemplateData): Promise<
     const response = await fetch(apiUrl, {
       method: "POST",
       headers,
-      body: JSON.stringify(payload),
+      body: encodePayloadContainer(payload, attachments),
     })
 
     if (!response.ok) {
@@ -216,7 +252,9 @@ const runPythonRenderer = async (context: SerializableDocTemplateData): Promise<
     context,
   }
 
-  await writeFile(path.join(workdir, "payload.json"), JSON.stringify(payload), "utf-8")
+  // The renderer memory-maps this file; figure images stay raw bytes instead of base64 strings.
+  const payloadPath = path.join(workdir, "payload.rpk")
+  await writeFile(payloadPath, encodePayloadContainer(payload, attachments))
 
   // [DEBUG] Log the payload sent to Python
   console.log("--- [DEBUG] PYTHON PAYLOAD START ---")
@@ -224,12 +262,10 @@ const runPythonRenderer = async (context: SerializableDocTemplateData): Promise<
   console.log("--- [DEBUG] PYTHON PAYLOAD END ---")
 
   await new Promise<void>((resolve, reject) => {
-    const child = spawn(PYTHON_BIN, [PY_RENDERER_PATH], {
+    const child = spawn(PYTHON_BIN, [PY_RENDERER_PATH, payloadPath], {
       cwd: process.cwd(),
-      stdio: ["pipe", "inherit", "inherit"],
+      stdio: ["ignore", "inherit", "inherit"],
     })
-    child.stdin.write(JSON.stringify(payload))
-    child.stdin.end()
 
     child.on("error", reject)
     child.on("exit", (code) => {
@@ -283,7 +319,7 @@ export async function generateReport({ difyOutput, figureImages }: GenerateRepor
     const data = buildDocTemplateData(sanitized)
     const dataWithBlocks = buildBlocks(data)
     const dataWithImages = applyFigureImages(dataWithBlocks, figureImages)
-    const serialized = toBase64Figures(dataWithImages)
+    const serialized = toContainerFigures(dataWithImages)
 
     const buffer = await runPythonRenderer(serialized)
     return buffer
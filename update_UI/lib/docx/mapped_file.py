@@ -0,0 +1,122 @@
+"""
+Read-only, memory-mapped access to templates and image files on local disk.
+
+Render workers open the same templates (and often the same figure files) over and over. Mapping
+them with mmap lets every worker process read the pages straight from the OS page cache instead
+of keeping a private copy, and a persistent worker keeps the mapping between renders.
+
+Each caller gets its own MappedReader (independent file position) over the shared mapping, so
+concurrent renders in one process do not interfere.
+
+Files smaller than DOCX_MMAP_MIN_MB (1 MB by default, which covers every template in templates/)
+are read into memory once instead of being mapped. A mapped file must not be rewritten in place
+while it is in use: truncating it under a live mapping makes the next read fault (SIGBUS) and
+kills the process. Replace large templates and images atomically (write a new file, then
+os.replace it over the old path); the cached mapping keeps the old inode and the next lookup maps
+the new file.
+"""
+import io
+import mmap
+import os
+import threading
+from typing import Dict, Tuple, Union
+
+# Smaller files are copied into memory rather than mapped
+MMAP_MIN_SIZE = int(float(os.getenv("DOCX_MMAP_MIN_MB", "1")) * 1024 * 1024)
+
+_lock = threading.Lock()
+# path -> ((mtime_ns, size), mapping or bytes); a changed file gets a fresh mapping
+_maps: Dict[str, Tuple[Tuple[int, int], Union[mmap.mmap, bytes]]] = {}
+
+
+class MappedReader(io.RawIOBase):
+  """A seekable, read-only file object over a buffer (mmap, memoryview or bytes) without copying it."""
+
+  def __init__(self, buffer: Union[mmap.mmap, memoryview, bytes]):
+    super().__init__()
+    self._buffer = buffer
+    self._size = len(buffer)
+    self._pos = 0
+
+  def readable(self) -> bool:
+    return True
+
+  def seekable(self) -> bool:
+    return True
+
+  def readinto(self, b) -> int:
+    if self._pos >= self._size:
+      return 0
+    n = min(len(b), self._size - self._pos)
+    b[:n] = self._buffer[self._pos:self._pos + n]
+    self._pos += n
+    return n
+
+  def read(self, size: int = -1) -> bytes:
+    # Slice directly instead of RawIOBase's readinto loop: one copy of exactly the bytes asked for.
+    if self._pos >= self._size:
+      return b""
+    end = self._size if size is None or size < 0 else min(self._size, self._pos + size)
+    data = bytes(self._buffer[self._pos:end])
+    self._pos = end
+    return data
+
+  def readall(self) -> bytes:
+    return self.read()
+
+  def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+    if whence == io.SEEK_SET:
+      pos = offset
+    elif whence == io.SEEK_CUR:
+      pos = self._pos + offset
+    elif whence == io.SEEK_END:
+      pos = self._size + offset
+    else:
+      raise ValueError(f"invalid whence ({whence})")
+    if pos < 0:
+      raise ValueError(f"negative seek position {pos}")
+    self._pos = pos
+    return pos
+
+  def tell(self) -> int:
+    return self._pos
+
+  def close(self) -> None:
+    # The mapping itself is shared and stays cached; only this reader is closed.
+    self._buffer = b""
+    super().close()
+
+
+def _map(path: str) -> Union[mmap.mmap, bytes]:
+  st = os.stat(path)
+  stamp = (st.st_mtime_ns, st.st_size)
+  with _lock:
+    cached = _maps.get(path)
+    if cached is not None and cached[0] == stamp:
+      return cached[1]
+    if st.st_size == 0:
+      # mmap cannot map empty files
+      _maps.pop(path, None)
+      return b""
+    with open(path, "rb") as f:
+      if st.st_size < MMAP_MIN_SIZE:
+        mapping = f.read()
+      else:
+        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    # A replaced mapping is not closed explicitly: readers may still use it; it is unmapped once unreferenced.
+    _maps[path] = (stamp, mapping)
+    return mapping
+
+
+def open_mapped(path: Union[str, os.PathLike]) -> MappedReader:
+  """
+  Open a local file as a MappedReader backed by a cached read-only mmap (or an in-memory copy for
+  small files). Large files must be replaced atomically, not rewritten in place (see module docstring).
+  """
+  return MappedReader(_map(os.path.realpath(os.fspath(path))))
+
+
+def clear_cache() -> None:
+  """Forget all cached mappings (they are unmapped once no reader refers to them)."""
+  with _lock:
+    _maps.clear()
@@ -0,0 +1,139 @@
+"""
+Binary container for render payloads.
+
+Instead of embedding figures as base64 strings in JSON, the payload can be sent as a sequence of
+length-prefixed frames:
+
+  MAGIC (8 bytes)
+  frame*:  name length (uint16, big-endian) | name (UTF-8) | data length (uint64, big-endian) | data
+
+The first frame is named "payload.json" and holds the usual payload (template_path, output_path,
+context, ...). Every other frame is a raw attachment; a figure refers to one by id with
+`"figure_image": {"ref": "<id>"}` instead of `{"buffer": "<base64>"}`.
+
+Opened from a file the container is memory-mapped, and attachments are memoryview slices of the
+mapping, so image bytes are neither base64-decoded nor copied into Python objects up front.
+"""
+import mmap
+import struct
+import sys
+import os
+from typing import IO, Any, Dict, Mapping, Optional, Union
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "python"))
+import json_codec  # noqa: E402
+
+MAGIC = b"RPAYLD\x00\x01"
+PAYLOAD_FRAME = "payload.json"
+CONTENT_TYPE = "application/x-report-payload"
+
+_NAME_LEN = struct.Struct(">H")
+_DATA_LEN = struct.Struct(">Q")
+
+
+def is_container(head: Union[bytes, memoryview]) -> bool:
+  """True if the buffer starts with the container magic."""
+  return bytes(head[:len(MAGIC)]) == MAGIC
+
+
+def write_container(fp: IO[bytes], payload: Mapping[str, Any], attachments: Mapping[str, bytes]) -> None:
+  """Write payload + raw attachments as a container to a binary file object."""
+  fp.write(MAGIC)
+  frames = [(PAYLOAD_FRAME, json_codec.dumps(payload))]
+  frames.extend(attachments.items())
+  for name, data in frames:
+    encoded = name.encode("utf-8")
+    fp.write(_NAME_LEN.pack(len(encoded)))
+    fp.write(encoded)
+    fp.write(_DATA_LEN.pack(len(data)))
+    fp.write(data)
+
+
+class PayloadContainer:
+  """
+  A parsed container. `payload` is the decoded payload.json frame and `attachments` maps
+  attachment ids to memoryview slices of the underlying buffer.
+  Use as a context manager (or call close()) when opened from a file so the mapping is released.
+  """
+
+  def __init__(self, buffer: Union[bytes, mmap.mmap], owner: Optional[Any] = None):
+    self._owner = owner
+    self._mmap = buffer if isinstance(buffer, mmap.mmap) else None
+    self._view = memoryview(buffer)
+    self.payload: Dict[str, Any] = {}
+    self.attachments: Dict[str, memoryview] = {}
+    try:
+      self._parse()
+    except Exception:
+      self._release_views()
+      raise
+
+  @classmethod
+  def open(cls, path: str) -> "PayloadContainer":
+    """Memory-map a container file."""
+    f = open(path, "rb")
+    try:
+      mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except Exception:
+      f.close()
+      raise
+    try:
+      return cls(mapped, owner=f)
+    except Exception:
+      mapped.close()
+      f.close()
+      raise
+
+  @classmethod
+  def from_bytes(cls, data: bytes) -> "PayloadContainer":
+    """Parse a container already held in memory (e.g. an HTTP request body or stdin)."""
+    return cls(data)
+
+  def _parse(self) -> None:
+    view = self._view
+    if not is_container(view):
+      raise ValueError("Not a report payload container (bad magic)")
+    pos = len(MAGIC)
+    end = len(view)
+    while pos < end:
+      if pos + _NAME_LEN.size > end:
+        raise ValueError("Truncated container frame header")
+      (name_len,) = _NAME_LEN.unpack_from(view, pos)
+      pos += _NAME_LEN.size
+      name = bytes(view[pos:pos + name_len]).decode("utf-8")
+      pos += name_len
+      if pos + _DATA_LEN.size > end:
+        raise ValueError(f"Truncated container frame: {name}")
+      (data_len,) = _DATA_LEN.unpack_from(view, pos)
+      pos += _DATA_LEN.size
+      if pos + data_len > end:
+        raise ValueError(f"Truncated container frame: {name}")
+      data = view[pos:pos + data_len]
+      pos += data_len
+      if name == PAYLOAD_FRAME:
+        self.payload = json_codec.loads(data)
+        data.release()
+      else:
+        self.attachments[name] = data
+    if not isinstance(self.payload, dict) or not self.payload:
+      raise ValueError("Container has no payload.json frame")
+
+  def _release_views(self) -> None:
+    # Slices must be released before the mmap can be closed.
+    for data in self.attachments.values():
+      data.release()
+    self.attachments = {}
+    self._view.release()
+
+  def close(self) -> None:
+    self._release_views()
+    if self._mmap is not None:
+      self._mmap.close()
+    if self._owner is not None:
+      self._owner.close()
+
+  def __enter__(self) -> "PayloadContainer":
+    return self
+
+  def __exit__(self, *exc: Any) -> None:
+    self.close()
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Low-fidelity HTML preview of a report context.
+
+Follows the chapter_fixed template layout (results, consideration, summary, references) without
+docxtpl: no OOXML, no zip and no full-size images. Tables use the same diagonal-cell and unit rules
+as the DOCX (content_rules.py), and figures are downscaled once to THUMBNAIL_PX and reused
+from an in-process cache, so a warm preview of a typical report renders in a few milliseconds.
+"""
+import base64
+import hashlib
+import os
+import sys
+import threading
+from collections import OrderedDict
+from html import escape
+from io import BytesIO
+from typing import Any, List, Optional
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "python"))
+from render_context import ALLOW_LOCAL_IMAGES_FLAG, RenderContext, Figure, FigureImage, Table  # noqa: E402
+from content_rules import (  # noqa: E402
+  consideration_unit_parts, is_unit_text, reference_parts, should_draw_diagonal_cell,
+)
+import json_codec  # noqa: E402
+
+try:
+  from PIL import Image
+except ImportError:  # pragma: no cover
+  Image = None
+
+# Longest side of a preview thumbnail, in pixels
+THUMBNAIL_PX = int(os.getenv("DOCX_PREVIEW_THUMBNAIL_PX", "320"))
+THUMBNAIL_CACHE_SIZE = 256
+
+# Leading bytes -> MIME type of the image formats browsers display in <img>
+_IMAGE_SIGNATURES = (
+  (b"\x89PNG\r\n\x1a\n", "image/png"),
+  (b"\xff\xd8\xff", "image/jpeg"),
+  (b"GIF87a", "image/gif"),
+  (b"GIF89a", "image/gif"),
+  (b"BM", "image/bmp"),
+)
+
+_thumb_lock = threading.Lock()
+# (sha1 of the image bytes, size) -> data URI ("" when the data is not a displayable image)
+_thumbnails: "OrderedDict[tuple, str]" = OrderedDict()
+
+PREVIEW_CSS = """
+.rp-report{font-family:serif;line-height:1.6}
+.rp-report table{border-collapse:collapse;margin:4px auto}
+.rp-report td{border:1px solid #000;padding:2px 8px;text-align:center;vertical-align:middle}
+.rp-report td.rp-diag{background:linear-gradient(to top right,transparent calc(50% - .5px),#000 50%,transparent calc(50% + .5px))}
+.rp-report .rp-unit{font-family:'Cambria Math',serif;font-style:italic}
+.rp-report .rp-caption{text-align:center}
+.rp-report figure{margin:4px 0;text-align:center}
+.rp-report figure img{max-width:100%}
+.rp-report .rp-missing{color:#999}
+""".strip()
+
+
+def _text(value: Any) -> str:
+  return "" if value is None else escape(str(value))
+
+
+def _lines(parts: List[str]) -> str:
+  """Join rule parts ("\\n" parts are separators) into HTML with <br>."""
+  return "".join(escape(part) for part in parts).replace("\n", "<br>")
+
+
+def _caption(label: Any, caption: Any) -> str:
+  return f'<p class="rp-caption">{_text(label)}　{_text(caption)}</p>'
+
+
+def table_html(rows) -> str:
+  """An HTML table with the same shape, diagonal cells and unit cells as the DOCX table."""
+  if not isinstance(rows, list) or not rows:
+    return ""
+  max_cols = max((len(row) for row in rows if isinstance(row, list)), default=0)
+  if max_cols == 0:
+    return ""
+
+  out = ["<table>"]
+  for r_index, row in enumerate(rows):
+    if not isinstance(row, list):
+      row = [""]
+    out.append("<tr>")
+    for c_index in range(max_cols):
+      value = ""
+      if c_index < len(row) and row[c_index] is not None:
+        value = str(row[c_index])
+      cls = ' class="rp-diag"' if should_draw_diagonal_cell(value, r_index, c_index) else ""
+      body = escape(value)
+      if is_unit_text(value):
+        body = f'<span class="rp-unit">{body}</span>'
+      out.append(f"<td{cls}>{body}</td>")
+    out.append("</tr>")
+  out.append("</table>")
+  return "".join(out)
+
+
+def _image_mime(data: bytes) -> Optional[str]:
+  if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+    return "image/webp"
+  for signature, mime in _IMAGE_SIGNATURES:
+    if data.startswith(signature):
+      return mime
+  return None
+
+
+def _thumbnail(data: bytes, size: int) -> str:
+  if Image is not None:
+    try:
+      with Image.open(BytesIO(data)) as img:
+        # JPEG can decode at a reduced scale directly
+        img.draft("RGB", (size, size))
+        img.thumbnail((size, size))
+        if img.mode not in ("RGB", "RGBA", "L", "LA", "P"):
+          img = img.convert("RGBA")
+        out = BytesIO()
+        img.save(out, format="PNG", compress_level=1)
+      return "data:image/png;base64," + base64.b64encode(out.getvalue()).decode("ascii")
+    except Exception as exc:
+      print(f"[WARN] Failed to create preview thumbnail: {exc}", file=sys.stderr)
+  # Let the browser scale the original; data it cannot display gets the missing-figure placeholder
+  mime = _image_mime(data)
+  if mime is None:
+    return ""
+  return f"data:{mime};base64," + base64.b64encode(data).decode("ascii")
+
+
+def thumbnail_uri(image: FigureImage, context: RenderContext, size: int = THUMBNAIL_PX) -> Optional[str]:
+  """A data URI of the downscaled figure, or None when the figure carries no usable data."""
+  stream = context.open_image(image)
+  if stream is None:
+    return None
+  data = stream.read()
+  if not data:
+    return None
+  key = (hashlib.sha1(data).hexdigest(), size)
+  with _thumb_lock:
+    uri = _thumbnails.get(key)
+    if uri is not None:
+      _thumbnails.move_to_end(key)
+      return uri or None
+  uri = _thumbnail(data, size)
+  with _thumb_lock:
+    _thumbnails[key] = uri
+    while len(_thumbnails) > THUMBNAIL_CACHE_SIZE:
+      _thumbnails.popitem(last=False)
+  return uri or None
+
+
+def _image_html(image: Any, context: RenderContext) -> str:
+  uri = thumbnail_uri(image, context) if isinstance(image, FigureImage) and image.has_data else None
+  if uri is None:
+    return '<p class="rp-missing">（図なし）</p>'
+  return f'<img src="{uri}" alt="">'
+
+
+def _figure_html(fig: Any, context: RenderContext) -> str:
+  if not isinstance(fig, Figure):
+    return ""
+  return f"<figure>{_image_html(fig.get('figure_image'), context)}{_caption(fig.get('label'), fig.get('caption'))}</figure>"
+
+
+def _table_block_html(table: Any) -> str:
+  if not isinstance(table, Table):
+    return ""
+  return _caption(table.get("label"), table.get("caption")) + table_html(table.get("rows"))
+
+
+def _experiment_html(exp, chapter: str, context: RenderContext) -> str:
+  subidx = exp.get("subidx")
+  number = f"{chapter}.{_text(exp.get('idx'))}" + (f".{_text(subidx)}" if subidx else "")
+  out = [f"<h3>{number} {_text(exp.get('name'))}</h3>", f"<p>{_text(exp.get('description_brief'))}</p>"]
+
+  # Same block resolution as the DOCX passes (inject_inline_images / inject_tables)
+  context.diagnostics.extend(exp.resolve_blocks("figure"))
+  context.diagnostics.extend(exp.resolve_blocks("table", fallback_on_miss=False))
+  for block in exp.blocks:
+    b_type = getattr(block, "type", None)
+    if b_type == "table":
+      out.append(_table_block_html(getattr(block, "table", None)))
+    elif b_type == "figure":
+      out.append(_figure_html(getattr(block, "figure", None), context))
+
+  quant_comment = exp.get("quant_comment")
+  if quant_comment:
+    out.append(f"<p>{_text(quant_comment)}</p>")
+  return "".join(out)
+
+
+def _sections_html(context: RenderContext) -> str:
+  out = []
+  for section in context.sections:
+    for subsection in section.subsections:
+      for block in subsection.content_blocks:
+        content = block.content
+        if block.type == "table":
+          rows = content.get("rows") if isinstance(content, dict) else content
+          out.append(table_html(rows))
+        elif block.type == "figure":
+          image_data = content.get("figure_image") if isinstance(content, dict) else None
+          out.append(f"<figure>{_image_html(FigureImage.build(image_data) if image_data else None, context)}</figure>")
+        elif content is not None:
+          out.append(f"<p>{_text(content)}</p>")
+  return "".join(out)
+
+
+def render_preview_html(context: Any, attachments=None, allow_local_images: bool = False, standalone: bool = False) -> str:
+  """
+  Render the payload's `context` (dict, pydantic model or RenderContext) as an HTML fragment.
+  `standalone` wraps the fragment in a full HTML page with the preview stylesheet.
+  """
+  model = RenderContext.build(context, attachments)
+  model.allow_local_images = allow_local_images
+  extra = model.extra
+  chapter = _text(extra.get("chapter"))
+
+  out = ['<div class="rp-report">', f"<h2>{chapter}. 実験結果</h2>"]
+  for exp in model.experiments:
+    out.append(_experiment_html(exp, chapter, model))
+  if model.sections:
+    out.append(_sections_html(model))
+  out.append(f"<h2>{_text(extra.get('chapter_plus_1'))}. 考察</h2>")
+  out.append(f"<p>{_lines(consideration_unit_parts(model.consideration.get('units')))}</p>")
+  out.append(f"<h2>{_text(extra.get('chapter_plus_2'))}. まとめ</h2>")
+  out.append(f"<p>{_text(extra.get('summary'))}</p>")
+  out.append("<p>・参考文献</p>")
+  out.append(f"<p>{_lines(reference_parts(model.consideration))}</p>")
+  out.append("</div>")
+
+  for message in model.diagnostics:
+    print(f"[WARN] {message}", file=sys.stderr)
+
+  fragment = "".join(out)
+  if not standalone:
+    return fragment
+  return f'<!DOCTYPE html><html><head><meta charset="utf-8"><style>{PREVIEW_CSS}</style></head><body>{fragment}</body></html>'
+
+
+def main() -> int:
+  # Same stdin payload and --allow-local-images flag as render_with_docxtpl.py; writes a standalone HTML page to stdout.
+  payload = json_codec.load(sys.stdin)
+  allow_local_images = ALLOW_LOCAL_IMAGES_FLAG in sys.argv[1:]
+  html = render_preview_html(payload.get("context") or {}, allow_local_images=allow_local_images, standalone=True)
+  sys.stdout.write(html)
+  return 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
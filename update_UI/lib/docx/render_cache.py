@@ -0,0 +1,201 @@
+"""
+Whole-document output cache for render_report.
+
+Download / regenerate often re-renders an unchanged report. The rendered DOCX bytes are cached under
+a key built from the renderer version, the template digest, the canonical (sorted-key) context and
+any raw attachments, so an identical request returns the stored bytes without rendering.
+
+Two tiers, both evicted least-recently-used by total size:
+  - memory: per process (API workers), DOCX_RENDER_CACHE_MB (default 64)
+  - disk:   opt-in, shared between processes (CLI renders), DOCX_RENDER_CACHE_DIR,
+            DOCX_RENDER_CACHE_DISK_MB (default 256). Off unless DOCX_RENDER_CACHE_DIR is set; the
+            directory holds rendered reports, so it is created with mode 0700 and refused when
+            another user owns it.
+Set DOCX_RENDER_CACHE=0 to disable caching entirely.
+"""
+import hashlib
+import os
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any, Iterable, Mapping, Optional, Tuple
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "python"))
+import json_codec  # noqa: E402
+from private_dir import ensure_private_dir  # noqa: E402
+
+ENABLED = os.getenv("DOCX_RENDER_CACHE", "1") != "0"
+MEMORY_LIMIT = int(float(os.getenv("DOCX_RENDER_CACHE_MB", "64")) * 1024 * 1024)
+DISK_DIR = os.getenv("DOCX_RENDER_CACHE_DIR", "")
+DISK_LIMIT = int(float(os.getenv("DOCX_RENDER_CACHE_DISK_MB", "256")) * 1024 * 1024)
+
+_SUFFIX = ".docx"
+
+_digest_lock = threading.Lock()
+# realpath -> ((mtime_ns, size), sha256) so unchanged template files are hashed once per process
+_file_digests: dict = {}
+
+
+def file_digest(path: str) -> str:
+  """SHA-256 of a file, memoised on (mtime, size)."""
+  real = os.path.realpath(path)
+  st = os.stat(real)
+  stamp = (st.st_mtime_ns, st.st_size)
+  with _digest_lock:
+    cached = _file_digests.get(real)
+    if cached is not None and cached[0] == stamp:
+      return cached[1]
+  h = hashlib.sha256()
+  with open(real, "rb") as f:
+    for chunk in iter(lambda: f.read(1024 * 1024), b""):
+      h.update(chunk)
+  digest = h.hexdigest()
+  with _digest_lock:
+    _file_digests[real] = (stamp, digest)
+  return digest
+
+
+def make_key(renderer_version: str, template_digest: str, context: Any,
+             attachments: Optional[Mapping[str, Any]] = None, extra: Iterable[Tuple[str, Any]] = ()) -> str:
+  """
+  Cache key for one render. `extra` carries anything else that changes the output
+  (save options, stamps of local image files, ...).
+  """
+  h = hashlib.sha256()
+  h.update(f"renderer={renderer_version}\0template={template_digest}\0".encode("utf-8"))
+  h.update(json_codec.dumps(context, sort_keys=True))
+  for name in sorted(attachments or {}):
+    data = attachments[name]
+    h.update(f"\0attachment={name}:{len(data)}\0".encode("utf-8"))
+    h.update(data)
+  h.update(b"\0")
+  h.update(json_codec.dumps(dict(extra), sort_keys=True))
+  return h.hexdigest()
+
+
+class RenderCache:
+  def __init__(self, memory_limit: int = MEMORY_LIMIT, disk_dir: Optional[str] = DISK_DIR,
+               disk_limit: int = DISK_LIMIT):
+    self.memory_limit = memory_limit
+    self.disk_dir = disk_dir or None
+    self.disk_limit = disk_limit
+    self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+    self._memory_size = 0
+    self._lock = threading.Lock()
+    if self.disk_dir:
+      try:
+        ensure_private_dir(self.disk_dir)
+      except OSError as exc:
+        print(f"[WARN] Render cache disk tier disabled: {exc}", file=sys.stderr)
+        self.disk_dir = None
+
+  def get(self, key: str) -> Optional[bytes]:
+    with self._lock:
+      data = self._memory.get(key)
+      if data is not None:
+        self._memory.move_to_end(key)
+        return data
+    data = self._disk_get(key)
+    if data is not None:
+      self._memory_put(key, data)
+    return data
+
+  def put(self, key: str, data: bytes) -> None:
+    self._memory_put(key, data)
+    self._disk_put(key, data)
+
+  def clear(self) -> None:
+    with self._lock:
+      self._memory.clear()
+      self._memory_size = 0
+    if self.disk_dir:
+      for name in os.listdir(self.disk_dir):
+        if name.endswith(_SUFFIX):
+          try:
+            os.remove(os.path.join(self.disk_dir, name))
+          except OSError:
+            pass
+
+  def _memory_put(self, key: str, data: bytes) -> None:
+    if len(data) > self.memory_limit:
+      return
+    with self._lock:
+      old = self._memory.pop(key, None)
+      if old is not None:
+        self._memory_size -= len(old)
+      self._memory[key] = data
+      self._memory_size += len(data)
+      while self._memory_size > self.memory_limit:
+        _, evicted = self._memory.popitem(last=False)
+        self._memory_size -= len(evicted)
+
+  def _path(self, key: str) -> str:
+    return os.path.join(self.disk_dir, key + _SUFFIX)
+
+  def _disk_get(self, key: str) -> Optional[bytes]:
+    if not self.disk_dir:
+      return None
+    path = self._path(key)
+    try:
+      with open(path, "rb") as f:
+        data = f.read()
+      # mtime is the LRU clock of the disk tier
+      os.utime(path, None)
+      return data
+    except OSError:
+      return None
+
+  def _disk_put(self, key: str, data: bytes) -> None:
+    if not self.disk_dir or len(data) > self.disk_limit:
+      return
+    path = self._path(key)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+      with open(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), "wb") as f:
+        f.write(data)
+      os.replace(tmp_path, path)
+    except OSError as exc:
+      print(f"[WARN] Failed to write render cache entry: {exc}", file=sys.stderr)
+      try:
+        os.remove(tmp_path)
+      except OSError:
+        pass
+      return
+    self._disk_evict()
+
+  def _disk_evict(self) -> None:
+    entries = []
+    total = 0
+    for entry in os.scandir(self.disk_dir):
+      if not entry.name.endswith(_SUFFIX):
+        continue
+      try:
+        st = entry.stat()
+      except OSError:
+        continue
+      entries.append((st.st_mtime_ns, st.st_size, entry.path))
+      total += st.st_size
+    if total <= self.disk_limit:
+      return
+    entries.sort()
+    for _, size, path in entries:
+      if total <= self.disk_limit:
+        break
+      try:
+        os.remove(path)
+        total -= size
+      except OSError:
+        pass
+
+
+_default_cache: Optional[RenderCache] = None
+
+
+def get_render_cache() -> Optional[RenderCache]:
+  """The process-wide cache, or None when DOCX_RENDER_CACHE=0."""
+  global _default_cache
+  if not ENABLED:
+    return None
+  if _default_cache is None:
+    _default_cache = RenderCache()
+  return _default_cache
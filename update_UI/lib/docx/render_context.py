@@ -0,0 +1,387 @@
+"""
+Typed, slotted render context for render_with_docxtpl.
+
+The JSON payload (or the pydantic models in lib/python/schemas.py) is converted once into these
+objects. The injection passes then attach InlineImage / table subdocuments to the model instead of
+rewriting the caller's dicts, and docxtpl renders the model directly (Jinja resolves `exp.blocks`,
+`block.table.body`, ... via attribute access).
+
+Fields whose key is absent from the payload are left unset rather than set to None, so Jinja treats
+them as undefined and renders nothing, as it did for the plain payload dicts (an explicit null still
+renders as "None"). Python code reads such fields with `node.get(name)`.
+"""
+import base64
+import sys
+from io import BytesIO
+from pathlib import Path
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+from mapped_file import MappedReader, open_mapped
+
+
+def _fields(obj: Any) -> Mapping[str, Any]:
+  """Return a read-only field mapping for a dict or a pydantic model (no JSON round trip)."""
+  if isinstance(obj, Mapping):
+    return obj
+  model_fields = getattr(type(obj), "model_fields", None)
+  if model_fields is not None:
+    values = {name: getattr(obj, name) for name in model_fields}
+    values.update(getattr(obj, "model_extra", None) or {})
+    return values
+  return {}
+
+
+def _is_record(value: Any) -> bool:
+  return isinstance(value, Mapping) or hasattr(type(value), "model_fields")
+
+
+def _plain(value: Any) -> Any:
+  """Convert pydantic models in pass-through values into plain dicts; payload values are returned as-is."""
+  if hasattr(value, "model_dump"):
+    return value.model_dump()
+  if isinstance(value, list) and any(hasattr(v, "model_dump") for v in value):
+    return [_plain(v) for v in value]
+  return value
+
+
+# CLI flag of render_with_docxtpl.py / preview_html.py that sets RenderContext.allow_local_images
+ALLOW_LOCAL_IMAGES_FLAG = "--allow-local-images"
+
+# Default for node fields whose key is absent from the payload (the slot is left unset)
+_UNSET: Any = object()
+
+
+def _list(value: Any) -> List[Any]:
+  return value if isinstance(value, list) else []
+
+
+class _Node:
+  """Base for slotted nodes. Unknown payload keys stay reachable as attributes via `extra`."""
+  __slots__ = ("extra",)
+  _known: Tuple[str, ...] = ()
+
+  def __getattr__(self, name: str) -> Any:
+    # Only called when normal slot lookup fails.
+    if name == "extra":
+      raise AttributeError(name)
+    try:
+      return self.extra[name]
+    except KeyError:
+      raise AttributeError(name) from None
+
+  def __getitem__(self, name: str) -> Any:
+    try:
+      return getattr(self, name)
+    except AttributeError:
+      raise KeyError(name) from None
+
+  def get(self, name: str, default: Any = None) -> Any:
+    return getattr(self, name, default)
+
+  def _assign(self, **values: Any) -> None:
+    for name, value in values.items():
+      if value is not _UNSET:
+        setattr(self, name, value)
+
+  @classmethod
+  def _extra_from(cls, data: Mapping[str, Any]) -> Dict[str, Any]:
+    return {k: _plain(v) for k, v in data.items() if k not in cls._known}
+
+
+class FigureImage(_Node):
+  # buffer: base64 image data; ref: id of a raw attachment in a binary payload container;
+  # path: image file on the renderer's local disk (CLI / batch workers only)
+  __slots__ = ("buffer", "width", "height", "ref", "path")
+  _known = __slots__
+
+  def __init__(self, buffer: Any = None, width: Any = None, height: Any = None, extra: Optional[Dict[str, Any]] = None,
+               ref: Any = None, path: Any = None):
+    self.buffer = buffer
+    self.width = width
+    self.height = height
+    self.ref = ref
+    self.path = path
+    self.extra = extra or {}
+
+  @classmethod
+  def build(cls, data: Any) -> Any:
+    """Dict-like image payloads become FigureImage; anything else (None, already-built objects) is kept."""
+    if not _is_record(data):
+      return data
+    f = _fields(data)
+    return cls(f.get("buffer"), f.get("width"), f.get("height"), cls._extra_from(f), ref=f.get("ref"), path=f.get("path"))
+
+  @property
+  def has_data(self) -> bool:
+    return bool(self.buffer) or self.ref is not None or bool(self.path)
+
+
+class Figure(_Node):
+  __slots__ = ("label", "caption", "figure_image")
+  _known = __slots__
+
+  def __init__(self, label: Any = _UNSET, caption: Any = _UNSET, figure_image: Any = _UNSET,
+               extra: Optional[Dict[str, Any]] = None):
+    self._assign(label=label, caption=caption, figure_image=figure_image)
+    self.extra = extra or {}
+
+  @classmethod
+  def build(cls, data: Any) -> "Figure":
+    f = _fields(data)
+    return cls(f.get("label", _UNSET), f.get("caption", _UNSET), FigureImage.build(f.get("figure_image", _UNSET)),
+               cls._extra_from(f))
+
+
+class Table(_Node):
+  __slots__ = ("label", "caption", "rows", "body")
+  _known = __slots__
+
+  def __init__(self, label: Any = _UNSET, caption: Any = _UNSET, rows: Any = _UNSET, body: Any = _UNSET,
+               extra: Optional[Dict[str, Any]] = None):
+    self._assign(label=label, caption=caption, rows=rows, body=body)
+    self.extra = extra or {}
+
+  @classmethod
+  def build(cls, data: Any) -> "Table":
+    f = _fields(data)
+    return cls(f.get("label", _UNSET), f.get("caption", _UNSET), _plain(f.get("rows", _UNSET)), f.get("body", _UNSET),
+               cls._extra_from(f))
+
+
+class Block(_Node):
+  """An entry of exp.blocks: {"type": "table", "table": {...}} or {"type": "figure", "figure": {...}}."""
+  __slots__ = ("type", "table", "figure", "ref")
+  _known = ("type", "table", "figure")
+
+  def __init__(self, type: Any = _UNSET, ref: Any = None, extra: Optional[Dict[str, Any]] = None):
+    self._assign(type=type)
+    # The label/caption reference as given in the payload; resolved against exp.tables / exp.figures later.
+    # `table` / `figure` are only set for blocks of that type.
+    self.ref = ref
+    self.extra = extra or {}
+
+  @classmethod
+  def build(cls, data: Any) -> "Block":
+    f = _fields(data)
+    b_type = f.get("type", _UNSET)
+    ref = f.get(b_type, _UNSET) if b_type in ("table", "figure") else _UNSET
+    block = cls(b_type, None if ref is _UNSET else ref, cls._extra_from(f))
+    if ref is not _UNSET:
+      node_type = Table if b_type == "table" else Figure
+      setattr(block, b_type, node_type.build(ref) if _is_record(ref) else ref)
+    return block
+
+
+class Experiment(_Node):
+  __slots__ = ("idx", "subidx", "name", "description_brief", "tables", "figures", "blocks",
+               "table_index", "figure_index", "table_duplicates", "figure_duplicates")
+  _known = ("idx", "subidx", "name", "description_brief", "tables", "figures", "blocks")
+
+  def __init__(self, idx: Any = _UNSET, subidx: Any = _UNSET, name: Any = _UNSET, description_brief: Any = _UNSET,
+               tables: Optional[List[Any]] = None, figures: Optional[List[Any]] = None,
+               blocks: Optional[List[Any]] = None, extra: Optional[Dict[str, Any]] = None):
+    self._assign(idx=idx, subidx=subidx, name=name, description_brief=description_brief)
+    self.tables = tables or []
+    self.figures = figures or []
+    self.blocks = blocks or []
+    self.extra = extra or {}
+    # (label, caption) -> position of the first matching item, built once per experiment.
+    # Keys that occur more than once are kept in *_duplicates for diagnostics.
+    self.table_index, self.table_duplicates = self._index(self.tables)
+    self.figure_index, self.figure_duplicates = self._index(self.figures)
+
+  @staticmethod
+  def _index(items: List[Any]) -> Tuple[Dict[Tuple[Any, Any], int], List[Tuple[Any, Any]]]:
+    index: Dict[Tuple[Any, Any], int] = {}
+    duplicates: List[Tuple[Any, Any]] = []
+    for pos, item in enumerate(items):
+      if not isinstance(item, (Table, Figure)):
+        continue
+      key = (item.get("label"), item.get("caption"))
+      if key in index:
+        if key != (None, None) and key not in duplicates:
+          duplicates.append(key)
+      else:
+        index[key] = pos
+    return index, duplicates
+
+  @classmethod
+  def build(cls, data: Any) -> "Experiment":
+    f = _fields(data)
+    tables = [Table.build(t) if _is_record(t) else t for t in _list(f.get("tables"))]
+    figures = [Figure.build(fig) if _is_record(fig) else fig for fig in _list(f.get("figures"))]
+    blocks = [Block.build(b) if _is_record(b) else b for b in _list(f.get("blocks"))]
+    return cls(f.get("idx", _UNSET), f.get("subidx", _UNSET), f.get("name", _UNSET), f.get("description_brief", _UNSET),
+               tables, figures, blocks, cls._extra_from(f))
+
+  def resolve_blocks(self, kind: str, fallback_on_miss: bool = True) -> List[str]:
+    """
+    Point every `kind` ("table" / "figure") block at the matching item of exp.tables / exp.figures.
+
+    A block is matched through the (label, caption) index; otherwise it takes the next item after
+    the last one used (ordered cursor), as the payloads often omit or repeat labels. With
+    fallback_on_miss=False a block whose reference names an unknown label keeps its own data and
+    only blocks without a reference use the cursor. Returns human-readable diagnostics for
+    duplicate keys and references that could not be resolved by label.
+    """
+    if kind == "figure":
+      items, index, duplicates, node_type = self.figures, self.figure_index, self.figure_duplicates, Figure
+    else:
+      items, index, duplicates, node_type = self.tables, self.table_index, self.table_duplicates, Table
+
+    idx, subidx = self.get("idx"), self.get("subidx")
+    where = f"experiment {idx}" if subidx is None else f"experiment {idx}-{subidx}"
+    diagnostics = [
+      f"{where}: duplicate {kind} label/caption {key!r}; blocks resolve to the first one"
+      for key in duplicates
+    ]
+
+    cursor = 0
+    for block in self.blocks:
+      if getattr(block, "type", None) != kind:
+        continue
+      ref = getattr(block, kind, None)
+      has_ref = isinstance(ref, node_type)
+      key = (ref.get("label"), ref.get("caption")) if has_ref else (None, None)
+      pos = index.get(key, -1) if items else -1
+      if pos >= 0:
+        setattr(block, kind, items[pos])
+        cursor = max(cursor, pos + 1)
+        continue
+
+      named = key != (None, None)
+      if (fallback_on_miss or not has_ref) and cursor < len(items):
+        setattr(block, kind, items[cursor])
+        if named:
+          diagnostics.append(f"{where}: {kind} reference {key!r} not found; using {kind} #{cursor + 1} by order")
+        cursor += 1
+      else:
+        if named:
+          diagnostics.append(f"{where}: {kind} reference {key!r} not found")
+        if ref is None and kind == "figure":
+          setattr(block, kind, Figure())
+    return diagnostics
+
+
+class ContentBlock(_Node):
+  """An entry of sections[].subsections[].content_blocks (past-report layout)."""
+  __slots__ = ("type", "content")
+  _known = __slots__
+
+  def __init__(self, type: Any = None, content: Any = None, extra: Optional[Dict[str, Any]] = None):
+    self.type = type
+    self.content = content
+    self.extra = extra or {}
+
+  @classmethod
+  def build(cls, data: Any) -> "ContentBlock":
+    f = _fields(data)
+    return cls(f.get("type"), _plain(f.get("content")), cls._extra_from(f))
+
+
+class Subsection(_Node):
+  __slots__ = ("content_blocks",)
+  _known = __slots__
+
+  def __init__(self, content_blocks: Optional[List[Any]] = None, extra: Optional[Dict[str, Any]] = None):
+    self.content_blocks = content_blocks or []
+    self.extra = extra or {}
+
+  @classmethod
+  def build(cls, data: Any) -> "Subsection":
+    f = _fields(data)
+    blocks = [ContentBlock.build(b) for b in _list(f.get("content_blocks")) if _is_record(b)]
+    return cls(blocks, cls._extra_from(f))
+
+
+class Section(_Node):
+  __slots__ = ("subsections",)
+  _known = __slots__
+
+  def __init__(self, subsections: Optional[List[Any]] = None, extra: Optional[Dict[str, Any]] = None):
+    self.subsections = subsections or []
+    self.extra = extra or {}
+
+  @classmethod
+  def build(cls, data: Any) -> "Section":
+    f = _fields(data)
+    subsections = [Subsection.build(s) for s in _list(f.get("subsections")) if _is_record(s)]
+    return cls(subsections, cls._extra_from(f))
+
+
+class RenderContext:
+  """
+  Root of the render model. `experiments` and `sections` are typed nodes; every other top-level
+  key (chapter, summary, consideration, ...) is passed through untouched in `extra`.
+  """
+  __slots__ = ("experiments", "sections", "extra", "diagnostics", "attachments", "allow_local_images")
+
+  def __init__(self, experiments: Optional[List[Any]] = None, sections: Optional[List[Any]] = None,
+               extra: Optional[Dict[str, Any]] = None, attachments: Optional[Mapping[str, Any]] = None):
+    self.experiments = experiments or []
+    self.sections = sections or []
+    self.extra = extra or {}
+    # Raw image bytes by id (payload_container attachments) for FigureImage.ref
+    self.attachments: Mapping[str, Any] = attachments or {}
+    # Whether figure_image.path may be read from the local disk (off for HTTP payloads)
+    self.allow_local_images = False
+    # Messages about block references that could not be resolved cleanly (see Experiment.resolve_blocks)
+    self.diagnostics: List[str] = []
+
+  @classmethod
+  def build(cls, data: Any, attachments: Optional[Mapping[str, Any]] = None) -> "RenderContext":
+    """
+    Build from the payload's `context` dict or a pydantic model such as schemas.ResultJson.
+    `attachments` are the raw images of a binary payload container, referenced by figure_image.ref.
+    """
+    if isinstance(data, RenderContext):
+      if attachments:
+        data.attachments = attachments
+      return data
+    f = _fields(data)
+    experiments = [Experiment.build(e) for e in _list(f.get("experiments")) if _is_record(e)]
+    sections = [Section.build(s) for s in _list(f.get("sections")) if _is_record(s)]
+    extra = {k: _plain(v) for k, v in f.items() if k not in ("experiments", "sections")}
+    return cls(experiments, sections, extra, attachments)
+
+  def open_image(self, image: FigureImage):
+    """
+    Return a readable stream for a figure payload, or None when it carries no usable data.
+    Container attachments and local files are read through zero-copy readers (the file is mmap-ed);
+    otherwise the base64 buffer is decoded.
+    """
+    if image.ref is not None:
+      data = self.attachments.get(image.ref)
+      if data is None:
+        print(f"[WARN] Figure image attachment not found: {image.ref}", file=sys.stderr)
+        return None
+      return MappedReader(data)
+    if image.path:
+      if not self.allow_local_images:
+        print(f"[WARN] Local figure image paths are not allowed here: {image.path}", file=sys.stderr)
+        return None
+      try:
+        return open_mapped(Path(image.path).expanduser())
+      except OSError as exc:
+        print(f"[WARN] Failed to open figure image {image.path}: {exc}", file=sys.stderr)
+        return None
+    if not image.buffer:
+      return None
+    try:
+      return BytesIO(base64.b64decode(image.buffer))
+    except Exception:
+      return None
+
+  @property
+  def consideration(self) -> Dict[str, Any]:
+    value = self.extra.get("consideration")
+    return value if isinstance(value, dict) else {}
+
+  def to_template_context(self, **overrides: Any) -> Dict[str, Any]:
+    """The dict handed to DocxTemplate.render (a fresh top-level dict; nested payload values are shared)."""
+    ctx = dict(self.extra)
+    ctx["experiments"] = self.experiments
+    if self.sections:
+      ctx["sections"] = self.sections
+    ctx.update(overrides)
+    return ctx
@@ -1,22 +1,45 @@
 #!/usr/bin/env python3
 import base64
-import json
+import hashlib
+import os
 import sys
 from io import BytesIO
 from pathlib import Path
-from typing import Any, Optional
+from typing import Any, List, Optional, Tuple
 
 from docxtpl import DocxTemplate, InlineImage, RichText
-from jinja2 import Environment
+# The escape function RichText.add applies to run text (html.escape in current docxtpl releases)
+from docxtpl.richtext import escape as rich_text_escape
+from jinja2 import Environment, FileSystemBytecodeCache
 from docx.shared import Mm
 from docx.oxml import OxmlElement
 from docx.oxml.ns import qn
 from docx.table import _Cell, Table  # type: ignore
+from docx.oxml.table import CT_Tbl
+from lxml import etree
 from docx.enum.table import WD_ALIGN_VERTICAL
 from docx.text.paragraph import Paragraph
 
 import re
 import traceback
+from collections import OrderedDict
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "python"))
+from render_context import ALLOW_LOCAL_IMAGES_FLAG, RenderContext, Figure, FigureImage, Table as TableNode  # noqa: E402
+import json_codec  # noqa: E402
+from payload_container import PayloadContainer, is_container  # noqa: E402
+from mapped_file import open_mapped  # noqa: E402
+from template_cache import CachedDocxTemplate, PreprocessedXmlLoader  # noqa: E402
+from docx_writer import DEFAULT_LEVEL, save_docx  # noqa: E402
+from content_rules import (  # noqa: E402
+  clean_text, consideration_unit_parts, is_unit_text, reference_parts, should_draw_diagonal_cell,
+)
+from render_cache import file_digest, get_render_cache, make_key  # noqa: E402
+from private_dir import ensure_private_dir  # noqa: E402
+
+# Bump whenever a change to this module alters the rendered output; it is part of the render cache key.
+RENDERER_VERSION = "2026.10.1"
 
 TARGET_WIDTH_MM = 106.29
 TARGET_HEIGHT_MM = 60.57
@@ -58,91 +81,88 @@ def px_to_mm(px: float, dpi: float = 96.0) -> float:
   return float(px) / dpi * 25.4
 
 
-def inject_inline_images(doc: DocxTemplate, context: dict) -> dict:
-  """
-  Replace figure_image entries that carry base64 data with InlineImage instances.
-  Mutates figures in-place and returns the resulting context.
-  """
-  experiments = context.get("experiments") or []
-  for exp in experiments:
-    figures = exp.get("figures") or []
-    figure_cursor = 0
-    for fig in figures:
-      image = fig.get("figure_image")
-      if not isinstance(image, dict):
-        continue
+def _inline_image_from(doc: DocxTemplate, image: FigureImage, context: RenderContext) -> Optional[InlineImage]:
+  """Build an InlineImage from a figure payload, or None when it carries no usable data."""
+  stream = context.open_image(image)
+  if stream is None:
+    return None
 
-      b64 = image.get("buffer")
-      if not b64:
-        fig["figure_image"] = None
-        continue
+  # Force images to unified target size. If explicit pixel sizes exist, they are ignored to keep consistency.
+  width_mm = TARGET_WIDTH_MM
+  height_mm = TARGET_HEIGHT_MM
+  return InlineImage(
+    doc,
+    stream,
+    width=Mm(width_mm) if width_mm else None,
+    height=Mm(height_mm) if height_mm else None,
+  )
 
-      try:
-        raw = base64.b64decode(b64)
-      except Exception:
-        fig["figure_image"] = None
-        continue
 
-      width = image.get("width")
-      height = image.get("height")
-      # Force images to unified target size. If explicit pixel sizes exist, they are ignored to keep consistency.
-      width_mm = TARGET_WIDTH_MM
-      height_mm = TARGET_HEIGHT_MM
+def _report_block_diagnostics(context: RenderContext, messages) -> None:
+  for message in messages:
+    print(f"[WARN] {message}", file=sys.stderr)
+  context.diagnostics.extend(messages)
+
 
-      fig["figure_image"] = InlineImage(
-        doc,
-        BytesIO(raw),
-        width=Mm(width_mm) if width_mm else None,
-        height=Mm(height_mm) if height_mm else None,
-      )
+def inject_inline_images(doc: DocxTemplate, context) -> RenderContext:
+  """
+  Replace figure_image entries that carry base64 data with InlineImage instances.
+  Works on the RenderContext model (a plain dict is converted first); the caller's payload is not modified.
+  """
+  context = RenderContext.build(context)
+  for exp in context.experiments:
+    for fig in exp.figures:
+      if isinstance(fig, Figure) and isinstance(fig.get("figure_image"), FigureImage):
+        fig.figure_image = _inline_image_from(doc, fig.figure_image, context)
 
     # Keep blocks in sync when they reference figures.
-    blocks = exp.get("blocks") or []
-    for block in blocks:
-      if isinstance(block, dict) and block.get("type") == "figure":
-        block["figure"] = block.get("figure") or {}
-        assigned = False
-        matched_index = -1
-        # find matching figure by label/caption if present
-        if figures:
-          for idx, fig in enumerate(figures):
-            if (
-              isinstance(fig, dict)
-              and fig.get("label") == block["figure"].get("label")
-              and fig.get("caption") == block["figure"].get("caption")
-            ):
-              block["figure"] = fig
-              assigned = True
-              matched_index = idx
-              break
-        if matched_index >= 0:
-          figure_cursor = max(figure_cursor, matched_index + 1)
-        # fallback: assign by order when labels are absent/duplicated
-        if not assigned and figure_cursor < len(figures):
-          block["figure"] = figures[figure_cursor]
-          figure_cursor += 1
+    _report_block_diagnostics(context, exp.resolve_blocks("figure"))
   return context
 
 
 from docx.enum.text import WD_ALIGN_PARAGRAPH
 
-def build_table_subdoc(doc: DocxTemplate, rows) -> Optional[Any]:
+# Build tables directly in the main document instead of one docxtpl Subdoc (a full python-docx
+# Document loaded from the default template) per table. Set DOCX_INLINE_TABLES=0 to use subdocs.
+INLINE_TABLES = os.getenv("DOCX_INLINE_TABLES", "1") != "0"
+
+_NS_DECL = re.compile(r' xmlns:[A-Za-z0-9_]+="[^"]*"')
+_TAG = re.compile(r"<[^>]+>")
+
+
+class InlineTable:
   """
-  Build a subdocument containing a simple grid table from a 2D rows array.
-  Each cell is cast to string and empty strings are used for missing cells.
+  A table element rendered in place of a Subdoc. It has the same str/html interface, and its XML
+  carries no namespace declarations (the main document root declares them), like Subdoc._get_xml().
   """
-  if not isinstance(rows, list) or len(rows) == 0:
-    return None
+  __slots__ = ("element",)
+
+  def __init__(self, element):
+    self.element = element
+
+  def _get_xml(self) -> str:
+    xml = etree.tostring(self.element, encoding="unicode")
+    return _TAG.sub(lambda m: _NS_DECL.sub("", m.group(0)), xml)
+
+  def __str__(self) -> str:
+    return self._get_xml()
 
+  def __html__(self) -> str:
+    return self._get_xml()
+
+
+def _table_shape(rows) -> int:
+  """Column count of a 2D rows array, or 0 when there is nothing to render."""
+  if not isinstance(rows, list) or len(rows) == 0:
+    return 0
   max_cols = 0
   for row in rows:
     if isinstance(row, list) and len(row) > max_cols:
       max_cols = len(row)
-  if max_cols == 0:
-    return None
+  return max_cols
 
-  sub = doc.new_subdoc()
-  table = sub.add_table(rows=len(rows), cols=max_cols)
+
+def _fill_table(table, rows, max_cols: int) -> None:
   table.style = "Table Grid"
   _apply_table_borders(table)
 
@@ -163,67 +183,79 @@ def build_table_subdoc(doc: DocxTemplate, rows) -> Optional[Any]:
         paragraph.paragraph_format.keep_with_next = True
         
         # Convert units to OMML if detected
-        if _is_unit_text(value):
+        if is_unit_text(value):
           _convert_paragraph_to_omml(paragraph, value)
       
       # 数値が入らないセルは左上から右下への斜線セルとして表現する
-      if _should_draw_diagonal_cell(value, r_index, c_index):
+      if should_draw_diagonal_cell(value, r_index, c_index):
         _apply_diagonal_cell_border(cell)
     
     _prevent_row_breaking(table.rows[r_index])
+
+
+def build_table_subdoc(doc: DocxTemplate, rows) -> Optional[Any]:
+  """
+  Build a subdocument containing a simple grid table from a 2D rows array.
+  Each cell is cast to string and empty strings are used for missing cells.
+  """
+  max_cols = _table_shape(rows)
+  if max_cols == 0:
+    return None
+
+  sub = doc.new_subdoc()
+  table = sub.add_table(rows=len(rows), cols=max_cols)
+  _fill_table(table, rows, max_cols)
   return sub
 
 
-def inject_tables(doc: DocxTemplate, context: dict) -> dict:
+def build_table_inline(doc: DocxTemplate, rows) -> Optional[InlineTable]:
+  """
+  Same table as build_table_subdoc, built as a detached w:tbl against the main document
+  (its styles and text width), so no per-table Document is created.
+  """
+  max_cols = _table_shape(rows)
+  if max_cols == 0:
+    return None
+
+  main = doc.get_docx()
+  tbl = CT_Tbl.new_tbl(len(rows), max_cols, main._block_width)
+  # Parented to the main body only for style lookup; the element itself is not inserted.
+  table = Table(tbl, main._body)
+  _fill_table(table, rows, max_cols)
+  return InlineTable(tbl)
+
+
+def build_table(doc: DocxTemplate, rows) -> Optional[Any]:
+  return build_table_inline(doc, rows) if INLINE_TABLES else build_table_subdoc(doc, rows)
+
+
+def inject_tables(doc: DocxTemplate, context) -> RenderContext:
   """
   Replace table rows arrays with subdocuments so docxtpl can render them.
   """
-  experiments = context.get("experiments") or []
-  for exp in experiments:
-    tables = exp.get("tables") or []
-    table_cursor = 0
-    for table in tables:
-      rows = table.get("rows")
-      subdoc = build_table_subdoc(doc, rows)
+  context = RenderContext.build(context)
+  for exp in context.experiments:
+    for table in exp.tables:
+      if not isinstance(table, TableNode):
+        continue
+      subdoc = build_table(doc, table.get("rows"))
       if subdoc:
-        table["body"] = subdoc
-    # Keep blocks in sync when they reference tables.
-    blocks = exp.get("blocks") or []
-    for block in blocks:
-      if isinstance(block, dict) and block.get("type") == "table":
-        ref = block.get("table")
-        matched_index = -1
-        if ref and isinstance(ref, dict) and tables:
-          for idx, tbl in enumerate(tables):
-            if (
-              isinstance(tbl, dict)
-              and tbl.get("label") == ref.get("label")
-              and tbl.get("caption") == ref.get("caption")
-            ):
-              block["table"] = tbl
-              ref = tbl
-              matched_index = idx
-              break
-        if matched_index >= 0:
-          table_cursor = max(table_cursor, matched_index + 1)
-        if (not ref or not isinstance(ref, dict)) and table_cursor < len(tables):
-          block["table"] = tables[table_cursor]
-          table_cursor += 1
+        table.body = subdoc
+    # Keep blocks in sync when they reference tables. A table reference with an unknown label keeps its own data.
+    _report_block_diagnostics(context, exp.resolve_blocks("table", fallback_on_miss=False))
   return context
 
-def inject_blocks(doc: DocxTemplate, context: dict) -> dict:
+def inject_blocks(doc: DocxTemplate, context) -> RenderContext:
   """
   Process 'sections' -> 'subsections' -> 'content_blocks' structure.
   Convert table blocks to subdocs and figure blocks to InlineImage.
   """
-  sections = context.get("sections") or []
-  for section in sections:
-    subsections = section.get("subsections") or []
-    for subsection in subsections:
-      blocks = subsection.get("content_blocks") or []
-      for block in blocks:
-        b_type = block.get("type")
-        content = block.get("content")
+  context = RenderContext.build(context)
+  for section in context.sections:
+    for subsection in section.subsections:
+      for block in subsection.content_blocks:
+        b_type = block.type
+        content = block.content
         
         if b_type == "table":
           # content is expected to be a dict with 'rows' or just rows
@@ -233,103 +265,93 @@ def inject_blocks(doc: DocxTemplate, context: dict) -> dict:
           elif isinstance(content, list):
              rows = content
           
-          subdoc = build_table_subdoc(doc, rows)
+          subdoc = build_table(doc, rows)
           if subdoc:
-            block["content"] = subdoc
+            block.content = subdoc
             
         elif b_type == "figure":
           # content is expected to be a dict with 'figure_image'
           # figure_image has 'buffer' (base64)
           image_data = content.get("figure_image") if isinstance(content, dict) else None
-          if image_data:
-             b64 = image_data.get("buffer")
-             if b64:
-               try:
-                 raw = base64.b64decode(b64)
-                 width = image_data.get("width")
-                 height = image_data.get("height")
-                 width_mm = TARGET_WIDTH_MM
-                 height_mm = TARGET_HEIGHT_MM
-                 
-                 block["content"] = InlineImage(
-                    doc,
-                    BytesIO(raw),
-                    width=Mm(width_mm) if width_mm else None,
-                    height=Mm(height_mm) if height_mm else None,
-                 )
-               except Exception as e:
-                 print(f"[WARN] Failed to process figure image: {e}", file=sys.stderr)
-                 block["content"] = ""
+          image = FigureImage.build(image_data) if image_data else None
+          if isinstance(image, FigureImage) and image.has_data:
+             inline = _inline_image_from(doc, image, context)
+             if inline is None:
+               print("[WARN] Failed to process figure image: no usable image data", file=sys.stderr)
+               block.content = ""
+             else:
+               block.content = inline
           else:
              # If no image data, maybe just caption?
              pass
 
   return context
 
-def _clean_text(value) -> str:
-  """Strip leading/trailing whitespace to avoid xml:space=\"preserve\"."""
-  return "" if value is None else str(value).strip()
+# Run XML exactly as RichText.add(text) emits it for unstyled text (text passed through rich_text_escape)
+_RUN_XML = '<w:r><w:t xml:space="preserve">%s</w:t></w:r>'
 
-def create_consideration_units_rt(units) -> RichText:
+# Built RichText XML keyed by the (frozen, hashable) input; regenerations with unchanged
+# consideration units / references skip rebuilding and escaping every line.
+RICH_TEXT_CACHE_SIZE = 128
+_rich_text_cache: "OrderedDict[Tuple[str, Any], str]" = OrderedDict()
+
+
+def _freeze(value) -> Any:
+  """
+  Hashable, equality-preserving copy of a JSON-like value. Cheaper than serializing and digesting it:
+  str hashes are cached by Python and the dict lookup confirms hits by comparing the values.
+  """
+  if isinstance(value, str):
+    return value
+  if isinstance(value, dict):
+    return ("d",) + tuple((k, _freeze(v)) for k, v in value.items())
+  if isinstance(value, list):
+    return ("l",) + tuple(_freeze(v) for v in value)
+  # Keep the type so 1, 1.0 and True (equal in Python, different once rendered) do not share an entry
+  return (type(value).__name__, value)
+
+
+def _rich_text_from_parts(parts) -> RichText:
+  """Build a RichText with one unstyled run per part (same XML as rt.add per part), with a single join."""
   rt = RichText()
-  if not isinstance(units, list):
-    return rt
-  
-  first = True
-  for unit in units:
-    if not isinstance(unit, dict):
-      continue
-    idx = _clean_text(unit.get("index"))
-    discussion = _clean_text(unit.get("discussion_active"))
-    answer = _clean_text(unit.get("answer"))
-    
-    body = f"（{idx}）{discussion}".strip()
-    if answer:
-      body = f"{body}\n{answer}"
-    
-    if body:
-      if not first:
-        rt.add("\n")
-      rt.add(body)
-      first = False
+  rt.xml = "".join(_RUN_XML % rich_text_escape(part) for part in parts)
   return rt
 
-def create_reference_lines_rt(value) -> RichText:
+
+def _cached_rich_text(kind: str, value, build_parts) -> RichText:
+  """Return a fresh RichText for `value`, reusing the XML built for an identical earlier value."""
+  try:
+    key = (kind, _freeze(value))
+    hash(key)
+  except TypeError:
+    return _rich_text_from_parts(build_parts(value))
+  xml = _rich_text_cache.get(key)
+  if xml is None:
+    xml = _rich_text_from_parts(build_parts(value)).xml
+    _rich_text_cache[key] = xml
+    if len(_rich_text_cache) > RICH_TEXT_CACHE_SIZE:
+      _rich_text_cache.popitem(last=False)
+  else:
+    _rich_text_cache.move_to_end(key)
   rt = RichText()
-  if isinstance(value, dict):
-    refs_formatted = value.get("reference_list_formatted")
-    if isinstance(refs_formatted, list) and len(refs_formatted) > 0:
-      for idx, item in enumerate(refs_formatted):
-          text = _clean_text(item)
-          if text:
-              if idx > 0:
-                  rt.add("\n")
-              rt.add(text)
-      return rt
-      
-    refs = value.get("references")
-    if isinstance(refs, list) and len(refs) > 0:
-      first = True
-      for ref in refs:
-        if not isinstance(ref, dict):
-          continue
-        _id = _clean_text(ref.get("id"))
-        title = _clean_text(ref.get("title"))
-        year = _clean_text(ref.get("year"))
-        line = f"[{_id}] {title} {year}".strip()
-        if line:
-          if not first:
-              rt.add("\n")
-          rt.add(line)
-          first = False
-      if not first: # If we added at least one line
-        return rt
-        
-  rt.add("（参考文献の記載なし）")
+  rt.xml = xml
   return rt
 
-def build_jinja_env() -> Environment:
-  env = Environment(autoescape=False)
+
+def create_consideration_units_rt(units) -> RichText:
+  return _cached_rich_text("consideration_units", units, consideration_unit_parts)
+
+
+def create_reference_lines_rt(value) -> RichText:
+  # Only the keys that feed the output are hashed, not the whole consideration dict.
+  if isinstance(value, dict):
+    key_value = {k: value.get(k) for k in ("reference_list_formatted", "references")}
+  else:
+    key_value = None
+  return _cached_rich_text("references", key_value, reference_parts)
+
+def build_jinja_env(loader=None, bytecode_cache=None) -> Environment:
+  env = Environment(autoescape=False, loader=loader, bytecode_cache=bytecode_cache)
 
   def nl2br(value):
     rt = RichText()
@@ -337,7 +359,7 @@ def build_jinja_env() -> Environment:
       return rt
     parts = str(value).split("\n")
     for idx, part in enumerate(parts):
-      rt.add(_clean_text(part))
+      rt.add(clean_text(part))
       if idx != len(parts) - 1:
         rt.add("\n")
     return rt
@@ -349,21 +371,30 @@ def build_jinja_env() -> Environment:
   return env
 
 
-def _should_draw_diagonal_cell(value: str, row_index: int, col_index: int) -> bool:
-  """
-  Decide whether to draw a diagonal (top-left to bottom-right) line in the cell.
-  """
-  if row_index == 0 or col_index == 0:
-    return False
+# Jinja bytecode for compiled template XML is shared between processes. By default it goes to Jinja's
+# own per-user directory (mode 0700, owner checked); DOCX_JINJA_CACHE_DIR selects another directory,
+# which must be private to this user, and an empty string disables the cache.
+JINJA_CACHE_DIR = os.getenv("DOCX_JINJA_CACHE_DIR")
+_shared_env: Optional[Environment] = None
 
-  text = (value or "").strip()
-  if not text:
-    return True
 
-  if text in {"-", "ー", "―"}:
-    return True
-
-  return False
+def get_jinja_env() -> Environment:
+  """The process-wide environment used by render_report (filters registered once, templates cached)."""
+  global _shared_env
+  if _shared_env is None:
+    bytecode_cache = None
+    if JINJA_CACHE_DIR is None:
+      try:
+        bytecode_cache = FileSystemBytecodeCache()
+      except (OSError, RuntimeError) as exc:
+        print(f"[WARN] Jinja bytecode cache disabled: {exc}", file=sys.stderr)
+    elif JINJA_CACHE_DIR:
+      try:
+        bytecode_cache = FileSystemBytecodeCache(ensure_private_dir(JINJA_CACHE_DIR))
+      except OSError as exc:
+        print(f"[WARN] Jinja bytecode cache disabled: {exc}", file=sys.stderr)
+    _shared_env = build_jinja_env(loader=PreprocessedXmlLoader(), bytecode_cache=bytecode_cache)
+  return _shared_env
 
 
 def _apply_table_borders(table) -> None:
@@ -434,50 +465,6 @@ def _prevent_row_breaking(row) -> None:
     tr_pr.append(cant_split)
 
 
-def _is_unit_text(text: str) -> bool:
-  """
-  Check if the text looks like a unit definition.
-  Supports:
-  - Square brackets: Vbe[V]
-  - Parentheses with known units: Length (m)
-  - Standalone known units: m
-  """
-  text = (text or "").strip()
-  if not text:
-    return False
-
-  # Simple heuristic: contains square brackets
-  if "[" in text and "]" in text:
-    return True
-
-  # Extended unit list
-  UNIT_SYMBOLS = {
-      "m", "kg", "s", "A", "K", "mol", "cd", "Hz", "N", "Pa", "J", "W", "C", "V", "F", "Ω", "S", "Wb", "T", "H",
-      "℃", "Bq", "Gy", "Sv", "rad", "sr", "lm", "lx", "dyn", "erg", "atm", "Torr", "cal", "eV", "Å"
-  }
-
-  # Exact match
-  if text in UNIT_SYMBOLS:
-    return True
-
-  # Check for (Unit)
-  # We look for content inside the last set of parentheses
-  match = re.search(r'\((.+?)\)', text)
-  if match:
-      # Check if any of the captured groups match a unit
-      # Actually re.search returns the first match.
-      # Let's iterate all matches or just check if *any* parenthesized part is a unit.
-      # But usually unit is at the end.
-      
-      # Let's check all parenthesized contents
-      parts = re.findall(r'\((.+?)\)', text)
-      for part in parts:
-          if part.strip() in UNIT_SYMBOLS:
-              return True
-
-  return False
-
-
 def _convert_paragraph_to_omml(paragraph, text: str) -> None:
   """
   Replace paragraph content with OMML math.
@@ -557,48 +544,159 @@ def patch_template(doc: DocxTemplate, context: dict) -> None:
         patch_paragraphs(cell.paragraphs)
 
 
-def render_report(payload: dict) -> bytes:
+def _local_image_stamps(model: RenderContext) -> List[Tuple[str, int, int]]:
+  """(path, mtime_ns, size) of every local figure file, so an edited image invalidates the cached render."""
+  stamps = []
+  for exp in model.experiments:
+    figures = list(exp.figures) + [
+      block.figure for block in exp.blocks if isinstance(getattr(block, "figure", None), Figure)
+    ]
+    for fig in figures:
+      image = getattr(fig, "figure_image", None)
+      path = getattr(image, "path", None) if isinstance(image, FigureImage) else None
+      if not path:
+        continue
+      try:
+        st = os.stat(path)
+        stamps.append((str(path), st.st_mtime_ns, st.st_size))
+      except OSError:
+        stamps.append((str(path), -1, -1))
+  return sorted(set(stamps))
+
+
+def render_document(template_file, context, attachments=None, allow_local_images: bool = False) -> CachedDocxTemplate:
+  """
+  Render a template stream with a context (dict, pydantic model or RenderContext) and return the
+  rendered, unsaved DocxTemplate.
+  """
+  if not isinstance(context, RenderContext):
+    context = RenderContext.build(context, attachments)
+    context.allow_local_images = allow_local_images
+  model = context
+
+  # Preprocessed XML and the compiled Jinja template are reused across renders of the same template.
+  doc = CachedDocxTemplate(template_file)
+
+  # Pre-calculate RichText objects
+  consideration = model.consideration
+  extra_context = {
+    "consideration_units_rt": create_consideration_units_rt(consideration.get("units")),
+    "references_rt": create_reference_lines_rt(consideration),
+  }
+  
+  # Patch the template to use these new variables
+  patch_template(doc, model.extra)
+
+  inject_inline_images(doc, model)
+  inject_tables(doc, model)
+  inject_blocks(doc, model)
+  env = get_jinja_env()
+  doc.render(model.to_template_context(**extra_context), jinja_env=env)
+  strip_openxml_artifacts(doc.docx)
+  return doc
+
+
+def render_report(payload: dict, attachments=None, allow_local_images: bool = False) -> bytes:
   """
   Render the report and return the DOCX bytes.
+  `attachments` holds the raw figure images of a binary payload container (see payload_container.py).
+  `allow_local_images` lets figure_image.path read image files from the local disk (CLI / batch use).
+  Local templates and images are read through shared read-only mmaps or cached in-memory copies (see mapped_file.py).
+  Identical requests are answered from the render cache (see render_cache.py) unless payload "no_cache" is set.
   """
   template_path = payload.get("template_path", "")
   template_base64 = payload.get("template_base64", "")
   context = payload.get("context") or {}
+  level = payload.get("compress_level")
+  level = DEFAULT_LEVEL if level is None else int(level)
+  if not -1 <= level <= 9:
+    raise ValueError(f"compress_level must be between -1 and 9: {level}")
+  store_media = payload.get("store_media", True) is not False
 
   if template_base64:
     template_file = BytesIO(base64.b64decode(template_base64))
+    template_digest = "b64:" + hashlib.sha256(template_base64.encode("ascii")).hexdigest()
   elif template_path:
     resolved_path = Path(template_path).expanduser()
     if not resolved_path.exists():
       raise FileNotFoundError(f"Template not found: {resolved_path}")
-    template_file = resolved_path
+    # Mapped once per process and shared with other workers through the page cache.
+    template_file = open_mapped(resolved_path)
+    template_digest = file_digest(str(resolved_path))
   else:
     raise ValueError("Either template_path or template_base64 must be provided")
 
-  doc = DocxTemplate(template_file)
-  
-  # Pre-calculate RichText objects
-  context["consideration_units_rt"] = create_consideration_units_rt(context.get("consideration", {}).get("units"))
-  context["references_rt"] = create_reference_lines_rt(context.get("consideration", {}))
-  
-  # Patch the template to use these new variables
-  patch_template(doc, context)
-
-  context_with_images = inject_inline_images(doc, context)
-  context_with_tables = inject_tables(doc, context_with_images)
-  context_with_blocks = inject_blocks(doc, context_with_tables)
-  env = build_jinja_env()
-  doc.render(context_with_blocks, jinja_env=env)
-  strip_openxml_artifacts(doc.docx)
+  # Build the typed render model once; the payload's context dict is never mutated.
+  model = RenderContext.build(context, attachments)
+  model.allow_local_images = allow_local_images
+
+  cache = None if payload.get("no_cache") else get_render_cache()
+  cache_key = None
+  if cache is not None:
+    extra = [
+      ("compress_level", level),
+      ("store_media", store_media),
+      ("allow_local_images", allow_local_images),
+      ("local_images", _local_image_stamps(model) if allow_local_images else []),
+    ]
+    cache_key = make_key(RENDERER_VERSION, template_digest, context, attachments, extra)
+    cached = cache.get(cache_key)
+    if cached is not None:
+      print(f"[DEBUG] Render cache hit: {cache_key[:12]} ({len(cached)} bytes)", file=sys.stderr)
+      return cached
+
+  doc = render_document(template_file, model)
   
+  # Incompressible media parts are stored as-is; the rest is deflated at `compress_level`
+  # (-1 = zlib default as in doc.save, 0 = none, 1 = fast ... 9 = small).
   output_io = BytesIO()
-  doc.save(output_io)
-  return output_io.getvalue()
-
-
-def main() -> int:
+  stats = save_docx(
+    doc,
+    output_io,
+    level=level,
+    store_media=store_media,
+    estimate=bool(payload.get("estimate_size")),
+  )
+  print(f"[DEBUG] Saved DOCX: {stats.describe()}", file=sys.stderr)
+  docx_bytes = output_io.getvalue()
+  if cache_key is not None:
+    cache.put(cache_key, docx_bytes)
+  return docx_bytes
+
+
+def _load_payload(argv):
+  """
+  Load the payload from the file named on the command line, or from stdin.
+  Both JSON and binary container payloads are accepted; container files are memory-mapped.
+  Returns (payload, container or None).
+  """
+  if len(argv) > 1:
+    path = argv[1]
+    with open(path, "rb") as f:
+      head = f.read(16)
+    if is_container(head):
+      container = PayloadContainer.open(path)
+      return container.payload, container
+    with open(path, "rb") as f:
+      return json_codec.load(f), None
+
+  # Read stdin as bytes; the fast codec decodes the (base64-heavy) payload without a str copy.
+  data = sys.stdin.buffer.read()
+  if is_container(data):
+    container = PayloadContainer.from_bytes(data)
+    return container.payload, container
+  return json_codec.loads(data), None
+
+
+def main(argv=None) -> int:
+  # figure_image.path is only read with --allow-local-images; generator.ts spawns this script for
+  # web requests without it, so request payloads cannot read files on the server.
+  argv = list(sys.argv if argv is None else argv)
+  allow_local_images = ALLOW_LOCAL_IMAGES_FLAG in argv
+  if allow_local_images:
+    argv.remove(ALLOW_LOCAL_IMAGES_FLAG)
   try:
-    payload = json.load(sys.stdin)
+    payload, container = _load_payload(argv)
   except Exception as exc:  # pragma: no cover
     sys.stderr.write(f"Failed to load JSON payload: {exc}\n")
     return 1
@@ -606,7 +704,7 @@ def main() -> int:
   output_path = Path(payload.get("output_path", "")).expanduser()
   
   try:
-    docx_bytes = render_report(payload)
+    docx_bytes = render_report(payload, container.attachments if container else None, allow_local_images=allow_local_images)
     
     if output_path:
       output_path.parent.mkdir(parents=True, exist_ok=True)
@@ -620,6 +718,9 @@ def main() -> int:
     sys.stderr.write(f"Failed to render DOCX with docxtpl: {exc}\n")
     sys.stderr.write(traceback.format_exc())
     return 3
+  finally:
+    if container is not None:
+      container.close()
 
   return 0
 
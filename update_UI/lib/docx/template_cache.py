@@ -0,0 +1,106 @@
+"""
+Compiled-template caching for docxtpl.
+
+docxtpl runs its regex preprocessing (patch_xml) over the document XML and compiles the result with
+`jinja_env.from_string` on every render. CachedDocxTemplate keeps both results keyed by a hash of
+the XML: the preprocessed XML per raw XML, and the compiled Jinja template per preprocessed XML.
+Compiled templates are loaded through PreprocessedXmlLoader, so a Jinja environment created with a
+bytecode_cache (e.g. FileSystemBytecodeCache) also reuses bytecode across processes.
+"""
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Optional, Tuple
+
+from docxtpl import DocxTemplate
+from jinja2 import BaseLoader, Environment, Template, TemplateNotFound
+from jinja2.exceptions import TemplateError
+
+# Number of distinct template XML sources kept (each chapter template contributes body + headers/footers)
+MAX_CACHED_SOURCES = 64
+
+_lock = threading.Lock()
+_patched_xml: "OrderedDict[str, str]" = OrderedDict()
+
+
+def _digest(xml: str) -> str:
+  return hashlib.sha1(xml.encode("utf-8")).hexdigest()
+
+
+def _remember(cache: "OrderedDict[str, Any]", key: str, value: Any) -> None:
+  with _lock:
+    cache[key] = value
+    cache.move_to_end(key)
+    while len(cache) > MAX_CACHED_SOURCES:
+      cache.popitem(last=False)
+
+
+class PreprocessedXmlLoader(BaseLoader):
+  """Serves preprocessed template XML by its content hash; a hash name never goes stale."""
+
+  def __init__(self) -> None:
+    self._sources: "OrderedDict[str, str]" = OrderedDict()
+
+  def add(self, xml: str) -> str:
+    name = _digest(xml)
+    if name not in self._sources:
+      _remember(self._sources, name, xml)
+    return name
+
+  def get_source(self, environment: Environment, template: str) -> Tuple[str, Optional[str], Callable[[], bool]]:
+    try:
+      source = self._sources[template]
+    except KeyError:
+      raise TemplateNotFound(template) from None
+    return source, None, lambda: True
+
+
+class CachedDocxTemplate(DocxTemplate):
+  """DocxTemplate that reuses preprocessed XML and compiled Jinja templates across renders."""
+
+  def patch_xml(self, src_xml: str) -> str:
+    key = _digest(src_xml)
+    patched = _patched_xml.get(key)
+    if patched is None:
+      patched = super().patch_xml(src_xml)
+      _remember(_patched_xml, key, patched)
+    return patched
+
+  def _compile(self, src_xml: str, jinja_env: Optional[Environment]) -> Template:
+    loader = getattr(jinja_env, "loader", None) if jinja_env is not None else None
+    if not isinstance(loader, PreprocessedXmlLoader):
+      # Not a caching environment: same behaviour as DocxTemplate.render_xml_part
+      return jinja_env.from_string(src_xml) if jinja_env else Template(src_xml)
+    # get_template goes through the environment's template cache and bytecode cache
+    return jinja_env.get_template(loader.add(src_xml))
+
+  def render_xml_part(self, src_xml, part, context, jinja_env=None):
+    # Same steps as DocxTemplate.render_xml_part, with the compile step cached.
+    src_xml = re.sub(r"<w:p([ >])", r"\n<w:p\1", src_xml)
+    try:
+      self.current_rendering_part = part
+      template = self._compile(src_xml, jinja_env)
+      dst_xml = template.render(context)
+    except TemplateError as exc:
+      if hasattr(exc, "lineno") and exc.lineno is not None:
+        line_number = max(exc.lineno - 4, 0)
+        exc.docx_context = map(
+          lambda x: re.sub(r"<[^>]+>", "", x),
+          src_xml.splitlines()[line_number: (line_number + 7)],
+        )
+      raise exc
+    dst_xml = re.sub(r"\n<w:p([ >])", r"<w:p\1", dst_xml)
+    dst_xml = (
+      dst_xml.replace("{_{", "{{")
+      .replace("}_}", "}}")
+      .replace("{_%", "{%")
+      .replace("%_}", "%}")
+    )
+    dst_xml = self.resolve_listing(dst_xml)
+    return dst_xml
+
+
+def clear_cache() -> None:
+  with _lock:
+    _patched_xml.clear()
@@ -0,0 +1,191 @@
+import os
+from io import BytesIO
+from typing import IO, Dict, Iterator, List, Optional, Union
+from zipfile import ZipFile
+from xml.etree import ElementTree as ET
+
+
+W_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+M_NS = "http://schemas.openxmlformats.org/officeDocument/2006/math"
+
+_W = f"{{{W_NS}}}"
+_BODY = _W + "body"
+_P = _W + "p"
+_TBL = _W + "tbl"
+_TR = _W + "tr"
+_TC = _W + "tc"
+_SDT = _W + "sdt"
+_SDT_CONTENT = _W + "sdtContent"
+_T = _W + "t"
+_TAB = _W + "tab"
+_BR = _W + "br"
+_CR = _W + "cr"
+_FOOTNOTE_REF = _W + "footnoteReference"
+_ENDNOTE_REF = _W + "endnoteReference"
+_ID = _W + "id"
+_TYPE = _W + "type"
+
+# 段落の表示テキストに含めない部分木（段落プロパティのタブ位置定義、図形・テキストボックス、数式等）。
+# 数式は python-docx の Paragraph.text にも含まれず、中の w:br が余分な改行になるため辿らない。
+_SKIP_SUBTREES = frozenset(
+    {
+        _W + "pPr",
+        _W + "rPr",
+        _W + "drawing",
+        _W + "pict",
+        _W + "object",
+        f"{{{M_NS}}}oMath",
+        f"{{{M_NS}}}oMathPara",
+        "{http://schemas.openxmlformats.org/markup-compatibility/2006}AlternateContent",
+    }
+)
+
+
+# ファイルパス、メモリ上の内容（bytes 等）、またはシーク可能なバイナリストリーム
+DocxSource = Union[str, os.PathLike, bytes, bytearray, memoryview, IO[bytes]]
+
+
+def zip_source(source: DocxSource) -> Union[str, os.PathLike, IO[bytes]]:
+    """ZipFile に渡せる形にする。bytes 類は BytesIO で包み、ディスクには書き出さない。"""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return BytesIO(source)
+    return source
+
+
+def _collect_run_text(el: ET.Element, parts: List[str], note_refs: Optional[List[str]]) -> None:
+    for child in el:
+        tag = child.tag
+        if tag == _T:
+            if child.text:
+                parts.append(child.text)
+        elif tag == _TAB:
+            parts.append("\t")
+        elif tag == _BR or tag == _CR:
+            parts.append("\n")
+        elif tag == _FOOTNOTE_REF or tag == _ENDNOTE_REF:
+            if note_refs is not None:
+                kind = "footnote" if tag == _FOOTNOTE_REF else "endnote"
+                note_refs.append(f"{kind}:{child.get(_ID)}")
+        elif tag not in _SKIP_SUBTREES:
+            # w:r / w:hyperlink / w:ins / w:smartTag などは中を辿る
+            _collect_run_text(child, parts, note_refs)
+
+
+def _paragraph_text(p: ET.Element, note_refs: Optional[List[str]] = None) -> str:
+    """
+    段落のテキストを python-docx の Paragraph.text と同じ規則で組み立てる
+    （w:t を連結し、w:tab はタブ、w:br / w:cr は改行。図形やテキストボックスは含めない）。
+    note_refs を渡すと、段落内の脚注・文末脚注の参照を出現順に追記する。
+    """
+    parts: List[str] = []
+    _collect_run_text(p, parts, note_refs)
+    return "".join(parts)
+
+
+def _table_lines(tbl: ET.Element, note_refs: Optional[List[str]] = None) -> Iterator[str]:
+    """
+    表を行単位で返す。セル内の段落は空白で連結し、セル同士はタブで区切る。
+    入れ子の表はセルのテキストに平坦化して含める。
+    """
+    # 入れ子の表の行は外側のセルで処理するので、直下の行だけを対象にする
+    for tr in tbl.findall(_TR):
+        cells: List[str] = []
+        for tc in tr.findall(_TC):
+            texts = [_paragraph_text(p, note_refs) for p in tc.iter(_P)]
+            cells.append(" ".join(t.strip() for t in texts if t.strip()))
+        if any(cells):
+            yield "\t".join(cells)
+
+
+def _block_lines(elem: ET.Element, note_refs: Optional[List[str]] = None) -> Iterator[str]:
+    """本文直下の要素（段落・表・コンテンツコントロール）をテキスト行に変換する。"""
+    if elem.tag == _P:
+        text = _paragraph_text(elem, note_refs)
+        if text.strip():
+            yield text
+    elif elem.tag == _TBL:
+        yield from _table_lines(elem, note_refs)
+    elif elem.tag == _SDT:
+        content = elem.find(_SDT_CONTENT)
+        if content is not None:
+            for child in content:
+                yield from _block_lines(child, note_refs)
+
+
+def iter_body_elements(docx_path: DocxSource) -> Iterator[ET.Element]:
+    """
+    word/document.xml を iterparse で逐次パースし、本文直下の要素（段落・表など）を順に返す。
+    各要素は次の要素へ進む時点で破棄するため、大きな文書でもメモリ使用量は一定に保たれる
+    （呼び出し側は要素を保持せず、その場でテキストを取り出すこと）。
+    呼び出し側がイテレーションを途中で止めれば、それ以降の XML はパースされない。
+    """
+    with ZipFile(zip_source(docx_path)) as z, z.open("word/document.xml") as f:
+        body: Optional[ET.Element] = None
+        depth = 0
+        for event, elem in ET.iterparse(f, events=("start", "end")):
+            if event == "start":
+                depth += 1
+                if elem.tag == _BODY:
+                    body = elem
+                continue
+
+            depth -= 1
+            # document(0) > body(1) > 段落・表など(2)
+            if body is None or depth != 2:
+                continue
+            yield elem
+            elem.clear()
+            body.remove(elem)
+
+
+def iter_docx_lines(docx_path: DocxSource, note_refs: Optional[List[str]] = None) -> Iterator[str]:
+    """
+    本文を読み順にテキスト行として返す（iter_body_elements による逐次パース）。
+    段落は1行、表は1行につき1行（セルはタブ区切り）。空の段落は返さない。
+    docx_path にはパスのほか、bytes やバイナリストリームも渡せる。
+    """
+    for elem in iter_body_elements(docx_path):
+        yield from _block_lines(elem, note_refs)
+
+
+def _read_notes(z: ZipFile, part: str, kind: str) -> Dict[str, str]:
+    """footnotes.xml / endnotes.xml から {"<kind>:<id>": テキスト} を作る（区切り線用の注は除く）。"""
+    if part not in z.namelist():
+        return {}
+    root = ET.fromstring(z.read(part))
+    notes: Dict[str, str] = {}
+    for note in root:
+        if note.get(_TYPE) in ("separator", "continuationSeparator", "continuationNotice"):
+            continue
+        texts = [_paragraph_text(p).strip() for p in note.iter(_P)]
+        text = " ".join(t for t in texts if t)
+        if text:
+            notes[f"{kind}:{note.get(_ID)}"] = text
+    return notes
+
+
+def read_docx_text(docx_path: DocxSource, include_notes: bool = True) -> str:
+    """
+    DOCX から本文・表・脚注のテキストを python-docx を使わずに抽出する。
+    zip 内の XML を直接読むため、スタイルや番号定義などのパートは一切パースしない。
+
+    - 本文の段落と表を文書中の出現順に並べる（表は行ごと、セルはタブ区切り）
+    - include_notes=True の場合、脚注・文末脚注を本文中で参照された順に末尾へ追加する
+    - docx_path にはパスのほか、アップロードされた内容（bytes / BytesIO）をそのまま渡せる
+    """
+    source = zip_source(docx_path)
+    note_refs: Optional[List[str]] = [] if include_notes else None
+    lines = list(iter_docx_lines(source, note_refs))
+
+    if note_refs:
+        with ZipFile(source) as z:
+            notes = _read_notes(z, "word/footnotes.xml", "footnote")
+            notes.update(_read_notes(z, "word/endnotes.xml", "endnote"))
+        seen = set()
+        for ref in note_refs:
+            if ref in seen or ref not in notes:
+                continue
+            seen.add(ref)
+            lines.append(notes[ref])
+
+    return "\n".join(lines)
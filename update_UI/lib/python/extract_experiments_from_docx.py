@@ -2,34 +2,45 @@ import sys
 import os
 import json
 import re
-from typing import Dict, Any, List, Optional, Tuple, Union
-from zipfile import ZipFile
-from xml.etree import ElementTree as ET
+import argparse
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import chain
+from typing import Dict, Any, Iterable, Iterator, List, Optional, TextIO, Tuple, Union
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from docx_text import DocxSource, iter_body_elements  # noqa: E402
 
 
 W_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
 NS = {"w": W_NS}
 
+_CHAPTER_PATTERN = re.compile(r"^(\d+)\.")
+
+
+_W_P = f"{{{W_NS}}}p"
+_W_T = f"{{{W_NS}}}t"
+
 
-def _read_paragraphs_from_docx(docx_path: str) -> List[str]:
+def _iter_paragraphs_from_docx(docx_path: DocxSource) -> Iterator[str]:
     """
-    DOCX を直接 unzip して word/document.xml から段落テキストを抽出する。
-    python-docx よりプレーンテキストの取得が高速で、スタイル差異にも左右されにくい。
+    本文直下の段落テキストを順に返すジェネレータ（docx_text.iter_body_elements による逐次パース）。
+    表は読み飛ばし、段落内の w:t はテキストボックス内のものも含めてそのまま連結する。
+    呼び出し側がイテレーションを途中で止めれば、それ以降の XML はパースされない。
     """
-    with ZipFile(docx_path) as z:
-        xml = z.read("word/document.xml")
+    for elem in iter_body_elements(docx_path):
+        if elem.tag == _W_P:
+            para = "".join(t.text for t in elem.iter(_W_T) if t.text)
+            if para.strip():
+                yield para
 
-    root = ET.fromstring(xml)
-    paras: List[str] = []
 
-    for p in root.findall(".//w:body/w:p", NS):
-        texts = [t.text for t in p.findall(".//w:t", NS) if t.text]
-        if not texts:
-            continue
-        para = "".join(texts)
-        if para.strip():
-            paras.append(para)
-    return paras
+def _read_paragraphs_from_docx(docx_path: DocxSource) -> List[str]:
+    """
+    DOCX を直接 unzip して word/document.xml から段落テキストを抽出する。
+    python-docx よりプレーンテキストの取得が高速で、スタイル差異にも左右されにくい。
+    """
+    return list(_iter_paragraphs_from_docx(docx_path))
 
 
 def _detect_results_chapter(paras: List[str]) -> Optional[str]:
@@ -37,19 +48,54 @@ def _detect_results_chapter(paras: List[str]) -> Optional[str]:
     「◯.実験結果」の行から章番号を推定する。
     見つからない場合は None を返し、章番号によるフィルタは行わない。
     """
-    chapter_pattern = re.compile(r"^(\d+)\.")
     for para in paras:
-        m = chapter_pattern.match(para)
+        m = _CHAPTER_PATTERN.match(para)
         if m and "実験結果" in para:
             return m.group(1)
     return None
 
 
+def _detect_results_chapter_streaming(paras: Iterable[str]) -> Tuple[Optional[str], Iterator[str]]:
+    """
+    _detect_results_chapter のストリーミング版。
+    「◯.実験結果」の行が見つかるまでの段落だけを先読みし、
+    (章番号, 先読み分を含めた全段落のイテレータ) を返す。
+    見出しが見つからない場合は全段落を先読みした上で章番号 None を返す。
+    """
+    it = iter(paras)
+    buffered: List[str] = []
+    for para in it:
+        buffered.append(para)
+        m = _CHAPTER_PATTERN.match(para)
+        if m and "実験結果" in para:
+            return m.group(1), chain(buffered, it)
+    return None, iter(buffered)
+
+
+_SECTION_PATTERN = re.compile(r"^(\d+\.\d+)")
+_SUB_PATTERN = re.compile(r"^[\(\（](\d+-\d+)[\)\）]")
+_TABLE_PATTERN = re.compile(r"^(表\s*\d+\.\d+(?:\.\d+)?)(.+)")
+_FIGURE_PATTERN = re.compile(r"^(図\s*\d+\.\d+(?:\.\d+)?)(.+)")
+
+# 上記4パターンを名前付きの選択肢として1つにまとめたもの。
+# 先頭文字（数字 / 括弧 / 表 / 図）で互いに排他なので、1回の match で段落を分類できる。
+_HEADING_PATTERN = re.compile(
+    r"^(?:"
+    r"(?P<section>\d+\.\d+)"
+    r"|[\(\（](?P<sub>\d+-\d+)[\)\）]"
+    r"|(?P<table>表\s*\d+\.\d+(?:\.\d+)?)(?P<table_caption>.+)"
+    r"|(?P<figure>図\s*\d+\.\d+(?:\.\d+)?)(?P<figure_caption>.+)"
+    r")"
+)
+# \d は全角数字（「１.１」）にも一致するので、先頭文字の判定も str.isdigit() で全角を含める
+_HEADING_FIRST_MARKS = frozenset("(（表図")
+
+
 def _parse_section_number(para: str) -> Optional[str]:
     """
     先頭の「1.1」「5.2」などの節番号を返す。
     """
-    m = re.match(r"^(\d+\.\d+)", para)
+    m = _SECTION_PATTERN.match(para)
     if m:
         return m.group(1)
     return None
@@ -60,7 +106,7 @@ def _parse_sub_number(para: str) -> Optional[str]:
     先頭の「(1-1)」「（1-2）」などの小項目番号を返す。
     全角括弧も許容する。
     """
-    m = re.match(r"^[\(\（](\d+-\d+)[\)\）]", para)
+    m = _SUB_PATTERN.match(para)
     if m:
         return m.group(1)
     return None
@@ -72,7 +118,7 @@ def _match_table(para: str) -> Optional[Tuple[str, str]]:
     例: 「表1.1.1　反転増幅回路における…」
         「表 1.1.1 反転増幅回路における…」
     """
-    m = re.match(r"^(表\s*\d+\.\d+(?:\.\d+)?)(.+)", para)
+    m = _TABLE_PATTERN.match(para)
     if not m:
         return None
     label = m.group(1).replace(" ", "")
@@ -85,7 +131,7 @@ def _match_figure(para: str) -> Optional[Tuple[str, str]]:
     図のラベル・キャプションを抽出する。
     例: 「図1.1.1　〜」「図 1.6.3 〜」
     """
-    m = re.match(r"^(図\s*\d+\.\d+(?:\.\d+)?)(.+)", para)
+    m = _FIGURE_PATTERN.match(para)
     if not m:
         return None
     label = m.group(1).replace(" ", "")
@@ -93,6 +139,28 @@ def _match_figure(para: str) -> Optional[Tuple[str, str]]:
     return label, caption
 
 
+def _classify_paragraph(para: str) -> Optional[Tuple[str, str, str]]:
+    """
+    段落を1回の正規表現照合で分類する。
+    戻り値は (種別, 値, キャプション) で、種別は "section" / "sub" / "table" / "figure"。
+    節・小項目の場合キャプションは空文字。どれにも該当しなければ None。
+
+    _parse_section_number → _parse_sub_number → _match_table → _match_figure を
+    順に試すのと同じ結果になる。
+    """
+    if not para or not (para[0].isdigit() or para[0] in _HEADING_FIRST_MARKS):
+        return None
+    m = _HEADING_PATTERN.match(para)
+    if not m:
+        return None
+    kind = m.lastgroup
+    if kind == "section" or kind == "sub":
+        return kind, m.group(kind), ""
+    # キャプション側のグループ名 (table_caption / figure_caption) から種別を取り出す
+    kind = kind[: -len("_caption")]
+    return kind, m.group(kind).replace(" ", ""), m.group(kind + "_caption").strip()
+
+
 def _sort_key_for_experiment(key: Union[str, Tuple[str, Optional[str]]]) -> Tuple[int, int, int, int]:
     """
     experiments dict のキー（節 or (節, 小項目)）を安定ソートするためのキー。
@@ -120,9 +188,10 @@ def _sort_key_for_experiment(key: Union[str, Tuple[str, Optional[str]]]) -> Tupl
     return (sec_main_i, sec_sub_i, sub_main_i, sub_sub_i)
 
 
-def extract_experiments_from_docx(docx_path: str) -> Dict[str, Any]:
+def extract_experiments_from_docx(docx_path: DocxSource) -> Dict[str, Any]:
     """
     1本の過去レポート DOCX から、実験結果章の「experiments 配列」を抽出する。
+    docx_path はパスのほか、bytes / BytesIO でもよい。
 
     出力形式（例）:
     {
@@ -134,14 +203,14 @@ def extract_experiments_from_docx(docx_path: str) -> Dict[str, Any]:
           "subidx": 1,
           "name": "(1-1)　入力電圧と出力電圧の関係",
           "tables": [{ "label": "表1.1.1", "caption": "…" }],
-          "figures": [{ "label": "図1.1.1", "caption": "…" }]
+          "figures": [{ "label": "図1.1.1", "caption": "…" }],
+          "blocks": [{ "type": "table", "label": "表1.1.1", "caption": "…" }, ...]  # 表・図を出現順に
         },
         ...
       ]
     }
     """
-    paras = _read_paragraphs_from_docx(docx_path)
-    chapter_str = _detect_results_chapter(paras)
+    chapter_str, paras = _detect_results_chapter_streaming(_iter_paragraphs_from_docx(docx_path))
 
     experiments: Dict[Union[str, Tuple[str, Optional[str]]], Dict[str, Any]] = {}
     current_section: Optional[str] = None
@@ -161,6 +230,7 @@ def extract_experiments_from_docx(docx_path: str) -> Dict[str, Any]:
                 "name": title or "",
                 "tables": [],
                 "figures": [],
+                "blocks": [],
             }
             experiments[key] = ex
         else:
@@ -169,49 +239,41 @@ def extract_experiments_from_docx(docx_path: str) -> Dict[str, Any]:
         return ex
 
     for para in paras:
+        classified = _classify_paragraph(para)
+        if classified is None:
+            continue
+        kind, value, caption = classified
+
         # 節番号 1.1, 1.2 ... を検出
-        section = _parse_section_number(para)
-        if section:
+        if kind == "section":
             # 「◯.実験結果」が検出できていれば、その章以外の節はスキップ
-            if chapter_str is not None and section.split(".")[0] != chapter_str:
+            # 全角・半角の混在（「5. 実験結果」と「５.１」）でも一致するよう数値で比べる
+            if chapter_str is not None and int(value.split(".")[0]) != int(chapter_str):
                 # 実験結果章を抜けたとみなしてループ終了
                 current_section = None
                 current_sub = None
                 break
-            current_section = section
+            current_section = value
             current_sub = None
-            ensure_experiment(section, section, None, para)
-            continue
-
-        # 小項目 (1-1), (2-1) ... を検出
-        sub = _parse_sub_number(para)
-        if sub and current_section:
-            current_sub = sub
-            key = (current_section, current_sub)
-            ensure_experiment(key, current_section, current_sub, para)
+            ensure_experiment(value, value, None, para)
             continue
 
         if not current_section:
             # 実験節の外は無視
             continue
 
-        # 表
-        t = _match_table(para)
-        if t:
-            label, caption = t
-            key = (current_section, current_sub) if current_sub else current_section
-            ex = ensure_experiment(key, current_section, current_sub)
-            ex["tables"].append({"label": label, "caption": caption})
+        # 小項目 (1-1), (2-1) ... を検出
+        if kind == "sub":
+            current_sub = value
+            key = (current_section, current_sub)
+            ensure_experiment(key, current_section, current_sub, para)
             continue
 
-        # 図
-        f = _match_figure(para)
-        if f:
-            label, caption = f
-            key = (current_section, current_sub) if current_sub else current_section
-            ex = ensure_experiment(key, current_section, current_sub)
-            ex["figures"].append({"label": label, "caption": caption})
-            continue
+        # 表 / 図
+        key = (current_section, current_sub) if current_sub else current_section
+        ex = ensure_experiment(key, current_section, current_sub)
+        ex["tables" if kind == "table" else "figures"].append({"label": value, "caption": caption})
+        ex["blocks"].append({"type": kind, "label": value, "caption": caption})
 
     # experiments dict → ソートされた配列に変換しつつ idx / subidx を付与
     experiments_list: List[Dict[str, Any]] = []
@@ -252,37 +314,198 @@ def extract_experiments_from_docx(docx_path: str) -> Dict[str, Any]:
                 "name": ex.get("name", ""),
                 "tables": ex.get("tables", []),
                 "figures": ex.get("figures", []),
+                "blocks": ex.get("blocks", []),
             }
         )
 
     return {"chapter": int(chapter_str) if chapter_str else None, "experiments": experiments_list}
 
 
-def _process_path(path: str) -> Dict[str, Any]:
+def _iter_docx_files(path: str, recursive: bool = False) -> List[str]:
+    """
+    ディレクトリ内の *.docx をソート済みで列挙する。
+    Word のロックファイル（~$xxx.docx）は zip ではないので除外する。
+    recursive=True の場合はサブディレクトリも再帰的に探索する。
+    """
+    files: List[str] = []
+    if recursive:
+        for root, dirs, names in os.walk(path):
+            dirs.sort()
+            for name in names:
+                if name.lower().endswith(".docx") and not name.startswith("~$"):
+                    files.append(os.path.join(root, name))
+    else:
+        for name in os.listdir(path):
+            if name.lower().endswith(".docx") and not name.startswith("~$"):
+                files.append(os.path.join(path, name))
+    return sorted(files)
+
+
+def _file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _load_manifest(manifest_path: Optional[str]) -> Dict[str, Dict[str, Any]]:
+    if not manifest_path or not os.path.exists(manifest_path):
+        return {}
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def _save_manifest(manifest_path: str, manifest: Dict[str, Dict[str, Any]]) -> None:
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+
+def _is_unchanged(full: str, entry: Optional[Dict[str, Any]]) -> Tuple[bool, Dict[str, Any]]:
+    """
+    manifest のエントリと比較してファイルが変更されていないかを判定する。
+    mtime/size が一致すればハッシュ計算を省略し、不一致の場合のみ sha256 で確認する。
+    戻り値は (変更なしか, 最新の mtime/size/sha256 エントリ)。
+    """
+    st = os.stat(full)
+    current: Dict[str, Any] = {"mtime": st.st_mtime_ns, "size": st.st_size}
+    if entry and entry.get("mtime") == current["mtime"] and entry.get("size") == current["size"]:
+        current["sha256"] = entry.get("sha256")
+        return True, current
+    current["sha256"] = _file_sha256(full)
+    if entry and entry.get("sha256") == current["sha256"]:
+        return True, current
+    return False, current
+
+
+def _extract_worker(full: str) -> Tuple[str, Optional[Dict[str, Any]], Optional[str]]:
+    """
+    プロセスプールで実行されるワーカー。例外は文字列化して親プロセスへ返す。
+    """
+    try:
+        return full, extract_experiments_from_docx(full), None
+    except Exception as e:
+        return full, None, str(e)
+
+
+def _process_directory_parallel(
+    path: str,
+    workers: Optional[int] = None,
+    recursive: bool = False,
+    manifest_path: Optional[str] = None,
+    out: TextIO = sys.stdout,
+) -> int:
+    """
+    ディレクトリ内の DOCX をプロセスプールで並列処理し、
+    完了したものから 1 行 1 JSON（JSON Lines）で out へ書き出す。
+
+    各行の形式:
+      {"file": "<ディレクトリからの相対パス>", "result": {...}}
+      {"file": "...", "error": "..."}
+      {"file": "...", "skipped": "unchanged"}   （manifest により処理を省略したファイル）
+
+    manifest_path を指定すると、mtime/size/sha256 が前回と同じファイルはスキップし、
+    処理に成功したファイルのみ manifest を更新する。戻り値は失敗したファイル数。
+    """
+    manifest = _load_manifest(manifest_path)
+    pending: Dict[str, Dict[str, Any]] = {}
+
+    for full in _iter_docx_files(path, recursive):
+        rel = os.path.relpath(full, path)
+        unchanged, entry = _is_unchanged(full, manifest.get(rel)) if manifest_path else (False, {})
+        if unchanged:
+            manifest[rel] = entry
+            # 出力されないファイルと区別できるよう、スキップしたことも1行で知らせる
+            out.write(json.dumps({"file": rel, "skipped": "unchanged"}, ensure_ascii=False) + "\n")
+            continue
+        pending[full] = entry
+    out.flush()
+
+    failures = 0
+    if pending:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_extract_worker, full) for full in pending]
+            for future in as_completed(futures):
+                full, result, error = future.result()
+                rel = os.path.relpath(full, path)
+                if error is not None:
+                    failures += 1
+                    line: Dict[str, Any] = {"file": rel, "error": error}
+                else:
+                    line = {"file": rel, "result": result}
+                    if manifest_path:
+                        manifest[rel] = pending[full]
+                out.write(json.dumps(line, ensure_ascii=False) + "\n")
+                out.flush()
+
+    if manifest_path:
+        _save_manifest(manifest_path, manifest)
+    return failures
+
+
+def _process_path(path: str, recursive: bool = False) -> Dict[str, Any]:
     """
     ファイル or ディレクトリを受け取り、結果 JSON を返す。
     - DOCX ファイル 1本 → そのまま extract_experiments_from_docx の結果
-    - ディレクトリ       → 直下の *.docx をすべて処理した {filename: result} マップ
+    - ディレクトリ       → *.docx をすべて処理した {filename: result} マップ
+                           （recursive=True の場合、キーはディレクトリからの相対パス）
     """
     if os.path.isdir(path):
         results: Dict[str, Any] = {}
-        for name in sorted(os.listdir(path)):
-            if not name.lower().endswith(".docx"):
-                continue
-            full = os.path.join(path, name)
-            results[name] = extract_experiments_from_docx(full)
+        for full in _iter_docx_files(path, recursive):
+            results[os.path.relpath(full, path)] = extract_experiments_from_docx(full)
         return results
     else:
         return extract_experiments_from_docx(path)
 
 
+def _non_negative_int(value: str) -> int:
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"整数を指定してください: {value}")
+    if number < 0:
+        raise argparse.ArgumentTypeError(f"0 以上を指定してください: {value}")
+    return number
+
+
 def main() -> None:
-    if len(sys.argv) < 2:
-        print("Usage: python3 extract_experiments_from_docx.py <docx_path or directory>", file=sys.stderr)
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="過去レポート DOCX から実験結果章の図表構成を抽出する")
+    parser.add_argument("path", help="DOCX ファイル、または DOCX を含むディレクトリ")
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=_non_negative_int,
+        default=None,
+        help="ディレクトリをプロセスプールで並列処理し、JSON Lines で逐次出力する（ワーカー数, 0 で CPU 数）",
+    )
+    parser.add_argument("-r", "--recursive", action="store_true", help="サブディレクトリも再帰的に処理する")
+    parser.add_argument(
+        "--manifest",
+        default=None,
+        help="mtime/size/sha256 の manifest ファイル。変更のない DOCX をスキップする（--jobs 指定時）",
+    )
+    args = parser.parse_args()
+
+    if args.manifest and (args.jobs is None or not os.path.isdir(args.path)):
+        parser.error("--manifest はディレクトリを --jobs で処理する場合にのみ指定できます")
+
+    if args.jobs is not None and os.path.isdir(args.path):
+        failures = _process_directory_parallel(
+            args.path,
+            workers=args.jobs or None,
+            recursive=args.recursive,
+            manifest_path=args.manifest,
+        )
+        sys.exit(1 if failures else 0)
 
-    target = sys.argv[1]
-    result = _process_path(target)
+    result = _process_path(args.path, recursive=args.recursive)
     print(json.dumps(result, ensure_ascii=False, indent=2))
 
 
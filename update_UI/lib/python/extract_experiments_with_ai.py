@@ -2,13 +2,24 @@ import sys
 import os
 import json
 import asyncio
-from typing import List, Optional, Dict, Any, Union
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Dict, Any, Union
 
+import openai
 from pydantic import BaseModel, Field
 
 # ローカルモジュール（既存のAI抽出ワークフロー）を利用
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from past_report_workflow import read_docx_text, extract_hint_with_llm  # type: ignore
+from extract_experiments_from_docx import _iter_docx_files  # type: ignore
+
+DEFAULT_CONCURRENCY = int(os.environ.get("EXTRACT_AI_CONCURRENCY", "4"))
+DEFAULT_RETRIES = int(os.environ.get("EXTRACT_AI_RETRIES", "3"))
+
+# 待てば通る可能性のあるエラーだけをリトライする（認証エラー・400・スキーマ検証エラーなどは即失敗）。
+# APITimeoutError は APIConnectionError のサブクラス。
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.APIConnectionError, asyncio.TimeoutError)
 
 
 class TableItem(BaseModel):
@@ -106,47 +117,175 @@ async def extract_experiments_for_text(text: str) -> ReportExperimentsResult:
     return ReportExperimentsResult(chapter=chapter, experiments=experiments)
 
 
-async def _process_path_async(path: str) -> Union[ReportExperimentsResult, Dict[str, Any]]:
+async def _extract_file_with_retry(
+    full: str,
+    semaphore: asyncio.Semaphore,
+    executor: ThreadPoolExecutor,
+    retries: int,
+) -> ReportExperimentsResult:
+    """
+    1ファイル分の処理。セマフォを取得してから DOCX のテキストをスレッドプールで読み込み
+    （待機中のファイルのテキストはメモリに載せない）、LLM を呼び出す。
+    レート制限・タイムアウト・接続エラーのみ指数バックオフ付きでリトライする。
+    """
+    loop = asyncio.get_running_loop()
+    text: Optional[str] = None
+
+    attempt = 0
+    while True:
+        try:
+            async with semaphore:
+                if text is None:
+                    text = await loop.run_in_executor(executor, read_docx_text, full)
+                return await extract_experiments_for_text(text)
+        except RETRYABLE_ERRORS as e:
+            attempt += 1
+            if attempt > retries:
+                raise
+            delay = 2 ** (attempt - 1)
+            print(
+                f"[WARN] {os.path.basename(full)}: {e} (retry {attempt}/{retries} in {delay}s)",
+                file=sys.stderr,
+            )
+            await asyncio.sleep(delay)
+
+
+def _load_checkpoint(checkpoint: Optional[str]) -> Dict[str, Any]:
+    """
+    JSON Lines 形式のチェックポイントから、成功済みファイルの結果を読み込む。
+    """
+    done: Dict[str, Any] = {}
+    if not checkpoint or not os.path.exists(checkpoint):
+        return done
+    with open(checkpoint, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # 書き込み途中で中断された末尾行などは無視する
+                continue
+            if "result" in entry and "file" in entry:
+                done[entry["file"]] = entry["result"]
+    return done
+
+
+async def _process_directory_async(
+    path: str,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    retries: int = DEFAULT_RETRIES,
+    checkpoint: Optional[str] = None,
+    on_progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> Dict[str, Any]:
+    """
+    ディレクトリ直下の *.docx を並行処理し、{filename: result} を返す。
+    - LLM 呼び出しの同時実行数は concurrency で制限する
+    - 1ファイル完了するごとに on_progress へ {"file", "result" | "error"} を渡す
+    - checkpoint を指定すると成功した結果を JSON Lines で追記し、次回実行時はそれらをスキップする
+    """
+    results = _load_checkpoint(checkpoint)
+    names = [os.path.basename(full) for full in _iter_docx_files(path)]
+    pending = [name for name in names if name not in results]
+
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    checkpoint_file = open(checkpoint, "a", encoding="utf-8") if checkpoint else None
+
+    async def run(name: str) -> Dict[str, Any]:
+        try:
+            result = await _extract_file_with_retry(os.path.join(path, name), semaphore, executor, retries)
+            return {"file": name, "result": result.model_dump()}
+        except Exception as e:
+            return {"file": name, "error": str(e)}
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+            for next_done in asyncio.as_completed([run(name) for name in pending]):
+                entry = await next_done
+                if "result" in entry:
+                    results[entry["file"]] = entry["result"]
+                    if checkpoint_file:
+                        checkpoint_file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                        checkpoint_file.flush()
+                else:
+                    print(f"[WARN] Failed to process {entry['file']}: {entry['error']}", file=sys.stderr)
+                if on_progress:
+                    on_progress(entry)
+    finally:
+        if checkpoint_file:
+            checkpoint_file.close()
+
+    # 出力はファイル名順に揃える（失敗したファイルは含めない）
+    return {name: results[name] for name in names if name in results}
+
+
+async def _process_path_async(
+    path: str,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    retries: int = DEFAULT_RETRIES,
+    checkpoint: Optional[str] = None,
+    on_progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> Union[ReportExperimentsResult, Dict[str, Any]]:
     """
     - 単一 DOCX ファイル: ReportExperimentsResult を返す
     - ディレクトリ: 直下の *.docx それぞれに対して結果を返す dict[filename] を返す
     """
     if os.path.isdir(path):
-        results: Dict[str, Any] = {}
-        for name in sorted(os.listdir(path)):
-            if not name.lower().endswith(".docx"):
-                continue
-            full = os.path.join(path, name)
-            text = read_docx_text(full)
-            result = await extract_experiments_for_text(text)
-            results[name] = result.model_dump()
-        return results
+        return await _process_directory_async(path, concurrency, retries, checkpoint, on_progress)
     else:
         text = read_docx_text(path)
         result = await extract_experiments_for_text(text)
         return result
 
 
+def _print_progress_line(entry: Dict[str, Any]) -> None:
+    print(json.dumps(entry, ensure_ascii=False), flush=True)
+
+
 async def main_async() -> None:
-    if len(sys.argv) < 2:
-        print(
-            "Usage: python3 extract_experiments_with_ai.py <docx_path or directory>",
-            file=sys.stderr,
-        )
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="過去レポート DOCX から LLM で実験ごとの図表構成を抽出する")
+    parser.add_argument("path", help="DOCX ファイル、または DOCX を含むディレクトリ")
+    parser.add_argument("-c", "--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="LLM 呼び出しの同時実行数")
+    parser.add_argument("--retries", type=int, default=DEFAULT_RETRIES, help="LLM 呼び出し失敗時のリトライ回数")
+    parser.add_argument(
+        "--checkpoint",
+        default=None,
+        help="成功した結果を追記する JSON Lines ファイル。再実行時は記録済みのファイルをスキップする",
+    )
+    parser.add_argument(
+        "--jsonl",
+        action="store_true",
+        help="ディレクトリ処理の結果をまとめて出力せず、1ファイル完了ごとに JSON Lines で出力する",
+    )
+    args = parser.parse_args()
+
+    failed: List[str] = []
 
-    target = sys.argv[1]
+    def on_progress(entry: Dict[str, Any]) -> None:
+        if "error" in entry:
+            failed.append(entry["file"])
+        if args.jsonl:
+            _print_progress_line(entry)
 
     try:
-        result = await _process_path_async(target)
+        result = await _process_path_async(
+            args.path,
+            concurrency=args.concurrency,
+            retries=args.retries,
+            checkpoint=args.checkpoint,
+            on_progress=on_progress,
+        )
         if isinstance(result, ReportExperimentsResult):
             print(json.dumps(result.model_dump(), ensure_ascii=False, indent=2))
-        else:
+        elif not args.jsonl:
             print(json.dumps(result, ensure_ascii=False, indent=2))
     except Exception as e:
         print(json.dumps({"error": str(e)}), file=sys.stderr)
         sys.exit(1)
 
+    # 一部のファイルが失敗した場合も非ゼロで終了する（extract_experiments_from_docx --jobs と同じ）
+    if failed:
+        print(f"[WARN] {len(failed)} file(s) failed", file=sys.stderr)
+        sys.exit(1)
+
 
 def main() -> None:
     asyncio.run(main_async())
@@ -154,4 +293,3 @@ def main() -> None:
 
 if __name__ == "__main__":
     main()
-
@@ -0,0 +1,118 @@
+"""
+JSON のエンコード・デコード層。
+
+orjson → msgspec → 標準 json の順に利用可能なものを使う。図の base64 を何 MB も含むペイロードでは
+標準 json の str 変換・デコードが目立つため、bytes のまま高速ライブラリに渡す。
+環境変数 REPORT_JSON_BACKEND（orjson / msgspec / json）で明示的に選ぶこともできる。
+
+どのバックエンドでも dumps は UTF-8 の bytes を返し、非 ASCII 文字はエスケープしない。
+"""
+import json
+import os
+from typing import IO, Any, Callable, Optional, Union
+
+try:
+    import orjson  # type: ignore
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import msgspec  # type: ignore
+except ImportError:  # pragma: no cover
+    msgspec = None
+
+
+def _default(obj: Any) -> Any:
+    """pydantic モデルなど、各ライブラリが直接扱えない値の変換。"""
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump()
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _orjson_loads(data: Union[bytes, str]) -> Any:
+    return orjson.loads(data)
+
+
+def _orjson_dumps(obj: Any, indent: bool = False, sort_keys: bool = False) -> bytes:
+    option = orjson.OPT_NON_STR_KEYS
+    if indent:
+        option |= orjson.OPT_INDENT_2
+    if sort_keys:
+        option |= orjson.OPT_SORT_KEYS
+    return orjson.dumps(obj, default=_default, option=option)
+
+
+def _msgspec_loads(data: Union[bytes, str]) -> Any:
+    return msgspec.json.decode(data)
+
+
+def _msgspec_dumps(obj: Any, indent: bool = False, sort_keys: bool = False) -> bytes:
+    encoded = msgspec.json.encode(obj, enc_hook=_default, order="sorted" if sort_keys else None)
+    return msgspec.json.format(encoded, indent=2) if indent else encoded
+
+
+def _std_loads(data: Union[bytes, str]) -> Any:
+    # json.loads は bytes も受け付ける（UTF-8/16/32 を自動判定）
+    return json.loads(data)
+
+
+def _std_dumps(obj: Any, indent: bool = False, sort_keys: bool = False) -> bytes:
+    if indent:
+        text = json.dumps(obj, ensure_ascii=False, indent=2, sort_keys=sort_keys, default=_default)
+    else:
+        text = json.dumps(obj, ensure_ascii=False, separators=(",", ":"), sort_keys=sort_keys, default=_default)
+    return text.encode("utf-8")
+
+
+_BACKENDS = {
+    "orjson": (orjson, _orjson_loads, _orjson_dumps),
+    "msgspec": (msgspec, _msgspec_loads, _msgspec_dumps),
+    "json": (json, _std_loads, _std_dumps),
+}
+
+
+def _select_backend(name: Optional[str]) -> str:
+    if name:
+        name = name.strip().lower()
+        if name not in _BACKENDS:
+            raise ValueError(f"Unknown JSON backend: {name}")
+        if _BACKENDS[name][0] is None:
+            raise ImportError(f"JSON backend '{name}' is not installed")
+        return name
+    for candidate in ("orjson", "msgspec"):
+        if _BACKENDS[candidate][0] is not None:
+            return candidate
+    return "json"
+
+
+BACKEND = _select_backend(os.getenv("REPORT_JSON_BACKEND"))
+_loads: Callable[[Union[bytes, str]], Any] = _BACKENDS[BACKEND][1]
+_dumps: Callable[..., bytes] = _BACKENDS[BACKEND][2]
+
+
+def loads(data: Union[bytes, bytearray, memoryview, str]) -> Any:
+    """bytes / str の JSON をデコードする（bytes は str に変換せずそのまま渡す）。"""
+    if isinstance(data, (bytearray, memoryview)):
+        data = bytes(data)
+    return _loads(data)
+
+
+def load(fp: IO) -> Any:
+    """ファイルオブジェクトから読み込んでデコードする。テキストストリームの場合は下層のバイナリバッファを読む。"""
+    buffer = getattr(fp, "buffer", fp)
+    return loads(buffer.read())
+
+
+def dumps(obj: Any, indent: bool = False, sort_keys: bool = False) -> bytes:
+    """
+    UTF-8 の bytes にエンコードする。indent=True で 2 スペースインデント。
+    sort_keys=True ではキーを並べ替えた正規形になる（キャッシュキーの計算用）。
+    """
+    return _dumps(obj, indent=indent, sort_keys=sort_keys)
+
+
+def dumps_str(obj: Any, indent: bool = False) -> str:
+    """print 等で使うための str 版。"""
+    return dumps(obj, indent=indent).decode("utf-8")
@@ -2,9 +2,10 @@ import asyncio
 import sys
 import json
 import os
+import sqlite3
 import fitz  # PyMuPDF
 from openai import AsyncOpenAI
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 import argparse
 
 # Local imports
@@ -24,7 +25,10 @@ from schemas import (
     ResultJson,
     OutputWrapper
 )
-from smart_splitter import SmartSplitter
+from smart_splitter import SmartSplitter, SplitContexts
+from docx_text import DocxSource, read_docx_text
+import text_cache
+import token_budget
 
 # Initialize AsyncOpenAI Client
 client = AsyncOpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
@@ -100,6 +104,10 @@ class LabReportBuilder:
 
     def assemble_final_json(self, summary: str, units: list, experiments: list, refs: list) -> str:
         """全パーツを結合してDify互換JSONを出力"""
+        return self.assemble_final(summary, units, experiments, refs).model_dump_json(indent=2)
+
+    def assemble_final(self, summary: str, units: list, experiments: list, refs: list) -> RootResponse:
+        """全パーツを結合した RootResponse を返す（API はこれを直接 bytes にシリアライズする）"""
         
         # 1. 参考文献の整形
         ref_formatted = [
@@ -141,47 +149,155 @@ class LabReportBuilder:
             reference_list_formatted=ref_formatted
         )
 
-        return root.model_dump_json(indent=2)
+        return root
+
+def _open_pdf(source: DocxSource) -> "fitz.Document":
+    """パス、または bytes / バイナリストリームの PDF を開く（メモリ上の内容はディスクに書き出さない）。"""
+    if isinstance(source, (str, os.PathLike)):
+        return fitz.open(source)
+    if isinstance(source, memoryview):
+        source = source.tobytes()
+    elif hasattr(source, "read"):
+        source = source.read()
+    return fitz.open(stream=source, filetype="pdf")
+
 
-async def extract_text_from_pdf(pdf_path: str) -> str:
+async def extract_text_from_pdf(pdf_path: DocxSource) -> str:
     """Extracts text from PDF using PyMuPDF (fitz)."""
-    doc = fitz.open(pdf_path)
-    text = ""
-    for page in doc:
+    with _open_pdf(pdf_path) as doc:
         # Simple text extraction for now.
-        text += page.get_text()
-    return text
+        return "".join(page.get_text() for page in doc)
+
+
+def extract_text_from_docx(docx_path: DocxSource) -> str:
+    """Extracts body, table and footnote text from DOCX by reading the XML parts directly."""
+    return read_docx_text(docx_path)
+
+
+def extract_pdf_layout(pdf_path: DocxSource) -> List[Dict[str, Any]]:
+    """Extracts per-page text structure (blocks/lines/spans with font size and flags) using PyMuPDF."""
+    with _open_pdf(pdf_path) as doc:
+        return [page.get_text("dict", flags=fitz.TEXTFLAGS_TEXT) for page in doc]
+
+
+def detect_file_type(source: DocxSource, filename: Optional[str] = None) -> str:
+    """
+    "pdf" か "docx" を返す。パス（または filename）があれば拡張子で、なければ先頭のマジックバイトで判定する。
+    判定できない場合は ValueError。
+    """
+    name = filename if filename else (os.fspath(source) if isinstance(source, (str, os.PathLike)) else None)
+    if name:
+        lower = name.lower()
+        if lower.endswith(".pdf"):
+            return "pdf"
+        if lower.endswith(".docx"):
+            return "docx"
+        raise ValueError(f"Unsupported file type for analysis: {name}")
+    if hasattr(source, "read"):
+        head = source.read(4)
+        source.seek(0)
+    else:
+        head = bytes(source[:4])
+    if head.startswith(b"%PDF"):
+        return "pdf"
+    if head.startswith(b"PK"):
+        return "docx"
+    raise ValueError("Unsupported file type for analysis: unknown content")
+
+
+async def extract_contexts_from_file(path: DocxSource, filename: Optional[str] = None,
+                                     file_type: Optional[str] = None) -> SplitContexts:
+    """
+    Extracts and splits a PDF or DOCX in one step.
+    PDFs go through the layout-aware splitter (font size / bold headings); DOCX uses the text splitter.
+    path にはファイルパスのほか、アップロードされた内容（bytes / BytesIO）を渡せる。その場合の種類判定には filename を使う。
+    file_type（detect_file_type の結果）を渡すと判定し直さない。
+    """
+    splitter = SmartSplitter()
+    if (file_type or detect_file_type(path, filename)) == "pdf":
+        return splitter.split_layout(extract_pdf_layout(path))
+    return splitter.split(await extract_text_from_file(path, filename))
 
 
-def extract_text_from_docx(docx_path: str) -> str:
-    """Extracts text from DOCX using python-docx."""
-    from docx import Document  # lazy import to keep dependency local
+async def extract_contexts_cached(
+    path: DocxSource,
+    filename: Optional[str] = None,
+    sha256: Optional[str] = None,
+    db_path: Optional[str] = None,
+) -> Tuple[SplitContexts, text_cache.CacheEntry]:
+    """
+    extract_contexts_from_file の結果を、ファイル内容の SHA-256 をキーに text_cache へ保存・再利用する。
+    sha256 が分かっている場合（remote_file.fetch_file の結果など）は渡すと再計算しない。
+    キャッシュが無効（REPORT_TEXT_CACHE=0）または SQLite を開けない場合は毎回抽出する。
+    参照・登録に失敗した場合（ロック中・読み取り専用など）もキャッシュなしで続ける。
+    """
+    if sha256 is None:
+        sha256 = text_cache.sha256_of(path)
+    # 抽出はストリームを読み切るので、種類とサイズは先に求める
+    file_type = detect_file_type(path, filename)
+    size = text_cache.source_size(path)
+    cache = None
+    if text_cache.ENABLED:
+        try:
+            cache = text_cache.TextCache(db_path or text_cache.DEFAULT_DB_PATH)
+        except (OSError, sqlite3.Error) as e:
+            print(f"[WARN] Extracted text cache is unavailable: {e}", file=sys.stderr)
+    if cache is None:
+        contexts = await extract_contexts_from_file(path, filename, file_type)
+        return contexts, text_cache.CacheEntry(sha256, file_type, size, hit=False)
 
-    doc = Document(docx_path)
-    parts = [p.text for p in doc.paragraphs if p.text.strip()]
-    return "\n".join(parts)
+    with cache:
+        try:
+            cached = cache.get(sha256)
+        except sqlite3.Error as e:
+            print(f"[WARN] Extracted text cache lookup failed: {e}", file=sys.stderr)
+            cached = None
+        if cached is not None:
+            print(f"[DEBUG] Extracted text cache hit: {sha256[:12]}", file=sys.stderr)
+            return cached
+        contexts = await extract_contexts_from_file(path, filename, file_type)
+        try:
+            return contexts, cache.put(sha256, file_type, size, contexts)
+        except sqlite3.Error as e:
+            print(f"[WARN] Failed to store extracted text in the cache: {e}", file=sys.stderr)
+            return contexts, text_cache.CacheEntry(sha256, file_type, size, hit=False)
 
 
-async def extract_text_from_file(path: str) -> str:
+async def extract_text_from_file(path: DocxSource, filename: Optional[str] = None) -> str:
     """
     Unified entry: PDF or DOCX を扱う。
-    拡張子で判定し、未知の拡張子の場合はエラーを投げる。
+    パスは拡張子で、メモリ上の内容は filename の拡張子（なければマジックバイト）で判定し、
+    未知の種類の場合はエラーを投げる。
     """
-    lower = path.lower()
-    if lower.endswith(".pdf"):
+    if detect_file_type(path, filename) == "pdf":
         return await extract_text_from_pdf(path)
-    if lower.endswith(".docx"):
-        return extract_text_from_docx(path)
-    raise ValueError(f"Unsupported file type for analysis: {path}")
+    return extract_text_from_docx(path)
+
+# Prompts are built in one place so that --plan counts exactly what the tasks send.
+
+def summary_messages(text: str) -> List[Dict[str, str]]:
+    return [
+        {"role": "system", "content": "あなたは優秀な理系学生です。実験レポートの「まとめ」を作成してください。"},
+        {"role": "user", "content": f"以下の実験テキストから、300字程度の「まとめ」を作成してください。文体は「だ・である」調、過去形としてください。目的・理論・手順・結論を簡潔にまとめてください。\n\n{text}"}
+    ]
+
+def methods_messages(text: str) -> List[Dict[str, str]]:
+    return [
+        {"role": "system", "content": "あなたは優秀な理系学生です。実験レポートの「実験方法」セクションから、実験手順を構造化して抽出してください。"},
+        {"role": "user", "content": f"以下の「実験方法」テキストから、実験項目を抽出してください。\n各項目の『階層（idx, subidx）』、『名称(name)』、『実験タイプ（type: 測定/計算/分析）』、『条件（condition: IB=20μAなど）』のみを抽出してください。\n図表番号やDescriptionは生成しないでください。\n\n{text}"}
+    ]
+
+def discussion_messages(text: str) -> List[Dict[str, str]]:
+    return [
+        {"role": "system", "content": "あなたは優秀な理系学生です。実験レポートの「考察」セクションを正規化してください。"},
+        {"role": "user", "content": f"以下の「考察」テキストを正規化・構造化してください。\n課題（6.1, 6.2...）ごとに分割し、文中の『考察せよ』等の命令形を『考察する』等の常体・能動態に書き換えてください(discussion_active)。\n\n{text}"}
+    ]
 
 async def generate_summary(text: str) -> SummaryResult:
     """Task C: 全体要約 (Summary Generation)"""
     completion = await client.beta.chat.completions.parse(
         model=MODEL,
-        messages=[
-            {"role": "system", "content": "あなたは優秀な理系学生です。実験レポートの「まとめ」を作成してください。"},
-            {"role": "user", "content": f"以下の実験テキストから、300字程度の「まとめ」を作成してください。文体は「だ・である」調、過去形としてください。目的・理論・手順・結論を簡潔にまとめてください。\n\n{text}"}
-        ],
+        messages=summary_messages(text),
         response_format=SummaryResult,
     )
     return completion.choices[0].message.parsed
@@ -190,10 +306,7 @@ async def extract_methods(text: str) -> MethodExtractionResult:
     """Task A: 実験構造の抽出 (Structure Extraction)"""
     completion = await client.beta.chat.completions.parse(
         model=MODEL,
-        messages=[
-            {"role": "system", "content": "あなたは優秀な理系学生です。実験レポートの「実験方法」セクションから、実験手順を構造化して抽出してください。"},
-            {"role": "user", "content": f"以下の「実験方法」テキストから、実験項目を抽出してください。\n各項目の『階層（idx, subidx）』、『名称(name)』、『実験タイプ（type: 測定/計算/分析）』、『条件（condition: IB=20μAなど）』のみを抽出してください。\n図表番号やDescriptionは生成しないでください。\n\n{text}"}
-        ],
+        messages=methods_messages(text),
         response_format=MethodExtractionResult,
     )
     return completion.choices[0].message.parsed
@@ -202,17 +315,102 @@ async def normalize_discussion(text: str) -> DiscussionResult:
     """Task B: 考察課題の正規化 (Discussion Normalization)"""
     completion = await client.beta.chat.completions.parse(
         model=MODEL,
-        messages=[
-            {"role": "system", "content": "あなたは優秀な理系学生です。実験レポートの「考察」セクションを正規化してください。"},
-            {"role": "user", "content": f"以下の「考察」テキストを正規化・構造化してください。\n課題（6.1, 6.2...）ごとに分割し、文中の『考察せよ』等の命令形を『考察する』等の常体・能動態に書き換えてください(discussion_active)。\n\n{text}"}
-        ],
+        messages=discussion_messages(text),
         response_format=DiscussionResult,
     )
     return completion.choices[0].message.parsed
 
+# name -> (SplitContexts の属性, text_cache のトークン数の部分名, プロンプト, 応答の型)
+TASKS = {
+    "summary": ("full_text", "full", summary_messages, SummaryResult),
+    "methods": ("method_text", "method", methods_messages, MethodExtractionResult),
+    "discussion": ("discussion_text", "discussion", discussion_messages, DiscussionResult),
+}
+
+def plan_workflow(
+    contexts: SplitContexts,
+    budget: Optional[token_budget.Budget] = None,
+    token_counts: Optional[Dict[str, Any]] = None,
+) -> token_budget.WorkflowPlan:
+    """
+    3つのタスクの入力トークン数・料金・所要時間を見積もる（API は呼ばない）。
+    token_counts に text_cache.TextCache.token_counts の結果を渡すと、テキスト部分は数え直さない。
+    """
+    budget = budget or token_budget.Budget.from_env()
+    counts = None
+    # tiktoken を使えない環境では text_cache と同じく "approx" で数える
+    encoding = text_cache.count_tokens("", token_budget.encoding_for(MODEL))[0]
+    if token_counts and token_counts.get("encoding") == encoding:
+        counts = token_counts["tokens"]
+    results = []
+    for name, (attr, part, build_messages, response_format) in TASKS.items():
+        results.append(token_budget.plan_task(
+            name, getattr(contexts, attr), build_messages, response_format, MODEL, budget,
+            text_tokens=counts.get(part) if counts else None,
+            reduce_output=name == "summary",
+        ))
+    return token_budget.finish_plan(MODEL, results, budget)
+
+def cached_token_counts(entry: text_cache.CacheEntry, db_path: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    extract_contexts_cached で登録したファイルの、MODEL のエンコーディングでのトークン数（キャッシュ無効時は None）。
+    db_path には extract_contexts_cached に渡したものと同じ値を渡す。
+    """
+    if not text_cache.ENABLED:
+        return None
+    try:
+        with text_cache.TextCache(db_path or text_cache.DEFAULT_DB_PATH) as cache:
+            return cache.token_counts(entry.sha256, model=MODEL)
+    except (KeyError, OSError, sqlite3.Error) as e:
+        print(f"[WARN] Cached token counts are unavailable: {e}", file=sys.stderr)
+        return None
+
+async def _run_summary(task: token_budget.TaskPlan, text: str) -> SummaryResult:
+    if not task.chunked:
+        return await generate_summary(text)
+    # 分割した各チャンクを要約し、その要約をまとめ直す
+    partial = await asyncio.gather(*(generate_summary(chunk) for chunk in task.chunks))
+    return await generate_summary("\n\n".join(res.summary for res in partial))
+
+async def _run_methods(task: token_budget.TaskPlan, text: str) -> MethodExtractionResult:
+    if not task.chunked:
+        return await extract_methods(text)
+    partial = await asyncio.gather(*(extract_methods(chunk) for chunk in task.chunks))
+    return MethodExtractionResult(experiments=[exp for res in partial for exp in res.experiments])
+
+async def _run_discussion(task: token_budget.TaskPlan, text: str) -> DiscussionResult:
+    if not task.chunked:
+        return await normalize_discussion(text)
+    partial = await asyncio.gather(*(normalize_discussion(chunk) for chunk in task.chunks))
+    references = []
+    for res in partial:
+        for ref in res.references:
+            if ref not in references:
+                references.append(ref)
+    return DiscussionResult(units=[unit for res in partial for unit in res.units], references=references)
+
+async def run_tasks(contexts: SplitContexts, plan: Optional[token_budget.WorkflowPlan] = None):
+    """
+    予算を確認してから3つのタスクを並行に実行し、(summary, methods, discussion) の結果を返す。
+    予算を超える場合は API を呼ばずに token_budget.BudgetExceeded を投げる。
+    """
+    plan = plan or plan_workflow(contexts)
+    plan.enforce()
+    return await asyncio.gather(
+        _run_summary(plan.task("summary"), contexts.full_text),
+        _run_methods(plan.task("methods"), contexts.method_text),
+        _run_discussion(plan.task("discussion"), contexts.discussion_text),
+    )
+
 async def main():
     parser = argparse.ArgumentParser(description="Optimized Document Processing Workflow (PDF/DOCX)")
     parser.add_argument("file_path", help="Path to the PDF or DOCX file")
+    parser.add_argument("--plan", action="store_true",
+                        help="Print projected tokens, cost and latency per task without calling the API")
+    parser.add_argument("--max-input-tokens", type=int, help="Per-call input token limit (OPENAI_MAX_INPUT_TOKENS)")
+    parser.add_argument("--max-cost", type=float, help="Estimated cost limit in USD (OPENAI_MAX_COST_USD)")
+    parser.add_argument("--budget-action", choices=token_budget.BUDGET_ACTIONS,
+                        help="What to do when a task exceeds the input limit (OPENAI_BUDGET_ACTION)")
     args = parser.parse_args()
     
     if not os.path.exists(args.file_path):
@@ -220,23 +418,24 @@ async def main():
         sys.exit(1)
 
     try:
-        # 1. Extract Text
-        full_text = await extract_text_from_file(args.file_path)
-        
-        # 2. Smart Split
-        splitter = SmartSplitter()
-        contexts = splitter.split(full_text)
+        # 1. Extract Text & 2. Smart Split (layout-aware for PDF)
+        contexts, entry = await extract_contexts_cached(args.file_path)
+
+        # Pre-flight: token counts, cost and latency per task, checked against the budget
+        budget = token_budget.Budget.from_env()
+        if args.max_input_tokens is not None:
+            budget.max_input_tokens = args.max_input_tokens
+        if args.max_cost is not None:
+            budget.max_cost_usd = args.max_cost
+        if args.budget_action:
+            budget.action = args.budget_action
+        plan = plan_workflow(contexts, budget, cached_token_counts(entry))
+        if args.plan:
+            print(json.dumps(plan.to_dict(), ensure_ascii=False, indent=2))
+            sys.exit(0 if plan.within_budget else 2)
         
         # 3. Parallel Execution (Async LLM)
-        task_summary = generate_summary(contexts.full_text)
-        task_methods = extract_methods(contexts.method_text)
-        task_discussion = normalize_discussion(contexts.discussion_text)
-        
-        summary_res, methods_res, discussion_res = await asyncio.gather(
-            task_summary,
-            task_methods,
-            task_discussion
-        )
+        summary_res, methods_res, discussion_res = await run_tasks(contexts, plan)
         
         # 4. Deterministic Post-Processing (Phase 3 & 4)
         builder = LabReportBuilder(chapter=5)
@@ -1,25 +1,38 @@
 import sys
 import os
+import re
 import json
 import asyncio
-from docx import Document
+from typing import Any, Dict, List, Optional, Tuple
 from openai import AsyncOpenAI
 
 # Local imports
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-from past_report_schemas import ReportStructureHint
+from past_report_schemas import ReportStructureHint, SectionHint, BlockHint
+from extract_experiments_from_docx import extract_experiments_from_docx
+from docx_text import DocxSource, read_docx_text as _read_docx_text_fast
 
 # Initialize OpenAI Client
 client = AsyncOpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
 MODEL = os.environ.get("OPENAI_MODEL", "gpt-4o")
 
-def read_docx_text(docx_path: str) -> str:
-    doc = Document(docx_path)
-    full_text = []
-    for para in doc.paragraphs:
-        if para.text.strip():
-            full_text.append(para.text)
-    return "\n".join(full_text)
+# ルールベース抽出の信頼度がこの値以上なら LLM を呼ばない
+RULE_CONFIDENCE_THRESHOLD = float(os.environ.get("PAST_REPORT_RULE_CONFIDENCE", "0.8"))
+# この値以上なら失敗した節だけを LLM に渡し、未満なら全文を LLM で解析する
+RULE_PARTIAL_THRESHOLD = float(os.environ.get("PAST_REPORT_RULE_PARTIAL_CONFIDENCE", "0.5"))
+
+_LABEL_NUMBER_PATTERN = re.compile(r"^[表図]\s*(\d+(?:\.\d+)*)")
+# 見出し行: 番号の直後に（空白を挟んで）数字以外で始まる題目が続き、タブ（表の行）を含まない行。
+# 「1.5\t2.0」のような表の行や「1.5 V のとき…。」のような本文の行を見出しとみなさない。
+_SECTION_LINE_PATTERN = re.compile(r"^(\d+\.\d+)(?![\d.])[ \u3000]*[^\s\d.．,，、。][^\t]*$")
+_CHAPTER_LINE_PATTERN = re.compile(r"^\d+[.．](?![\d.])[ \u3000]*[^\s\d.．,，、。][^\t]*$")
+_HEADING_MAX_LENGTH = 80
+# 「12.5 mA」「2.0 V」のように番号の後が単位で始まる行は測定値とみなす
+_UNIT_TITLE_PATTERN = re.compile(r"^[\d.]+[ \u3000]*(?:[kMmμun]?(?:V|A|Hz|Ω|W|F|H|s|m)|dB|℃|%)(?!\w)")
+
+def read_docx_text(docx_path: DocxSource) -> str:
+    """本文・表・脚注のテキストを読み順で返す（docx_text.read_docx_text を参照）。パスのほか bytes / BytesIO も受け付ける。"""
+    return _read_docx_text_fast(docx_path)
 
 async def extract_hint_with_llm(text: str) -> ReportStructureHint:
     """
@@ -51,6 +64,145 @@ async def extract_hint_with_llm(text: str) -> ReportStructureHint:
     
     return completion.choices[0].message.parsed
 
+def _section_title(section: str, name: str) -> str:
+    """「1.1　反転増幅回路の…」から節番号を除いたタイトルを返す。"""
+    title = name[len(section):] if name.startswith(section) else name
+    return title.strip()
+
+
+def rule_result_to_hint(result: Dict[str, Any]) -> ReportStructureHint:
+    """
+    extract_experiments_from_docx の結果を ReportStructureHint に変換する。
+    小項目の図表は所属する節の blocks に、文書中の出現順のまままとめる。
+    """
+    sections: Dict[str, SectionHint] = {}
+    for ex in result.get("experiments") or []:
+        number = ex.get("section", "")
+        sec = sections.get(number)
+        if sec is None:
+            sec = SectionHint(section_number=number, title="", blocks=[])
+            sections[number] = sec
+        if ex.get("subidx") is None and not sec.title:
+            sec.title = _section_title(number, ex.get("name", ""))
+        blocks = ex.get("blocks")
+        if blocks is None:
+            # blocks を持たない結果は出現順が分からないので表 → 図の順
+            blocks = [dict(item, type="table") for item in ex.get("tables") or []]
+            blocks += [dict(item, type="figure") for item in ex.get("figures") or []]
+        for b in blocks:
+            sec.blocks.append(BlockHint(type=b["type"], label=b["label"], caption=b["caption"]))
+    return ReportStructureHint(sections=list(sections.values()))
+
+
+def _labels_are_continuous(section: str, labels: List[str]) -> bool:
+    """
+    節内の表（または図）ラベルが「表{節}.1, 表{節}.2, ...」と重複・欠番なく並んでいるか。
+    """
+    expected = 1
+    for label in labels:
+        m = _LABEL_NUMBER_PATTERN.match(label)
+        if not m:
+            return False
+        number = m.group(1)
+        prefix, _, last = number.rpartition(".")
+        if prefix != section or not last.isdigit() or int(last) != expected:
+            return False
+        expected += 1
+    return True
+
+
+def score_rule_result(hint: ReportStructureHint, chapter: Optional[int]) -> Tuple[float, List[str]]:
+    """
+    ルールベース抽出結果の信頼度 (0.0〜1.0) と、信頼できない節番号の一覧を返す。
+
+    節ごとに次をすべて満たせば合格とし、合格した節の割合を信頼度とする。
+    - 表または図が1つ以上ある
+    - 表・図それぞれのラベルが節番号から始まり、1 から連番になっている
+    章番号（「◯.実験結果」）が検出できなかった場合は信頼度を半分にする。
+    """
+    if not hint.sections:
+        return 0.0, []
+
+    failed: List[str] = []
+    for sec in hint.sections:
+        tables = [b.label for b in sec.blocks if b.type == "table"]
+        figures = [b.label for b in sec.blocks if b.type == "figure"]
+        ok = (
+            bool(sec.blocks)
+            and _labels_are_continuous(sec.section_number, tables)
+            and _labels_are_continuous(sec.section_number, figures)
+        )
+        if not ok:
+            failed.append(sec.section_number)
+
+    score = 1.0 - len(failed) / len(hint.sections)
+    if chapter is None:
+        score *= 0.5
+    return score, failed
+
+
+def _slice_sections_text(text: str, section_numbers: List[str]) -> str:
+    """
+    read_docx_text の結果から、指定した節の見出し行から次の節/章見出しの手前までを抜き出す。
+    表の行（タブ区切り）、「。」で終わる文、番号の後が単位で始まる行、対象外の章の番号は見出しとみなさない。
+    """
+    wanted = set(section_numbers)
+    chapters = {number.split(".")[0] for number in wanted}
+    picked: List[str] = []
+    inside = False
+    for line in text.split("\n"):
+        heading = (
+            len(line) <= _HEADING_MAX_LENGTH
+            and not line.rstrip().endswith("。")
+            and not _UNIT_TITLE_PATTERN.match(line)
+        )
+        m = _SECTION_LINE_PATTERN.match(line) if heading else None
+        # 対象の章に属さない番号（「12.5 …」など）は節見出しとみなさない
+        if m and m.group(1).split(".")[0] in chapters:
+            inside = m.group(1) in wanted
+        elif heading and not m and _CHAPTER_LINE_PATTERN.match(line):
+            inside = False
+        if inside:
+            picked.append(line)
+    return "\n".join(picked)
+
+
+async def extract_hint_hybrid(docx_path: DocxSource, text: Optional[str] = None) -> ReportStructureHint:
+    """
+    ルールベース抽出（extract_experiments_from_docx）を先に実行し、信頼度に応じて LLM を併用する。
+    - 信頼度 >= RULE_CONFIDENCE_THRESHOLD: ルールベースの結果をそのまま返す（LLM 呼び出しなし）
+    - 信頼度 >= RULE_PARTIAL_THRESHOLD: 失敗した節のテキストだけを LLM に渡し、その節を置き換える
+    - それ以外: 従来どおり全文を LLM で解析する
+    text を省略した場合、LLM が必要になった時点で read_docx_text で読み込む。
+    """
+    try:
+        result = extract_experiments_from_docx(docx_path)
+    except Exception as e:
+        print(f"[WARN] Rule-based extraction failed, falling back to LLM: {e}", file=sys.stderr)
+        result = {"chapter": None, "experiments": []}
+
+    rule_hint = rule_result_to_hint(result)
+    score, failed = score_rule_result(rule_hint, result.get("chapter"))
+    print(f"[DEBUG] Rule-based confidence {score:.2f}, failed sections: {failed}", file=sys.stderr)
+
+    if score >= RULE_CONFIDENCE_THRESHOLD:
+        return rule_hint
+
+    if text is None:
+        text = read_docx_text(docx_path)
+
+    if score < RULE_PARTIAL_THRESHOLD:
+        return await extract_hint_with_llm(text)
+
+    llm_hint = await extract_hint_with_llm(_slice_sections_text(text, failed))
+    llm_sections = {sec.section_number: sec for sec in llm_hint.sections}
+    merged = [
+        llm_sections.get(sec.section_number, sec) if sec.section_number in failed else sec
+        for sec in rule_hint.sections
+    ]
+    return ReportStructureHint(sections=merged)
+
+
 async def main_async():
     if len(sys.argv) < 2:
         print("Usage: python3 past_report_workflow.py <docx_path>")
@@ -59,8 +211,7 @@ async def main_async():
     docx_path = sys.argv[1]
     
     try:
-        text = read_docx_text(docx_path)
-        structure = await extract_hint_with_llm(text)
+        structure = await extract_hint_hybrid(docx_path)
         print(json.dumps(structure.model_dump(), indent=2, ensure_ascii=False))
     except Exception as e:
         print(json.dumps({"error": str(e)}), file=sys.stderr)
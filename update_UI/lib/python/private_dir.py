@@ -0,0 +1,33 @@
+"""
+キャッシュ用の非公開ディレクトリ。
+
+共有の一時ディレクトリ（/tmp など）に置くキャッシュは、他のローカルユーザーに読まれたり、
+先にディレクトリを作られて中身（レポート・抽出テキスト・Jinja のバイトコード）を仕込まれたり
+してはいけない。ここで作る・確認するディレクトリは、実行ユーザーの所有でパーミッション 0700 のもの。
+"""
+import getpass
+import os
+import stat
+import tempfile
+
+
+def user_temp_dir(name: str) -> str:
+    """一時ディレクトリの下の、ユーザーごとのディレクトリのパス（例: /tmp/docxtpl-render-cache-1000）。"""
+    uid = os.geteuid() if hasattr(os, "geteuid") else getpass.getuser()
+    return os.path.join(tempfile.gettempdir(), f"{name}-{uid}")
+
+
+def ensure_private_dir(path: str) -> str:
+    """
+    path を 0700 で作り、path を返す。既にある場合は実行ユーザーの所有のディレクトリであることを確認し、
+    グループ・他ユーザーの権限があれば外す。他のユーザーの所有・シンボリックリンクなら OSError。
+    """
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    st = os.lstat(path)
+    if not stat.S_ISDIR(st.st_mode):
+        raise OSError(f"cache directory is not a directory: {path}")
+    if hasattr(os, "geteuid") and st.st_uid != os.geteuid():
+        raise OSError(f"cache directory is owned by another user: {path}")
+    if stat.S_IMODE(st.st_mode) & 0o077:
+        os.chmod(path, 0o700)
+    return path
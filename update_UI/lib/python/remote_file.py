@@ -0,0 +1,133 @@
+"""
+file_url で渡されたアップロード（ストレージバケットのオブジェクト）の取得。
+
+- チャンク単位で読み込み、上限サイズ（REPORT_DOWNLOAD_MAX_MB）を超えた時点で打ち切る
+- 接続・読み込みのタイムアウト（REPORT_DOWNLOAD_CONNECT_TIMEOUT / REPORT_DOWNLOAD_READ_TIMEOUT 秒）
+- ダウンロードしながら SHA-256 を計算し、抽出結果や LLM 結果のキャッシュをパース前に引けるようにする
+- urllib3 があればモジュール単位の PoolManager を使い、ウォームな関数呼び出し間で接続を再利用する
+  （なければ urllib.request で都度接続する）
+"""
+import hashlib
+import os
+import urllib.request
+from dataclasses import dataclass
+from typing import Optional
+from urllib.parse import urlsplit
+
+try:
+    import urllib3  # type: ignore
+except ImportError:  # pragma: no cover
+    urllib3 = None
+
+MAX_DOWNLOAD_BYTES = int(float(os.getenv("REPORT_DOWNLOAD_MAX_MB", "50")) * 1024 * 1024)
+CONNECT_TIMEOUT = float(os.getenv("REPORT_DOWNLOAD_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("REPORT_DOWNLOAD_READ_TIMEOUT", "30"))
+CHUNK_SIZE = 256 * 1024
+
+_pool = None
+
+
+class DownloadError(ValueError):
+    """
+    file_url を取得できなかった（取得先の HTTP エラー、接続エラー、タイムアウトなど）。
+    status は API ハンドラが返す HTTP ステータス（取得先の失敗は 502 Bad Gateway）。
+    """
+    status = 502
+
+
+class InvalidFileUrl(DownloadError):
+    """file_url が http/https の URL ではない。"""
+    status = 400
+
+
+class DownloadTooLarge(DownloadError):
+    """ファイルが上限サイズを超えている。"""
+    status = 413
+
+
+@dataclass
+class FetchedFile:
+    data: bytes
+    sha256: str
+    content_type: Optional[str] = None
+
+    @property
+    def size(self) -> int:
+        return len(self.data)
+
+
+def _get_pool():
+    """プロセス内で共有する PoolManager（ウォームスタート時は前回の接続を再利用する）。"""
+    global _pool
+    if _pool is None:
+        _pool = urllib3.PoolManager(
+            num_pools=4,
+            maxsize=4,
+            retries=urllib3.Retry(total=2, connect=2, read=0, redirect=3, backoff_factor=0.2),
+            timeout=urllib3.Timeout(connect=CONNECT_TIMEOUT, read=READ_TIMEOUT),
+        )
+    return _pool
+
+
+def _check_length(header: Optional[str], max_bytes: int) -> None:
+    if header and header.isdigit() and int(header) > max_bytes:
+        raise DownloadTooLarge(f"File is too large: {header} bytes (limit {max_bytes})")
+
+
+def _read_chunks(read, max_bytes: int, chunk_size: int) -> FetchedFile:
+    digest = hashlib.sha256()
+    chunks = []
+    total = 0
+    while True:
+        chunk = read(chunk_size)
+        if not chunk:
+            break
+        total += len(chunk)
+        if total > max_bytes:
+            raise DownloadTooLarge(f"File is too large: more than {max_bytes} bytes")
+        digest.update(chunk)
+        chunks.append(chunk)
+    return FetchedFile(b"".join(chunks), digest.hexdigest())
+
+
+def fetch_file(url: str, max_bytes: Optional[int] = None, chunk_size: int = CHUNK_SIZE) -> FetchedFile:
+    """
+    url の内容をメモリに読み込み、SHA-256 とともに返す（一時ファイルは作らない）。
+    max_bytes を省略した場合は MAX_DOWNLOAD_BYTES。
+    http/https 以外（InvalidFileUrl）、HTTP エラー・接続エラー・タイムアウト、上限超過（DownloadTooLarge）は
+    DownloadError（ValueError のサブクラス）。
+    """
+    if max_bytes is None:
+        max_bytes = MAX_DOWNLOAD_BYTES
+    if urlsplit(url).scheme not in ("http", "https"):
+        raise InvalidFileUrl(f"Unsupported file_url scheme: {url}")
+
+    if urllib3 is None:
+        try:
+            with urllib.request.urlopen(url, timeout=max(CONNECT_TIMEOUT, READ_TIMEOUT)) as response:
+                _check_length(response.headers.get("Content-Length"), max_bytes)
+                fetched = _read_chunks(response.read, max_bytes, chunk_size)
+                fetched.content_type = response.headers.get("Content-Type")
+                return fetched
+        except OSError as e:  # URLError / HTTPError / タイムアウト
+            raise DownloadError(f"Failed to download file_url: {e}") from e
+
+    try:
+        response = _get_pool().request("GET", url, preload_content=False)
+    except urllib3.exceptions.HTTPError as e:
+        raise DownloadError(f"Failed to download file_url: {e}") from e
+    try:
+        if response.status >= 400:
+            raise DownloadError(f"Failed to download file_url: HTTP {response.status}")
+        _check_length(response.headers.get("Content-Length"), max_bytes)
+        fetched = _read_chunks(response.read, max_bytes, chunk_size)
+        fetched.content_type = response.headers.get("Content-Type")
+        return fetched
+    except BaseException as e:
+        # 読み残しのある接続はプールに戻さず閉じる
+        response.close()
+        if isinstance(e, urllib3.exceptions.HTTPError):
+            raise DownloadError(f"Failed to download file_url: {e}") from e
+        raise
+    finally:
+        response.release_conn()
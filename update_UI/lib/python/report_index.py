@@ -0,0 +1,337 @@
+import sys
+import os
+import json
+import time
+import sqlite3
+import argparse
+from typing import Dict, Any, List, Optional, Tuple
+
+# ローカルモジュール（正規表現ベースの構造抽出）を利用
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from extract_experiments_from_docx import (  # type: ignore
+    extract_experiments_from_docx,
+    _iter_docx_files,
+    _file_sha256,
+)
+
+
+DEFAULT_DB_PATH = os.environ.get("REPORT_INDEX_DB", "report_index.sqlite3")
+
+# PRAGMA user_version に記録するスキーマの版。
+# 2: blocks.position を種別ごとの順番から、実験内での表・図の出現順に変更
+_SCHEMA_VERSION = 2
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS reports (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    sha256 TEXT NOT NULL,
+    mtime INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    chapter INTEGER,
+    indexed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS reports_sha256 ON reports(sha256);
+
+CREATE TABLE IF NOT EXISTS experiments (
+    id INTEGER PRIMARY KEY,
+    report_id INTEGER NOT NULL REFERENCES reports(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    section TEXT NOT NULL,
+    idx INTEGER,
+    subidx INTEGER,
+    name TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS experiments_report ON experiments(report_id);
+
+CREATE TABLE IF NOT EXISTS blocks (
+    id INTEGER PRIMARY KEY,
+    report_id INTEGER NOT NULL REFERENCES reports(id) ON DELETE CASCADE,
+    experiment_id INTEGER NOT NULL REFERENCES experiments(id) ON DELETE CASCADE,
+    kind TEXT NOT NULL CHECK (kind IN ('table', 'figure')),
+    position INTEGER NOT NULL,
+    label TEXT NOT NULL,
+    caption TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS blocks_report ON blocks(report_id);
+CREATE INDEX IF NOT EXISTS blocks_label ON blocks(label);
+"""
+
+# 日本語キャプションは空白で区切られないため trigram トークナイザを使う（SQLite 3.34+）。
+_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS blocks_fts USING fts5(
+    caption, content='blocks', content_rowid='id', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS blocks_ai AFTER INSERT ON blocks BEGIN
+    INSERT INTO blocks_fts(rowid, caption) VALUES (new.id, new.caption);
+END;
+CREATE TRIGGER IF NOT EXISTS blocks_ad AFTER DELETE ON blocks BEGIN
+    INSERT INTO blocks_fts(blocks_fts, rowid, caption) VALUES ('delete', old.id, old.caption);
+END;
+"""
+
+# 旧版のインデックスは作り直す（DOCX から再抽出できるので移行はしない）
+_DROP_SCHEMA = """
+DROP TABLE IF EXISTS blocks_fts;
+DROP TABLE IF EXISTS blocks;
+DROP TABLE IF EXISTS experiments;
+DROP TABLE IF EXISTS reports;
+"""
+
+
+class ReportIndex:
+    """
+    過去レポートの構造（章・節・小項目・表/図ラベル・キャプション）を保持する SQLite インデックス。
+    extract_experiments_from_docx の出力をそのまま格納し、ファイルハッシュで差分更新する。
+
+    使用例:
+        with ReportIndex("report_index.sqlite3") as index:
+            index.update("archive/", recursive=True)
+            index.find_reports("周波数特性", kind="figure")
+    """
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] < _SCHEMA_VERSION:
+            self.conn.executescript(_DROP_SCHEMA)
+        self.conn.executescript(_SCHEMA)
+        try:
+            self.conn.executescript(_FTS_SCHEMA)
+            self.has_fts = True
+        except sqlite3.OperationalError:
+            # FTS5 / trigram が使えない SQLite では LIKE 検索にフォールバックする
+            self.has_fts = False
+        self.conn.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
+        self.conn.commit()
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def __enter__(self) -> "ReportIndex":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    # --- 更新 ---
+
+    def _needs_update(self, path: str) -> Tuple[bool, Dict[str, Any]]:
+        """
+        既存の行と mtime/size/sha256 を比較する。mtime/size が一致すればハッシュ計算は省略する。
+        戻り値は (再抽出が必要か, 最新の mtime/size/sha256)。
+        """
+        st = os.stat(path)
+        current: Dict[str, Any] = {"mtime": st.st_mtime_ns, "size": st.st_size}
+        row = self.conn.execute(
+            "SELECT sha256, mtime, size FROM reports WHERE path = ?", (path,)
+        ).fetchone()
+        if row and row["mtime"] == current["mtime"] and row["size"] == current["size"]:
+            current["sha256"] = row["sha256"]
+            return False, current
+        current["sha256"] = _file_sha256(path)
+        if row and row["sha256"] == current["sha256"]:
+            return False, current
+        return True, current
+
+    def add_report(self, path: str, result: Dict[str, Any], stat: Dict[str, Any]) -> int:
+        """
+        extract_experiments_from_docx の結果を1レポート分登録する（既存行は置き換える）。
+        表・図は blocks の出現順で格納する。blocks を持たない結果は表 → 図の順とする。
+        """
+        path = os.path.abspath(path)
+        with self.conn:
+            self.conn.execute("DELETE FROM reports WHERE path = ?", (path,))
+            cur = self.conn.execute(
+                "INSERT INTO reports (path, sha256, mtime, size, chapter, indexed_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (path, stat["sha256"], stat["mtime"], stat["size"], result.get("chapter"), time.time()),
+            )
+            report_id = cur.lastrowid
+            for pos, ex in enumerate(result.get("experiments") or []):
+                cur = self.conn.execute(
+                    "INSERT INTO experiments (report_id, position, section, idx, subidx, name) VALUES (?, ?, ?, ?, ?, ?)",
+                    (report_id, pos, ex.get("section", ""), ex.get("idx"), ex.get("subidx"), ex.get("name", "")),
+                )
+                experiment_id = cur.lastrowid
+                blocks = ex.get("blocks")
+                if blocks is None:
+                    blocks = [dict(item, type="table") for item in ex.get("tables") or []]
+                    blocks += [dict(item, type="figure") for item in ex.get("figures") or []]
+                rows = [
+                    (report_id, experiment_id, b["type"], i, b.get("label", ""), b.get("caption", ""))
+                    for i, b in enumerate(blocks)
+                ]
+                self.conn.executemany(
+                    "INSERT INTO blocks (report_id, experiment_id, kind, position, label, caption) VALUES (?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+        return report_id
+
+    def update(self, path: str, recursive: bool = False, prune: bool = True) -> Dict[str, int]:
+        """
+        ファイル or ディレクトリをインデックスに反映する。
+        変更のない（mtime/size またはハッシュが一致する）DOCX は再抽出しない。
+        prune=True の場合、ディレクトリ配下から消えたファイルの行を削除する。
+        """
+        if os.path.isdir(path):
+            files = [os.path.abspath(p) for p in _iter_docx_files(path, recursive)]
+        else:
+            files = [os.path.abspath(path)]
+
+        stats = {"indexed": 0, "unchanged": 0, "failed": 0, "removed": 0}
+        for full in files:
+            needs_update, current = self._needs_update(full)
+            if not needs_update:
+                # ハッシュ一致で mtime だけ変わった場合は次回のために更新しておく
+                with self.conn:
+                    self.conn.execute(
+                        "UPDATE reports SET mtime = ?, size = ? WHERE path = ?",
+                        (current["mtime"], current["size"], full),
+                    )
+                stats["unchanged"] += 1
+                continue
+            try:
+                result = extract_experiments_from_docx(full)
+            except Exception as e:
+                print(f"[WARN] Failed to index {full}: {e}", file=sys.stderr)
+                stats["failed"] += 1
+                continue
+            self.add_report(full, result, current)
+            stats["indexed"] += 1
+
+        if prune and os.path.isdir(path):
+            root = os.path.join(os.path.abspath(path), "")
+            keep = set(files)
+            rows = self.conn.execute(
+                "SELECT path FROM reports WHERE substr(path, 1, ?) = ?", (len(root), root)
+            ).fetchall()
+            stale = [r["path"] for r in rows if r["path"] not in keep]
+            if not recursive:
+                stale = [p for p in stale if os.path.dirname(p) == os.path.dirname(root)]
+            with self.conn:
+                self.conn.executemany("DELETE FROM reports WHERE path = ?", [(p,) for p in stale])
+            stats["removed"] = len(stale)
+        return stats
+
+    # --- 参照 ---
+
+    def get_report(self, path: str) -> Optional[Dict[str, Any]]:
+        """
+        登録済みレポートを extract_experiments_from_docx と同じ形式で返す。未登録なら None。
+        """
+        row = self.conn.execute(
+            "SELECT id, chapter FROM reports WHERE path = ?", (os.path.abspath(path),)
+        ).fetchone()
+        if not row:
+            return None
+
+        experiments: List[Dict[str, Any]] = []
+        by_id: Dict[int, Dict[str, Any]] = {}
+        for ex in self.conn.execute(
+            "SELECT id, section, idx, subidx, name FROM experiments WHERE report_id = ? ORDER BY position",
+            (row["id"],),
+        ):
+            item = {
+                "section": ex["section"],
+                "idx": ex["idx"],
+                "subidx": ex["subidx"],
+                "name": ex["name"],
+                "tables": [],
+                "figures": [],
+                "blocks": [],
+            }
+            by_id[ex["id"]] = item
+            experiments.append(item)
+        for b in self.conn.execute(
+            "SELECT experiment_id, kind, label, caption FROM blocks WHERE report_id = ? ORDER BY experiment_id, position",
+            (row["id"],),
+        ):
+            ex = by_id[b["experiment_id"]]
+            ex["tables" if b["kind"] == "table" else "figures"].append({"label": b["label"], "caption": b["caption"]})
+            ex["blocks"].append({"type": b["kind"], "label": b["label"], "caption": b["caption"]})
+
+        return {"chapter": row["chapter"], "experiments": experiments}
+
+    def search_captions(self, query: str, kind: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        """
+        キャプションを全文検索し、ヒットした表/図をレポート・節の情報付きで返す。
+        kind に "table" / "figure" を指定すると種別で絞り込む。
+        """
+        select = """
+            SELECT r.path, r.chapter, e.section, e.subidx, e.name, b.kind, b.label, b.caption
+            FROM blocks b
+            JOIN experiments e ON e.id = b.experiment_id
+            JOIN reports r ON r.id = b.report_id
+        """
+        params: List[Any] = []
+        # trigram は3文字未満の語を照合できないため、その場合は LIKE で検索する
+        if self.has_fts and len(query) >= 3:
+            where = "WHERE b.id IN (SELECT rowid FROM blocks_fts WHERE blocks_fts MATCH ?)"
+            params.append('"' + query.replace('"', '""') + '"')
+        else:
+            where = "WHERE b.caption LIKE ? ESCAPE '\\'"
+            escaped = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            params.append(f"%{escaped}%")
+        if kind:
+            where += " AND b.kind = ?"
+            params.append(kind)
+        params.append(limit)
+
+        rows = self.conn.execute(
+            f"{select} {where} ORDER BY r.path, e.position, b.kind, b.position LIMIT ?", params
+        ).fetchall()
+        return [dict(r) for r in rows]
+
+    def find_reports(self, query: str, kind: Optional[str] = None) -> List[str]:
+        """
+        キャプションに query を含む表/図を持つレポートのパス一覧を返す。
+        例: find_reports("周波数特性", kind="figure")
+        """
+        seen: Dict[str, None] = {}
+        for hit in self.search_captions(query, kind=kind, limit=-1):
+            seen.setdefault(hit["path"], None)
+        return list(seen)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="過去レポートの構造インデックス（SQLite）を構築・検索する")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH, help="インデックスの SQLite ファイル")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_index = sub.add_parser("index", help="DOCX ファイル/ディレクトリをインデックスに追加・更新する")
+    p_index.add_argument("path")
+    p_index.add_argument("-r", "--recursive", action="store_true")
+    p_index.add_argument("--no-prune", action="store_true", help="消えたファイルの行を削除しない")
+
+    p_search = sub.add_parser("search", help="キャプションを全文検索する")
+    p_search.add_argument("query")
+    p_search.add_argument("--kind", choices=["table", "figure"])
+    p_search.add_argument("--reports-only", action="store_true", help="レポートのパスのみを出力する")
+
+    p_show = sub.add_parser("show", help="登録済みレポートの構造を出力する")
+    p_show.add_argument("path")
+
+    args = parser.parse_args()
+
+    with ReportIndex(args.db) as index:
+        if args.command == "index":
+            result: Any = index.update(args.path, recursive=args.recursive, prune=not args.no_prune)
+        elif args.command == "search":
+            if args.reports_only:
+                result = index.find_reports(args.query, kind=args.kind)
+            else:
+                result = index.search_captions(args.query, kind=args.kind, limit=-1)
+        else:
+            result = index.get_report(args.path)
+            if result is None:
+                print(json.dumps({"error": "Report not indexed"}, ensure_ascii=False), file=sys.stderr)
+                sys.exit(1)
+
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,82 +1,285 @@
 import re
-from dataclasses import dataclass
+from bisect import bisect_right
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
 
 @dataclass
 class SplitContexts:
     full_text: str
     method_text: str
     discussion_text: str
+    # section name -> (start, end) character offsets into full_text
+    section_spans: Dict[str, Tuple[int, int]] = field(default_factory=dict)
+    # section name -> (first, last) 0-based page index; only filled by split_layout
+    section_pages: Dict[str, Tuple[int, int]] = field(default_factory=dict)
+
+    def section(self, name: str) -> Optional[str]:
+        """Returns the text of a detected section (purpose, theory, method, results, discussion, references)."""
+        span = self.section_spans.get(name)
+        if span is None:
+            return None
+        return self.full_text[span[0]:span[1]]
+
+
+@dataclass
+class LayoutLine:
+    """One text line from PyMuPDF page.get_text("dict"), with the style needed to spot headings."""
+    text: str
+    size: float
+    bold: bool
+    page: int
+
+
+def layout_lines_from_pages(pages: Iterable[Dict[str, Any]]) -> List[LayoutLine]:
+    """
+    Flattens PyMuPDF page dicts (page.get_text("dict")) into text lines.
+    A line's size is its largest span size; it is bold when any non-blank span is bold.
+    """
+    lines: List[LayoutLine] = []
+    for page_no, page in enumerate(pages):
+        for block in page.get("blocks", []):
+            if block.get("type") != 0:
+                continue
+            for line in block.get("lines", []):
+                spans = [sp for sp in line.get("spans", []) if sp.get("text")]
+                text = "".join(sp["text"] for sp in spans).rstrip()
+                if not text.strip():
+                    continue
+                visible = [sp for sp in spans if sp["text"].strip()]
+                lines.append(
+                    LayoutLine(
+                        text=text,
+                        size=max(sp.get("size", 0.0) for sp in visible),
+                        # PyMuPDF flag bit 4 (16) marks bold spans
+                        bold=any(sp.get("flags", 0) & 16 or "Bold" in sp.get("font", "") for sp in visible),
+                        page=page_no,
+                    )
+                )
+    return lines
+
+
+class _Heading(NamedTuple):
+    start: int
+    number: Optional[int]  # leading chapter number, e.g. 4 for "4. 実験方法" and "4.1 ..."
+    is_sub: bool           # True for "4.1"-style sub-headings
+    key: Optional[str]     # section name, "_stop" for 謝辞/付録, None for other numbered lines
+
 
 class SmartSplitter:
+    # Section name -> heading keywords (matched at the start of the heading title)
+    SECTION_KEYWORDS: Dict[str, Tuple[str, ...]] = {
+        "purpose": ("目的",),
+        "theory": ("理論", "原理"),
+        "method": ("実験方法", "方法"),
+        "results": ("実験結果", "結果"),
+        "discussion": ("考察", "検討", "Discussion"),
+        "references": ("参考文献", "References"),
+    }
+    # Headings that close the preceding section without opening a new one
+    STOP_KEYWORDS: Tuple[str, ...] = ("謝辞", "付録")
+    # v2 Spec: prefer "4. 実験方法" and "6. 考察" when several candidates exist
+    PREFERRED_NUMBERS: Dict[str, int] = {"method": 4, "discussion": 6}
+    # Unnumbered lines longer than this are treated as body text, not headings
+    MAX_UNNUMBERED_HEADING_LEN = 30
+
+    _KEYWORD_TO_KEY: Dict[str, str] = {
+        kw: key for key, kws in SECTION_KEYWORDS.items() for kw in kws
+    }
+    _KEYWORD_TO_KEY.update({kw: "_stop" for kw in STOP_KEYWORDS})
+    _KEYWORD_ALT = "|".join(sorted(map(re.escape, _KEYWORD_TO_KEY), key=len, reverse=True))
+
+    # One pass over the text: every numbered line ("4.", "4.1") and every line starting with a keyword.
+    # Numbers are limited to two digits and the title may not start with a number or sign,
+    # so numeric table rows such as "2.00010\t-3.96100" or "5.0\t1.2" are not taken as headings.
+    # A sub-number ("4.1") must be followed by a space, the end of the line or a non-ASCII title,
+    # and a title starting with a unit is a measurement, so "12.5 mA ..." and "5.0 V" are not headings.
+    _UNIT = r"(?:[kMmμun]?(?:V|A|Hz|Ω|W|F|H|s|m)|dB|℃|%)(?![A-Za-z])"
+    _HEADING_PATTERN = re.compile(
+        r"^[^\S\n]*(?:"
+        r"(?P<num>\d{1,2})\.(?:(?P<minor>\d{1,2}(?:\.\d{1,2})*)\.?(?=[^\S\n]|$|[^\x00-\x7f]))?"
+        r"(?![\d.])(?![^\S\n]*[-+−\d.])(?![^\S\n]*" + _UNIT + r")[^\S\n]*(?P<ntitle>[^\n]*)"
+        r"|(?P<kw>" + _KEYWORD_ALT + r")[^\n]*"
+        r")$",
+        re.MULTILINE,
+    )
+    _KEYWORD_PATTERN = re.compile(r"(?:" + _KEYWORD_ALT + r")")
+
+    # Layout mode: a styled line such as "4. 実験方法", "2.1. 半導体" or "参考文献"
+    _LAYOUT_NUMBER_PATTERN = re.compile(r"^\s*(?P<num>\d{1,2})(?P<minor>(?:\.\d{1,2})+)?\.?(?:\s+|(?=\D))(?P<title>.*)$")
+    # Headings are bold or at least this much larger than the body text
+    HEADING_SIZE_RATIO = 1.1
+    MAX_LAYOUT_HEADING_LEN = 40
+
     def __init__(self):
         pass
 
     def split(self, full_text: str) -> SplitContexts:
         """
         Splits the full text into Method, Discussion, and Full Contexts using Regex.
+        All headings are indexed in a single scan; every detected section is available via section_spans.
+        """
+        return self._contexts_from_spans(full_text, self.index_sections(full_text))
+
+    def split_layout(self, pages: Iterable[Dict[str, Any]]) -> SplitContexts:
         """
-        method_text = self._extract_method_section(full_text)
-        discussion_text = self._extract_discussion_section(full_text)
-        
+        Splits a PDF using PyMuPDF page.get_text("dict") output instead of flat text.
+        Headings are recognised by style (bold or larger than the body font) plus a chapter number
+        or section keyword, and a section ends at the next top-level heading, so the method and
+        discussion contexts do not run into unnumbered body lines.
+        Sections not found structurally fall back to the flat-text heading scan.
+        """
+        lines = layout_lines_from_pages(pages)
+        offsets: List[int] = []
+        pos = 0
+        for line in lines:
+            offsets.append(pos)
+            pos += len(line.text) + 1
+        full_text = "\n".join(line.text for line in lines)
+
+        headings = self._layout_headings(lines, offsets)
+        spans: Dict[str, Tuple[int, int]] = {}
+        for key in self.SECTION_KEYWORDS:
+            start = self._find_start(headings, key)
+            if start is None:
+                continue
+            end = len(full_text)
+            for h in headings[start + 1:]:
+                if not h.is_sub:
+                    end = h.start - 1  # drop the newline before the next heading
+                    break
+            spans[key] = (headings[start].start, end)
+
+        for key, span in self.index_sections(full_text).items():
+            spans.setdefault(key, span)
+
+        contexts = self._contexts_from_spans(full_text, spans)
+        for key, (start, end) in spans.items():
+            first = lines[bisect_right(offsets, start) - 1].page
+            last = lines[max(bisect_right(offsets, max(end - 1, start)) - 1, 0)].page
+            contexts.section_pages[key] = (first, last)
+        return contexts
+
+    def _layout_headings(self, lines: List[LayoutLine], offsets: List[int]) -> List[_Heading]:
+        if not lines:
+            return []
+        # Body size = the most common font size, weighted by characters
+        sizes: Counter = Counter()
+        for line in lines:
+            sizes[round(line.size * 2) / 2] += len(line.text)
+        body_size = sizes.most_common(1)[0][0]
+
+        headings: List[_Heading] = []
+        for line, start in zip(lines, offsets):
+            text = line.text.strip()
+            if len(text) > self.MAX_LAYOUT_HEADING_LEN:
+                continue
+            if not (line.bold or line.size >= body_size * self.HEADING_SIZE_RATIO):
+                continue
+            m = self._LAYOUT_NUMBER_PATTERN.match(text)
+            if m:
+                is_sub = m.group("minor") is not None
+                key = None
+                if not is_sub:
+                    kw = self._KEYWORD_PATTERN.search(m.group("title"))
+                    key = self._KEYWORD_TO_KEY[kw.group()] if kw else None
+                headings.append(_Heading(start, int(m.group("num")), is_sub, key))
+                continue
+            kw = self._KEYWORD_PATTERN.match(text)
+            if kw:
+                headings.append(_Heading(start, None, False, self._KEYWORD_TO_KEY[kw.group()]))
+        return headings
+
+    def _contexts_from_spans(self, full_text: str, spans: Dict[str, Tuple[int, int]]) -> SplitContexts:
+        total_len = len(full_text)
+
+        method_span = spans.get("method")
+        if method_span:
+            method_text = full_text[method_span[0]:method_span[1]]
+        else:
+            # Fallback: Take 20-60% of text as per spec suggestion for failure
+            method_text = full_text[int(total_len * 0.2):int(total_len * 0.6)]
+
+        discussion_span = spans.get("discussion")
+        if discussion_span:
+            discussion_text = full_text[discussion_span[0]:discussion_span[1]]
+        else:
+            # Fallback: Take the last 30% of the text
+            discussion_text = full_text[int(total_len * 0.7):]
+
         return SplitContexts(
             full_text=full_text,
             method_text=method_text,
-            discussion_text=discussion_text
+            discussion_text=discussion_text,
+            section_spans=spans,
         )
 
-    def _extract_method_section(self, text: str) -> str:
-        # v2 Spec: r'^4\.\s*実験方法' to r'^5\.' or r'^6\.'
-        
-        # Pattern 1: Strict numbered section (4. 実験方法)
-        start_pattern = re.compile(r"(?:^|\n)\s*4\.\s*実験方法", re.MULTILINE)
-        # End at 5. (Results) or 6. (Discussion) or just "実験結果"
-        end_pattern = re.compile(r"(?:^|\n)\s*(?:5\.|6\.|実験結果|考察)", re.MULTILINE)
-        
-        start_match = start_pattern.search(text)
-        if not start_match:
-            # Fallback: Look for just "実験方法" without number 4
-            start_pattern_loose = re.compile(r"(?:^|\n)\s*(?:\d+\.\s*)?実験方法", re.MULTILINE)
-            start_match = start_pattern_loose.search(text)
-            
-        if not start_match:
-            # Fallback: Take 20-60% of text as per spec suggestion for failure
-            total_len = len(text)
-            return text[int(total_len * 0.2):int(total_len * 0.6)]
-        
-        start_idx = start_match.start()
-        
-        # Search for end pattern AFTER the start
-        end_match = end_pattern.search(text, start_idx + len(start_match.group()))
-        
-        if end_match:
-            return text[start_idx:end_match.start()]
-        else:
-            return text[start_idx:]
-
-    def _extract_discussion_section(self, text: str) -> str:
-        # v2 Spec: r'^6\.\s*考察' to r'^7\.' or 参考文献
-        
-        # Pattern 1: Strict numbered section (6. 考察)
-        start_pattern = re.compile(r"(?:^|\n)\s*6\.\s*考察", re.MULTILINE)
-        # End at 7. or 参考文献
-        end_pattern = re.compile(r"(?:^|\n)\s*(?:7\.|参考文献|謝辞|付録)", re.MULTILINE)
-        
-        start_match = start_pattern.search(text)
-        if not start_match:
-            # Fallback: Look for just "考察" or "Discussion"
-            start_pattern_loose = re.compile(r"(?:^|\n)\s*(?:\d+\.\s*)?(?:考察|検討|Discussion)", re.MULTILINE)
-            start_match = start_pattern_loose.search(text)
-            
-        if not start_match:
-             # Fallback: Take the last 30% of the text
-            total_len = len(text)
-            return text[int(total_len * 0.7):]
-            
-        start_idx = start_match.start()
-        
-        end_match = end_pattern.search(text, start_idx + len(start_match.group()))
-        
-        if end_match:
-            return text[start_idx:end_match.start()]
-        else:
-            return text[start_idx:]
+    def index_sections(self, text: str) -> Dict[str, Tuple[int, int]]:
+        """
+        Returns {section name: (start, end)} for every section whose heading is found.
+        """
+        headings = self._scan_headings(text)
+        spans: Dict[str, Tuple[int, int]] = {}
+        for key in self.SECTION_KEYWORDS:
+            pos = self._find_start(headings, key)
+            if pos is None:
+                continue
+            spans[key] = (headings[pos].start, self._find_end(headings, pos, len(text)))
+        return spans
+
+    def _scan_headings(self, text: str) -> List[_Heading]:
+        headings: List[_Heading] = []
+        for m in self._HEADING_PATTERN.finditer(text):
+            num = m.group("num")
+            if num is not None:
+                is_sub = m.group("minor") is not None
+                key = None
+                if not is_sub:
+                    key = self._title_key(m.group("ntitle"))
+                headings.append(_Heading(m.start(), int(num), is_sub, key))
+            elif self._is_heading_title(m.group()):
+                headings.append(_Heading(m.start(), None, False, self._KEYWORD_TO_KEY[m.group("kw")]))
+        return headings
+
+    def _is_heading_title(self, title: str) -> bool:
+        """Sentences (lines ending in "。", such as "結果を表に記録した。") and long lines are body text."""
+        title = title.strip()
+        return bool(title) and len(title) <= self.MAX_UNNUMBERED_HEADING_LEN and not title.endswith("。")
+
+    def _title_key(self, title: str) -> Optional[str]:
+        """
+        Section key of a numbered heading title. The keyword may follow other words ("実験の目的"),
+        but sentences (numbered procedure steps ending in "。") and long lines are not headings.
+        """
+        if not self._is_heading_title(title):
+            return None
+        kw = self._KEYWORD_PATTERN.search(title)
+        return self._KEYWORD_TO_KEY[kw.group()] if kw else None
+
+    def _find_start(self, headings: List[_Heading], key: str) -> Optional[int]:
+        preferred = self.PREFERRED_NUMBERS.get(key)
+        numbered: Optional[int] = None
+        unnumbered: Optional[int] = None
+        for i, h in enumerate(headings):
+            if h.key != key:
+                continue
+            if h.number is not None:
+                if preferred is None or h.number == preferred:
+                    return i
+                if numbered is None:
+                    numbered = i
+            elif unnumbered is None:
+                unnumbered = i
+        return numbered if numbered is not None else unnumbered
+
+    def _find_end(self, headings: List[_Heading], pos: int, text_len: int) -> int:
+        start = headings[pos]
+        for h in headings[pos + 1:]:
+            if h.key is not None and h.key != start.key:
+                return h.start
+            if start.number is not None and h.number is not None and h.number > start.number:
+                # A sub-heading only closes the section when it belongs to the next chapter;
+                # "12.5" far past the current chapter is more likely a stray number than a heading
+                if not h.is_sub or h.number == start.number + 1:
+                    return h.start
+        return text_len
@@ -0,0 +1,349 @@
+"""
+抽出テキストの永続キャッシュ（SQLite）。
+
+同じ実験マニュアル（PDF/DOCX）が学期中に何百回もアップロードされるため、ファイル内容の SHA-256 を
+キーにして、抽出テキスト・SmartSplitter の節の境界・tiktoken のトークン数を保存する。
+解析（optimized_workflow）と事前のトークン見積もりはどちらもここを通り、抽出は1回で済む。
+
+使用例:
+    contexts, entry = await optimized_workflow.extract_contexts_cached(file_bytes, "manual.pdf")
+    with TextCache() as cache:
+        cache.token_counts(entry.sha256, model="gpt-4o-mini")
+
+CLI:
+    python text_cache.py extract manual.pdf --model gpt-4o-mini
+    python text_cache.py show <sha256>
+    python text_cache.py stats
+    python text_cache.py prune --days 120
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, Optional, Tuple
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from smart_splitter import SplitContexts  # noqa: E402
+from docx_text import DocxSource  # noqa: E402
+from private_dir import ensure_private_dir, user_temp_dir  # noqa: E402
+
+try:
+    import tiktoken  # type: ignore
+except ImportError:  # pragma: no cover
+    tiktoken = None
+
+
+# REPORT_TEXT_CACHE=0 でキャッシュを使わない
+ENABLED = os.environ.get("REPORT_TEXT_CACHE", "1") != "0"
+# 既定の置き場所は実行ユーザー専用（0700）のディレクトリ。抽出テキストを他のユーザーに読まれたり、
+# 既知の SHA-256 の偽の行を仕込まれたりしないようにする。REPORT_TEXT_CACHE_DB で別の場所を指定する場合も
+# 他のユーザーが書き込めないディレクトリにすること。
+DEFAULT_DB_DIR = user_temp_dir("report-text-cache")
+DEFAULT_DB_PATH = os.environ.get("REPORT_TEXT_CACHE_DB", os.path.join(DEFAULT_DB_DIR, "text_cache.sqlite3"))
+# 抽出・分割の処理を変えたら上げる（古い版の行はキャッシュミスとして扱う）
+EXTRACTOR_VERSION = 4
+# tiktoken のエンコーディングを読み込めない場合の概算値のキー
+APPROX_ENCODING = "approx"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS extracted_texts (
+    sha256 TEXT PRIMARY KEY,
+    file_type TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    extractor_version INTEGER NOT NULL,
+    full_text TEXT NOT NULL,
+    method_text TEXT NOT NULL,
+    discussion_text TEXT NOT NULL,
+    section_spans TEXT NOT NULL,
+    section_pages TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_used_at REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS token_counts (
+    sha256 TEXT NOT NULL REFERENCES extracted_texts(sha256) ON DELETE CASCADE,
+    encoding TEXT NOT NULL,
+    part TEXT NOT NULL,
+    tokens INTEGER NOT NULL,
+    PRIMARY KEY (sha256, encoding, part)
+);
+"""
+
+
+@dataclass
+class CacheEntry:
+    sha256: str
+    file_type: str
+    size: int
+    hit: bool
+
+
+def sha256_of(source: DocxSource) -> str:
+    """パス・bytes・バイナリストリームの SHA-256（ストリームは読み終えた後に先頭へ戻す）。"""
+    h = hashlib.sha256()
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        h.update(source)
+    elif isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+    else:
+        for chunk in iter(lambda: source.read(1 << 20), b""):
+            h.update(chunk)
+        source.seek(0)
+    return h.hexdigest()
+
+
+def source_size(source: DocxSource) -> int:
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return len(source)
+    if isinstance(source, (str, os.PathLike)):
+        return os.path.getsize(source)
+    size = source.seek(0, os.SEEK_END)
+    source.seek(0)
+    return size
+
+
+@lru_cache(maxsize=8)
+def _encoding(name: str):
+    """tiktoken のエンコーディング。未インストール・BPE ファイルを取得できない場合は None。"""
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding(name)
+    except Exception as e:
+        print(f"[WARN] tiktoken encoding '{name}' is unavailable, using approximate counts: {e}", file=sys.stderr)
+        return None
+
+
+def encoding_for(model: Optional[str] = None, encoding: Optional[str] = None) -> str:
+    """model（例: gpt-4o-mini）またはエンコーディング名から、使用するエンコーディング名を決める。"""
+    if encoding:
+        return encoding
+    if model and tiktoken is not None:
+        try:
+            return tiktoken.encoding_name_for_model(model)
+        except KeyError:
+            pass
+    return "o200k_base"
+
+
+def _approx_tokens(text: str) -> int:
+    # 日本語などの非 ASCII はおおむね1文字1トークン、ASCII は約4文字1トークン
+    non_ascii = sum(1 for ch in text if ord(ch) > 0x7F)
+    return non_ascii + (len(text) - non_ascii + 3) // 4
+
+
+def count_tokens(text: str, encoding: str) -> Tuple[str, int]:
+    """
+    (実際に使ったエンコーディング名, トークン数) を返す。
+    エンコーディングを読み込めない場合は (APPROX_ENCODING, 概算値)。
+    """
+    enc = None if encoding == APPROX_ENCODING else _encoding(encoding)
+    if enc is None:
+        return APPROX_ENCODING, _approx_tokens(text)
+    return encoding, len(enc.encode(text, disallowed_special=()))
+
+
+def _text_parts(contexts: SplitContexts) -> Dict[str, str]:
+    """トークン数を数える単位（全文・方法・考察・検出された各節）。"""
+    parts = {
+        "full": contexts.full_text,
+        "method": contexts.method_text,
+        "discussion": contexts.discussion_text,
+    }
+    for name in contexts.section_spans:
+        parts[f"section:{name}"] = contexts.section(name) or ""
+    return parts
+
+
+class TextCache:
+    """
+    ファイル内容の SHA-256 → 抽出テキスト・節の境界・トークン数 を保持する SQLite キャッシュ。
+    """
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH):
+        self.db_path = db_path
+        if os.path.dirname(os.path.abspath(db_path)) == DEFAULT_DB_DIR:
+            # 他のユーザーの所有なら OSError
+            ensure_private_dir(DEFAULT_DB_DIR)
+        self.conn = sqlite3.connect(db_path, timeout=10)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.executescript(_SCHEMA)
+        self.conn.commit()
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def __enter__(self) -> "TextCache":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    # --- 参照・登録 ---
+
+    def peek(self, sha256: str) -> Optional[Tuple[SplitContexts, CacheEntry]]:
+        """get と同じだが、最終利用日時とヒット数を更新しない（表示・トークン計数用）。"""
+        row = self.conn.execute(
+            "SELECT * FROM extracted_texts WHERE sha256 = ? AND extractor_version = ?",
+            (sha256, EXTRACTOR_VERSION),
+        ).fetchone()
+        if row is None:
+            return None
+        contexts = SplitContexts(
+            full_text=row["full_text"],
+            method_text=row["method_text"],
+            discussion_text=row["discussion_text"],
+            section_spans={k: tuple(v) for k, v in json.loads(row["section_spans"]).items()},
+            section_pages={k: tuple(v) for k, v in json.loads(row["section_pages"]).items()},
+        )
+        return contexts, CacheEntry(sha256, row["file_type"], row["size"], hit=True)
+
+    def get(self, sha256: str) -> Optional[Tuple[SplitContexts, CacheEntry]]:
+        """キャッシュ済みの抽出結果。未登録または古い抽出器の結果なら None。"""
+        cached = self.peek(sha256)
+        if cached is not None:
+            with self.conn:
+                self.conn.execute(
+                    "UPDATE extracted_texts SET last_used_at = ?, hits = hits + 1 WHERE sha256 = ?",
+                    (time.time(), sha256),
+                )
+        return cached
+
+    def put(self, sha256: str, file_type: str, size: int, contexts: SplitContexts) -> CacheEntry:
+        """抽出結果を登録する（既存の行とトークン数は置き換える）。"""
+        now = time.time()
+        with self.conn:
+            self.conn.execute("DELETE FROM extracted_texts WHERE sha256 = ?", (sha256,))
+            self.conn.execute(
+                "INSERT INTO extracted_texts (sha256, file_type, size, extractor_version, full_text, method_text, "
+                "discussion_text, section_spans, section_pages, created_at, last_used_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    sha256, file_type, size, EXTRACTOR_VERSION,
+                    contexts.full_text, contexts.method_text, contexts.discussion_text,
+                    json.dumps(contexts.section_spans), json.dumps(contexts.section_pages),
+                    now, now,
+                ),
+            )
+        return CacheEntry(sha256, file_type, size, hit=False)
+
+    # --- トークン数 ---
+
+    def token_counts(self, sha256: str, model: Optional[str] = None, encoding: Optional[str] = None) -> Dict[str, Any]:
+        """
+        {"encoding": 実際のエンコーディング名, "tokens": {部分: トークン数}} を返す。
+        未計算のエンコーディングはここで数えて保存する。抽出結果が未登録なら KeyError。
+        """
+        cached = self.peek(sha256)
+        if cached is None:
+            raise KeyError(f"Text not cached: {sha256}")
+        contexts = cached[0]
+        requested = encoding_for(model, encoding)
+        used = requested if _encoding(requested) is not None else APPROX_ENCODING
+
+        rows = self.conn.execute(
+            "SELECT part, tokens FROM token_counts WHERE sha256 = ? AND encoding = ?", (sha256, used)
+        ).fetchall()
+        tokens = {row["part"]: row["tokens"] for row in rows}
+        parts = _text_parts(contexts)
+        missing = {part: text for part, text in parts.items() if part not in tokens}
+        if missing:
+            for part, text in missing.items():
+                tokens[part] = count_tokens(text, used)[1]
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO token_counts (sha256, encoding, part, tokens) VALUES (?, ?, ?, ?)",
+                    [(sha256, used, part, tokens[part]) for part in missing],
+                )
+        return {"encoding": used, "tokens": {part: tokens[part] for part in parts}}
+
+    # --- 管理 ---
+
+    def stats(self) -> Dict[str, Any]:
+        row = self.conn.execute(
+            "SELECT COUNT(*) AS entries, COALESCE(SUM(hits), 0) AS hits, COALESCE(SUM(size), 0) AS source_bytes, "
+            "COALESCE(SUM(LENGTH(full_text)), 0) AS text_chars FROM extracted_texts"
+        ).fetchone()
+        return dict(row)
+
+    def prune(self, max_age_days: float) -> int:
+        """max_age_days 日以上使われていない行を削除し、削除件数を返す。"""
+        cutoff = time.time() - max_age_days * 86400
+        with self.conn:
+            cur = self.conn.execute("DELETE FROM extracted_texts WHERE last_used_at < ?", (cutoff,))
+        return cur.rowcount
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="抽出テキストのキャッシュ（SQLite）を操作する")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH, help="キャッシュの SQLite ファイル")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_extract = sub.add_parser("extract", help="PDF/DOCX を抽出してキャッシュし、トークン数を出力する")
+    p_extract.add_argument("path")
+    p_extract.add_argument("--model", help="トークン数を数えるモデル（例: gpt-4o-mini）")
+    p_extract.add_argument("--encoding", help="tiktoken のエンコーディング名（--model より優先）")
+
+    p_show = sub.add_parser("show", help="キャッシュ済みの節の境界とトークン数を出力する")
+    p_show.add_argument("sha256")
+    p_show.add_argument("--model")
+    p_show.add_argument("--encoding")
+    p_show.add_argument("--text", action="store_true", help="全文も出力する")
+
+    sub.add_parser("stats", help="キャッシュの件数・ヒット数を出力する")
+
+    p_prune = sub.add_parser("prune", help="しばらく使われていない行を削除する")
+    p_prune.add_argument("--days", type=float, default=180)
+
+    args = parser.parse_args()
+
+    if args.command == "extract":
+        if not os.path.exists(args.path):
+            print(json.dumps({"error": "File not found"}, ensure_ascii=False), file=sys.stderr)
+            sys.exit(1)
+        # optimized_workflow は OpenAI クライアントを作るため、抽出するときだけ読み込む
+        import optimized_workflow
+
+        _, entry = asyncio.run(optimized_workflow.extract_contexts_cached(args.path, db_path=args.db))
+        sha256 = entry.sha256
+    elif args.command == "show":
+        sha256 = args.sha256
+
+    with TextCache(args.db) as cache:
+        if args.command in ("extract", "show"):
+            cached = cache.peek(sha256)
+            if cached is None:
+                print(json.dumps({"error": "Text not cached"}, ensure_ascii=False), file=sys.stderr)
+                sys.exit(1)
+            contexts, entry = cached
+            result: Any = {
+                "sha256": entry.sha256,
+                "file_type": entry.file_type,
+                "size": entry.size,
+                "section_spans": contexts.section_spans,
+                "section_pages": contexts.section_pages,
+                **cache.token_counts(sha256, model=args.model, encoding=args.encoding),
+            }
+            if args.command == "show" and args.text:
+                result["full_text"] = contexts.full_text
+        elif args.command == "stats":
+            result = cache.stats()
+        else:
+            result = {"deleted": cache.prune(args.days)}
+
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+"""
+LLM 呼び出しの事前見積もり（トークン数・料金・所要時間）と予算。
+
+optimized_workflow の各タスク（summary / methods / discussion）について、実際に送るメッセージの
+トークン数を tiktoken で数え、料金と所要時間を見積もる。予算を超える場合は拒否するか
+（BudgetExceeded）、入力を予算内のチャンクに分けて呼び出す。
+
+設定（環境変数）:
+    OPENAI_MAX_INPUT_TOKENS     1回の呼び出しの入力トークン上限（既定 0 = 無制限）
+    OPENAI_MAX_COST_USD         1ファイルあたりの見積もり料金の上限（既定 0 = 無制限）
+    OPENAI_BUDGET_ACTION        入力トークン上限を超えたとき: chunk（既定）/ refuse
+    OPENAI_PRICE_INPUT_PER_1M   入力 100 万トークンあたりの料金（USD、PRICES の値を上書き）
+    OPENAI_PRICE_OUTPUT_PER_1M  出力 100 万トークンあたりの料金（USD、同上）
+    OPENAI_OUTPUT_TOKENS_PER_S  出力の生成速度（既定 60 トークン/秒）
+    OPENAI_BASE_LATENCY_S       1回の呼び出しの固定の待ち時間（既定 0.8 秒）
+
+上限は既定では設けない。chunk で分けると出力が変わるため（methods はチャンクごとの実験項目を
+番号の振り直し・重複の除去をせずに連結し、summary はまとめ直しの呼び出しが1回増える）、
+大きなアップロードを拒否・分割したい場合に明示的に設定する。
+"""
+import json
+import os
+import sys
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from text_cache import APPROX_ENCODING, count_tokens, encoding_for  # noqa: E402
+
+# model -> (入力, 出力) 100 万トークンあたりの USD
+PRICES: Dict[str, Tuple[float, float]] = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1": (2.00, 8.00),
+}
+
+OUTPUT_TOKENS_PER_S = float(os.getenv("OPENAI_OUTPUT_TOKENS_PER_S", "60"))
+BASE_LATENCY_S = float(os.getenv("OPENAI_BASE_LATENCY_S", "0.8"))
+# 入力の処理速度（プロンプトが長いほど最初のトークンまでが遅くなる分）
+PREFILL_TOKENS_PER_S = 20000.0
+
+# チャット形式のメッセージ1件ごとの区切りトークンと、応答の先頭に付くトークン
+TOKENS_PER_MESSAGE = 3
+TOKENS_REPLY_PRIMING = 3
+
+# タスクごとの出力トークン数の目安: 固定分 + 入力テキストのトークン数 × 比率
+OUTPUT_ESTIMATES: Dict[str, Tuple[int, float]] = {
+    "summary": (450, 0.0),      # 300字程度のまとめ
+    "methods": (150, 0.5),      # 実験項目の一覧
+    "discussion": (150, 1.1),   # 考察の書き換え + 参考文献
+}
+
+BUDGET_ACTIONS = ("chunk", "refuse")
+
+
+class BudgetExceeded(ValueError):
+    """見積もりが予算を超えたため、LLM を呼び出さずに処理を中止した。"""
+
+
+@dataclass
+class Budget:
+    max_input_tokens: int = 0
+    max_cost_usd: float = 0.0
+    action: str = "chunk"
+
+    @classmethod
+    def from_env(cls) -> "Budget":
+        action = os.getenv("OPENAI_BUDGET_ACTION", "chunk")
+        if action not in BUDGET_ACTIONS:
+            raise ValueError(f"OPENAI_BUDGET_ACTION must be one of {BUDGET_ACTIONS}: {action}")
+        return cls(
+            max_input_tokens=int(os.getenv("OPENAI_MAX_INPUT_TOKENS", "0")),
+            max_cost_usd=float(os.getenv("OPENAI_MAX_COST_USD", "0")),
+            action=action,
+        )
+
+
+@dataclass
+class TaskPlan:
+    name: str
+    calls: int
+    input_tokens: int
+    max_call_input_tokens: int
+    output_tokens: int
+    cost_usd: float
+    latency_s: float
+    chunked: bool = False
+    # チャンクに分けた場合の各チャンクのテキスト（実行時に使う。出力には含めない）
+    chunks: List[str] = field(default_factory=list, repr=False)
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data.pop("chunks")
+        data["cost_usd"] = round(self.cost_usd, 6)
+        data["latency_s"] = round(self.latency_s, 2)
+        return data
+
+
+@dataclass
+class WorkflowPlan:
+    model: str
+    encoding: str
+    tasks: List[TaskPlan]
+    budget: Budget
+    violations: List[str] = field(default_factory=list)
+
+    @property
+    def cost_usd(self) -> float:
+        return sum(task.cost_usd for task in self.tasks)
+
+    @property
+    def latency_s(self) -> float:
+        # タスクは asyncio.gather で並行に呼ばれる
+        return max((task.latency_s for task in self.tasks), default=0.0)
+
+    @property
+    def within_budget(self) -> bool:
+        return not self.violations
+
+    def task(self, name: str) -> TaskPlan:
+        return next(task for task in self.tasks if task.name == name)
+
+    def enforce(self) -> None:
+        """予算違反があれば BudgetExceeded を投げる。"""
+        if self.violations:
+            raise BudgetExceeded("; ".join(self.violations))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "model": self.model,
+            "encoding": self.encoding,
+            "tasks": [task.to_dict() for task in self.tasks],
+            "input_tokens": sum(task.input_tokens for task in self.tasks),
+            "output_tokens": sum(task.output_tokens for task in self.tasks),
+            "cost_usd": round(self.cost_usd, 6),
+            "latency_s": round(self.latency_s, 2),
+            "budget": asdict(self.budget),
+            "within_budget": self.within_budget,
+            "violations": self.violations,
+        }
+
+
+def prices_for(model: str) -> Tuple[float, float]:
+    """(入力, 出力) 100 万トークンあたりの USD。未知のモデルは gpt-4o の料金で見積もる。"""
+    price_in, price_out = PRICES.get(model, PRICES["gpt-4o"])
+    return (
+        float(os.getenv("OPENAI_PRICE_INPUT_PER_1M", price_in)),
+        float(os.getenv("OPENAI_PRICE_OUTPUT_PER_1M", price_out)),
+    )
+
+
+def estimate_cost(model: str, input_tokens: int, output_tokens: int) -> float:
+    price_in, price_out = prices_for(model)
+    return (input_tokens * price_in + output_tokens * price_out) / 1_000_000
+
+
+def estimate_latency(input_tokens: int, output_tokens: int) -> float:
+    """1回の呼び出しの所要時間（秒）の目安。"""
+    return BASE_LATENCY_S + input_tokens / PREFILL_TOKENS_PER_S + output_tokens / OUTPUT_TOKENS_PER_S
+
+
+def estimate_output_tokens(task: str, text_tokens: int) -> int:
+    base, ratio = OUTPUT_ESTIMATES.get(task, (300, 0.5))
+    return int(base + text_tokens * ratio)
+
+
+def message_tokens(messages: List[Dict[str, str]], encoding: str) -> Tuple[str, int]:
+    """
+    チャットメッセージの入力トークン数。(実際に使ったエンコーディング名, トークン数) を返す。
+    """
+    used = encoding
+    total = TOKENS_REPLY_PRIMING
+    for message in messages:
+        used, tokens = count_tokens(message["content"], encoding)
+        total += TOKENS_PER_MESSAGE + tokens
+    return used, total
+
+
+def schema_tokens(response_format: Any, encoding: str) -> int:
+    """Structured Outputs で送られる JSON Schema のトークン数（概算）。"""
+    schema = json.dumps(response_format.model_json_schema(), ensure_ascii=False, separators=(",", ":"))
+    return count_tokens(schema, encoding)[1]
+
+
+def split_to_budget(text: str, max_tokens: int, encoding: str) -> List[str]:
+    """
+    text を行単位で、各チャンクが max_tokens 以下になるように分ける。
+    1行で上限を超える場合は文字数で分ける。
+    """
+    if max_tokens <= 0:
+        return [text]
+    chunks: List[str] = []
+    current: List[str] = []
+    current_tokens = 0
+    for line in text.splitlines(keepends=True):
+        tokens = count_tokens(line, encoding)[1]
+        if tokens > max_tokens:
+            if current:
+                chunks.append("".join(current))
+                current, current_tokens = [], 0
+            # トークン数に比例した文字数で分ける
+            step = max(1, len(line) * max_tokens // tokens)
+            chunks.extend(line[i:i + step] for i in range(0, len(line), step))
+            continue
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append("".join(current))
+            current, current_tokens = [], 0
+        current.append(line)
+        current_tokens += tokens
+    if current or not chunks:
+        chunks.append("".join(current))
+    return chunks
+
+
+def plan_task(
+    name: str,
+    text: str,
+    build_messages,
+    response_format: Any,
+    model: str,
+    budget: Budget,
+    text_tokens: Optional[int] = None,
+    reduce_output: bool = False,
+) -> Tuple[str, TaskPlan, Optional[str]]:
+    """
+    1タスクの見積もり。(エンコーディング名, TaskPlan, 予算違反の説明 or None) を返す。
+    build_messages(text) は実際に送るメッセージを作る関数。
+    text_tokens に数え済みの text のトークン数（text_cache の値）を渡すと数え直さない。
+    reduce_output=True のタスク（summary）はチャンクごとの結果をもう1回まとめる呼び出しを見積もる。
+    """
+    encoding = encoding_for(model)
+    if text_tokens is None:
+        used, text_tokens = count_tokens(text, encoding)
+    else:
+        used = count_tokens("", encoding)[0]
+    overhead = message_tokens(build_messages(""), encoding)[1] + schema_tokens(response_format, encoding)
+    call_tokens = overhead + text_tokens
+
+    limit = budget.max_input_tokens
+    if limit <= 0 or call_tokens <= limit:
+        output = estimate_output_tokens(name, text_tokens)
+        plan = TaskPlan(
+            name, 1, call_tokens, call_tokens, output,
+            estimate_cost(model, call_tokens, output), estimate_latency(call_tokens, output),
+        )
+        return used, plan, None
+
+    if budget.action == "refuse" or overhead >= limit:
+        plan = TaskPlan(name, 0, call_tokens, call_tokens, 0, 0.0, 0.0)
+        return used, plan, f"{name}: {call_tokens} input tokens exceed the per-call limit of {limit}"
+
+    chunks = split_to_budget(text, limit - overhead, encoding)
+    calls = []
+    for chunk in chunks:
+        chunk_tokens = count_tokens(chunk, encoding)[1]
+        calls.append((overhead + chunk_tokens, estimate_output_tokens(name, chunk_tokens)))
+    latency = max(estimate_latency(i, o) for i, o in calls)
+    if reduce_output:
+        # チャンクごとの出力をまとめてもう1回呼ぶ
+        reduce_text = sum(o for _, o in calls)
+        reduce_call = (overhead + reduce_text, estimate_output_tokens(name, reduce_text))
+        latency += estimate_latency(*reduce_call)
+        calls.append(reduce_call)
+    input_tokens = sum(i for i, _ in calls)
+    output_tokens = sum(o for _, o in calls)
+    max_call = max(i for i, _ in calls)
+    plan = TaskPlan(
+        name, len(calls), input_tokens, max_call, output_tokens,
+        estimate_cost(model, input_tokens, output_tokens), latency, chunked=True, chunks=chunks,
+    )
+    if max_call > limit:
+        # まとめ直す呼び出しも上限を超える（チャンクが多すぎる）
+        return used, plan, f"{name}: {len(chunks)} chunks need a {max_call}-token call, over the per-call limit of {limit}"
+    return used, plan, None
+
+
+def finish_plan(model: str, results: List[Tuple[str, TaskPlan, Optional[str]]], budget: Budget) -> WorkflowPlan:
+    """plan_task の結果をまとめ、料金の上限を確認する。"""
+    encodings = {used for used, _, _ in results}
+    encoding = APPROX_ENCODING if APPROX_ENCODING in encodings else (encodings.pop() if encodings else encoding_for(model))
+    plan = WorkflowPlan(
+        model=model,
+        encoding=encoding,
+        tasks=[task for _, task, _ in results],
+        budget=budget,
+        violations=[violation for _, _, violation in results if violation],
+    )
+    if budget.max_cost_usd > 0 and plan.cost_usd > budget.max_cost_usd:
+        plan.violations.append(f"estimated cost ${plan.cost_usd:.4f} exceeds the limit of ${budget.max_cost_usd:.4f}")
+    return plan
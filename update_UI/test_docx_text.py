@@ -0,0 +1,173 @@
+import os
+import sys
+import unittest
+import zipfile
+from io import BytesIO
+
+from docx import Document
+from docx.oxml import parse_xml
+from docx.oxml.ns import nsdecls
+from docx.table import Table, _Cell
+from docx.text.paragraph import Paragraph
+
+# Add the directory containing the library to the python path
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(ROOT, "lib", "python"))
+
+from docx_text import read_docx_text
+
+SAMPLE_REPORT = os.path.join(ROOT, "..", "定義書一覧", "4319013_梅澤ひかる_OPアンプの実験_2.docx")
+
+FOOTNOTES_XML = (
+    f'<w:footnotes {nsdecls("w")}>'
+    '<w:footnote w:type="separator" w:id="-1"><w:p><w:r><w:separator/></w:r></w:p></w:footnote>'
+    '<w:footnote w:type="continuationSeparator" w:id="0"><w:p><w:r><w:continuationSeparator/></w:r></w:p></w:footnote>'
+    '<w:footnote w:id="1"><w:p><w:r><w:t>JIS C 5101 による。</w:t></w:r></w:p></w:footnote>'
+    '<w:footnote w:id="2"><w:p><w:r><w:t>測定器の取扱説明書</w:t></w:r></w:p>'
+    '<w:p><w:r><w:t>第3版</w:t></w:r></w:p></w:footnote>'
+    '<w:footnote w:id="3"><w:p><w:r><w:t>参照されない脚注</w:t></w:r></w:p></w:footnote>'
+    '</w:footnotes>'
+)
+
+
+def footnote_ref(note_id: int):
+    return parse_xml(f'<w:r {nsdecls("w")}><w:footnoteReference w:id="{note_id}"/></w:r>')
+
+
+def make_docx() -> bytes:
+    doc = Document()
+    doc.add_paragraph("5. 実験結果")
+    p = doc.add_paragraph("入力\t出力")
+    p.add_run().add_break()
+    p.add_run("（改行後）")
+    p._p.append(footnote_ref(2))
+    doc.add_paragraph("")
+    p = doc.add_paragraph("詳細は")
+    p._p.append(parse_xml(
+        f'<w:hyperlink {nsdecls("w", "r")} r:id="rId99"><w:r><w:t>資料</w:t></w:r></w:hyperlink>'
+    ))
+    p.add_run("を参照。")
+    p._p.append(footnote_ref(1))
+
+    table = doc.add_table(rows=3, cols=3)
+    table.cell(0, 0).text = "Vin [V]"
+    table.cell(0, 1).text = "Vout [V]"
+    table.cell(0, 2).text = "備考"
+    table.cell(1, 0).text = "0.1"
+    table.cell(1, 1).text = "-1.0"
+    table.cell(1, 2).paragraphs[0].add_run("1行目")
+    table.cell(1, 2).add_paragraph("2行目")
+    table.cell(2, 0).merge(table.cell(2, 1)).text = "結合セル"
+    table.cell(0, 0).paragraphs[0].runs[0]._r.append(footnote_ref(1))
+
+    p = doc.add_paragraph("数式")
+    # A line break inside an equation (as Word writes it) is not part of the paragraph text
+    p._p.append(parse_xml(
+        f'<m:oMath {nsdecls("m", "w")}><m:r><w:br/></m:r><m:r><m:t>E=IR</m:t></m:r></m:oMath>'
+    ))
+    p.add_run("の関係を用いた。")
+    doc.add_paragraph("6. 考察")
+
+    out = BytesIO()
+    doc.save(out)
+    return add_footnotes(out.getvalue())
+
+
+def add_footnotes(docx_bytes: bytes) -> bytes:
+    """python-docx cannot create footnotes; add the part to the package directly."""
+    src = zipfile.ZipFile(BytesIO(docx_bytes))
+    out = BytesIO()
+    with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as dst:
+        for item in src.infolist():
+            data = src.read(item)
+            if item.filename == "[Content_Types].xml":
+                data = data.replace(b"</Types>", (
+                    b'<Override PartName="/word/footnotes.xml" ContentType="application/'
+                    b'vnd.openxmlformats-officedocument.wordprocessingml.footnotes+xml"/></Types>'
+                ))
+            elif item.filename == "word/_rels/document.xml.rels":
+                data = data.replace(b"</Relationships>", (
+                    b'<Relationship Id="rIdFootnotes" Target="footnotes.xml" Type="http://schemas.'
+                    b'openxmlformats.org/officeDocument/2006/relationships/footnotes"/></Relationships>'
+                ))
+            dst.writestr(item, data)
+        dst.writestr("word/footnotes.xml", FOOTNOTES_XML.encode("utf-8"))
+    return out.getvalue()
+
+
+def cell_text(cell: _Cell) -> str:
+    return " ".join(p.text.strip() for p in cell.paragraphs if p.text.strip())
+
+
+def python_docx_text(docx_bytes: bytes) -> str:
+    """
+    The same reading rules built from python-docx objects: Paragraph.text for paragraphs, one line
+    per table row with cells (each <w:tc> once, so merged cells are not repeated) joined by tabs,
+    then the referenced footnotes in order of first reference.
+    """
+    doc = Document(BytesIO(docx_bytes))
+    lines = []
+    for block in doc.iter_inner_content():
+        if isinstance(block, Paragraph):
+            if block.text.strip():
+                lines.append(block.text)
+        elif isinstance(block, Table):
+            for tr in block._tbl.tr_lst:
+                cells = [cell_text(_Cell(tc, block)) for tc in tr.tc_lst]
+                if any(cells):
+                    lines.append("\t".join(cells))
+
+    w = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+    refs = [el.get(w + "id") for el in doc.element.body.iter(w + "footnoteReference")]
+    with zipfile.ZipFile(BytesIO(docx_bytes)) as z:
+        names = z.namelist()
+        notes_xml = parse_xml(z.read("word/footnotes.xml")) if "word/footnotes.xml" in names else None
+    notes = {}
+    if notes_xml is not None:
+        for note in notes_xml.iterchildren(w + "footnote"):
+            if note.get(w + "type"):
+                continue
+            texts = [Paragraph(p, None).text.strip() for p in note.iterchildren(w + "p")]
+            notes[note.get(w + "id")] = " ".join(t for t in texts if t)
+    for ref in dict.fromkeys(refs):
+        if notes.get(ref):
+            lines.append(notes[ref])
+    return "\n".join(lines)
+
+
+class ReadDocxTextTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.data = make_docx()
+
+    def test_matches_python_docx(self):
+        self.assertEqual(read_docx_text(self.data), python_docx_text(self.data))
+
+    def test_reading_order(self):
+        self.assertEqual(read_docx_text(self.data).split("\n"), [
+            "5. 実験結果",
+            "入力\t出力",
+            "（改行後）",
+            "詳細は資料を参照。",
+            "Vin [V]\tVout [V]\t備考",
+            "0.1\t-1.0\t1行目 2行目",
+            "結合セル\t",
+            "数式の関係を用いた。",
+            "6. 考察",
+            "測定器の取扱説明書 第3版",
+            "JIS C 5101 による。",
+        ])
+
+    def test_without_notes(self):
+        text = read_docx_text(BytesIO(self.data), include_notes=False)
+        self.assertTrue(text.endswith("6. 考察"))
+
+    @unittest.skipUnless(os.path.exists(SAMPLE_REPORT), "sample report is not available")
+    def test_sample_report_matches_python_docx(self):
+        with open(SAMPLE_REPORT, "rb") as f:
+            data = f.read()
+        self.assertEqual(read_docx_text(SAMPLE_REPORT), python_docx_text(data))
+
+
+if __name__ == "__main__":
+    unittest.main()
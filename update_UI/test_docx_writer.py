@@ -0,0 +1,78 @@
+import os
+import sys
+import unittest
+import zipfile
+from io import BytesIO
+
+from docx import Document
+from docx.shared import Mm
+from PIL import Image
+
+# Add the directory containing the library to the python path
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(ROOT, "lib", "docx"))
+
+from docx_writer import save_docx
+
+TEMPLATE_PATH = os.path.join(ROOT, "templates", "chapter_fixed_jinja.docx")
+
+
+def png(data: bytes, size: int) -> BytesIO:
+    out = BytesIO()
+    Image.frombytes("L", (size, size), data).save(out, format="PNG")
+    out.seek(0)
+    return out
+
+
+def members(docx_bytes: bytes):
+    with zipfile.ZipFile(BytesIO(docx_bytes)) as z:
+        return {i.filename: (i.compress_type, z.read(i)) for i in z.infolist()}
+
+
+class SaveDocxTest(unittest.TestCase):
+    def setUp(self):
+        # Template with an embedded JPEG thumbnail that still deflates well
+        self.doc = Document(TEMPLATE_PATH)
+        self.doc.add_picture(png(os.urandom(256 * 256), 256), width=Mm(50))
+        self.doc.add_picture(png(bytes(256 * 256), 256), width=Mm(50))
+
+    def save(self, **kwargs):
+        out = BytesIO()
+        stats = save_docx(self.doc, out, **kwargs)
+        return out.getvalue(), stats
+
+    def test_default_matches_document_save(self):
+        expected = BytesIO()
+        self.doc.save(expected)
+        saved, stats = self.save()
+        self.assertEqual(members(saved).keys(), members(expected.getvalue()).keys())
+        for name, (compress_type, blob) in members(saved).items():
+            if compress_type == zipfile.ZIP_DEFLATED:
+                self.assertEqual(blob, members(expected.getvalue())[name][1])
+        # Only the noise PNG is stored; the size stays within what that member can add
+        self.assertEqual(stats.stored, 1)
+        self.assertLessEqual(len(saved), len(expected.getvalue()) + 512)
+
+    def test_only_incompressible_media_is_stored(self):
+        saved, _ = self.save()
+        types = {name: compress_type for name, (compress_type, _) in members(saved).items()}
+        stored = [name for name, compress_type in types.items() if compress_type == zipfile.ZIP_STORED]
+        self.assertEqual(len(stored), 1)
+        self.assertTrue(stored[0].startswith("word/media/"))
+        self.assertEqual(types["docProps/thumbnail.jpeg"], zipfile.ZIP_DEFLATED)
+        self.assertEqual(types["word/document.xml"], zipfile.ZIP_DEFLATED)
+
+    def test_store_media_off_deflates_everything(self):
+        _, stats = self.save(store_media=False)
+        self.assertEqual(stats.stored, 0)
+
+    def test_levels_and_estimate(self):
+        fast, _ = self.save(level=1)
+        small, stats = self.save(level=9, estimate=True)
+        self.assertLessEqual(len(small), len(fast))
+        self.assertEqual(stats.size, len(small))
+        self.assertLess(abs(stats.estimated_size - stats.size), stats.size * 0.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+import os
+import sys
+import unittest
+from io import BytesIO
+
+from docx import Document
+
+# Add the directory containing the library to the python path
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "lib", "python"))
+
+from extract_experiments_from_docx import extract_experiments_from_docx
+
+
+def make_docx(lines) -> bytes:
+    doc = Document()
+    for line in lines:
+        doc.add_paragraph(line)
+    out = BytesIO()
+    doc.save(out)
+    return out.getvalue()
+
+
+class ExtractExperimentsTest(unittest.TestCase):
+    def assert_chapter_5(self, result, section, sub_name):
+        self.assertEqual(result["chapter"], 5)
+        self.assertEqual([(ex["idx"], ex["subidx"]) for ex in result["experiments"]], [(1, None), (1, 1), (2, None)])
+        sub = result["experiments"][1]
+        self.assertEqual(sub["section"], section)
+        self.assertEqual(sub["name"], sub_name)
+        self.assertEqual([b["type"] for b in sub["blocks"]], ["table", "figure"])
+
+    def test_ascii_digits(self):
+        data = make_docx([
+            "5. 実験結果", "5.1 反転増幅回路", "(1-1) 入出力特性",
+            "表5.1.1 入力電圧と出力電圧", "図5.1.1 入出力特性",
+            "5.2 非反転増幅回路",
+            "6. 考察", "6.1 誤差",
+        ])
+        self.assert_chapter_5(extract_experiments_from_docx(BytesIO(data)), "5.1", "(1-1) 入出力特性")
+
+    def test_full_width_digits(self):
+        data = make_docx([
+            "５. 実験結果", "５.１ 反転増幅回路", "（１-１） 入出力特性",
+            "表５.１.１ 入力電圧と出力電圧", "図５.１.１ 入出力特性",
+            "５.２ 非反転増幅回路",
+            "６. 考察", "６.１ 誤差",
+        ])
+        self.assert_chapter_5(extract_experiments_from_docx(BytesIO(data)), "５.１", "（１-１） 入出力特性")
+
+    def test_mixed_digits(self):
+        # Chapter heading in ASCII, section numbers in full width
+        data = make_docx(["5. 実験結果", "５.１ 反転増幅回路", "５.２ 非反転増幅回路", "６.１ 誤差"])
+        result = extract_experiments_from_docx(BytesIO(data))
+        self.assertEqual([ex["section"] for ex in result["experiments"]], ["５.１", "５.２"])
+
+
+if __name__ == "__main__":
+    unittest.main()
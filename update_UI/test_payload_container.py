@@ -0,0 +1,100 @@
+import base64
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+import zipfile
+from io import BytesIO
+
+from PIL import Image
+
+# Add the directory containing the library to the python path
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(ROOT, "lib", "docx"))
+
+from payload_container import MAGIC, PayloadContainer, is_container, write_container
+from render_with_docxtpl import render_report
+
+TEMPLATE_PATH = os.path.join(ROOT, "templates", "chapter_fixed.docx")
+
+
+def make_png() -> bytes:
+    out = BytesIO()
+    Image.new("RGB", (64, 32), (200, 30, 30)).save(out, format="PNG")
+    return out.getvalue()
+
+
+def figure_context(figure_image):
+    figure = {"label": "図5.1", "caption": "入出力特性", "figure_image": figure_image}
+    return {
+        "chapter": 5,
+        "experiments": [{
+            "idx": 1, "name": "反転増幅回路", "description_brief": "概要",
+            "figures": [figure],
+            "blocks": [{"type": "figure", "figure": {"label": "図5.1", "caption": "入出力特性"}}],
+        }],
+    }
+
+
+def container_bytes(payload, attachments) -> bytes:
+    out = BytesIO()
+    write_container(out, payload, attachments)
+    return out.getvalue()
+
+
+class PayloadContainerTest(unittest.TestCase):
+    def setUp(self):
+        self.payload = {"template_path": TEMPLATE_PATH, "context": {"chapter": 5, "title": "反転増幅回路"}}
+        self.attachments = {"fig-1": make_png(), "空": b""}
+
+    def test_round_trip_from_bytes(self):
+        data = container_bytes(self.payload, self.attachments)
+        self.assertTrue(is_container(data))
+        with PayloadContainer.from_bytes(data) as container:
+            self.assertEqual(container.payload, self.payload)
+            self.assertEqual({k: bytes(v) for k, v in container.attachments.items()}, self.attachments)
+            self.assertIsInstance(container.attachments["fig-1"], memoryview)
+
+    def test_round_trip_from_file(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp, True)
+        path = os.path.join(tmp, "payload.rpk")
+        with open(path, "wb") as f:
+            write_container(f, self.payload, self.attachments)
+        container = PayloadContainer.open(path)
+        self.assertEqual(container.payload, self.payload)
+        self.assertEqual(bytes(container.attachments["fig-1"]), self.attachments["fig-1"])
+        container.close()
+        # The mapping is released, so the attachment views are gone
+        self.assertEqual(container.attachments, {})
+
+    def test_malformed_containers(self):
+        data = container_bytes(self.payload, self.attachments)
+        self.assertFalse(is_container(b'{"context": {}}'))
+        for bad in (b'{"context": {}}', data[:-1], data[:len(MAGIC) + 1], container_bytes({}, self.attachments)):
+            with self.assertRaises(ValueError):
+                PayloadContainer.from_bytes(bad)
+        self.assertRaises(ValueError, PayloadContainer.from_bytes, MAGIC)
+
+    def test_attachment_renders_like_base64(self):
+        png = make_png()
+        rendered = {}
+        for name, figure_image, attachments in (
+            ("base64", {"buffer": base64.b64encode(png).decode("ascii")}, None),
+            ("container", {"ref": "fig-1"}, {"fig-1": png}),
+        ):
+            payload = {"template_path": TEMPLATE_PATH, "context": figure_context(figure_image), "no_cache": True}
+            if attachments:
+                with PayloadContainer.from_bytes(container_bytes(payload, attachments)) as container:
+                    docx_bytes = render_report(container.payload, container.attachments)
+            else:
+                docx_bytes = render_report(payload)
+            with zipfile.ZipFile(BytesIO(docx_bytes)) as z:
+                rendered[name] = {n: z.read(n) for n in z.namelist() if n.startswith("word/")}
+        self.assertIn(png, rendered["container"].values())
+        self.assertEqual(rendered["container"], rendered["base64"])
+
+
+if __name__ == "__main__":
+    unittest.main()
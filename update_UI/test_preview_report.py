@@ -0,0 +1,116 @@
+import base64
+import json
+import os
+import sys
+import tempfile
+import threading
+import unittest
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+from io import BytesIO
+
+from PIL import Image
+
+# Add the project root to sys.path so the handler is imported the way Vercel loads it
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(ROOT)
+
+from api.preview_report import handler
+from lib.docx.payload_container import CONTENT_TYPE, write_container
+
+
+def make_png() -> bytes:
+    out = BytesIO()
+    Image.new("RGB", (640, 480), (30, 120, 200)).save(out, format="PNG")
+    return out.getvalue()
+
+
+def context_with(figure_image):
+    return {
+        "chapter": 5, "chapter_plus_1": 6, "chapter_plus_2": 7,
+        "summary": "増幅率は理論値と一致した。",
+        "experiments": [{
+            "idx": 1, "name": "反転増幅回路 <b>", "description_brief": "入出力特性を測定した。",
+            "tables": [{"label": "表5.1", "caption": "測定データ", "rows": [["Vin [V]", "Vout [V]"], ["0.1", "-1.0"]]}],
+            "figures": [{"label": "図5.1", "caption": "入出力特性", "figure_image": figure_image}],
+            "blocks": [
+                {"type": "table", "table": {"label": "表5.1", "caption": "測定データ"}},
+                {"type": "figure", "figure": {"label": "図5.1", "caption": "入出力特性"}},
+            ],
+        }],
+    }
+
+
+class PreviewReportHandlerTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        handler.log_message = lambda *args: None
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = f"http://127.0.0.1:{cls.server.server_address[1]}/api/preview_report"
+        cls.png = make_png()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def post(self, body: bytes, content_type: str = "application/json"):
+        request = urllib.request.Request(self.url, data=body, headers={"Content-Type": content_type})
+        try:
+            with urllib.request.urlopen(request, timeout=10) as response:
+                return response.status, response.headers, response.read().decode("utf-8")
+        except urllib.error.HTTPError as e:
+            return e.code, e.headers, e.read().decode("utf-8")
+
+    def post_json(self, context):
+        return self.post(json.dumps({"context": context}, ensure_ascii=False).encode("utf-8"))
+
+    def test_json_payload(self):
+        status, headers, html = self.post_json(context_with({"buffer": base64.b64encode(self.png).decode("ascii")}))
+        self.assertEqual(status, 200)
+        self.assertEqual(headers["Content-Type"], "text/html; charset=utf-8")
+        self.assertEqual(headers["Cache-Control"], "no-store")
+        self.assertTrue(html.startswith("<!DOCTYPE html>"))
+        self.assertIn("<h3>5.1 反転増幅回路 &lt;b&gt;</h3>", html)
+        self.assertIn("<td>-1.0</td>", html)
+        self.assertIn('<img src="data:image/png;base64,', html)
+        self.assertNotIn('class="rp-missing"', html)
+        self.assertIn("<h2>6. 考察</h2>", html)
+        # The figure is sent as a thumbnail, not at full size
+        uri = html.split('<img src="data:image/png;base64,', 1)[1].split('"', 1)[0]
+        with Image.open(BytesIO(base64.b64decode(uri))) as thumb:
+            self.assertLess(max(thumb.size), 640)
+
+    def test_container_payload(self):
+        body = BytesIO()
+        write_container(body, {"context": context_with({"ref": "fig-1"})}, {"fig-1": self.png})
+        status, _, html = self.post(body.getvalue(), CONTENT_TYPE)
+        self.assertEqual(status, 200)
+        self.assertIn('<img src="data:image/png;base64,', html)
+
+    def test_unusable_images_show_placeholder(self):
+        with tempfile.NamedTemporaryFile(suffix=".png") as local:
+            local.write(self.png)
+            local.flush()
+            for figure_image in (
+                {"buffer": base64.b64encode(b"not an image").decode("ascii")},
+                {"ref": "missing"},
+                # Request payloads never read files on the server
+                {"path": local.name},
+            ):
+                status, _, html = self.post_json(context_with(figure_image))
+                self.assertEqual(status, 200)
+                self.assertIn('<p class="rp-missing">（図なし）</p>', html, figure_image)
+                self.assertNotIn("<img", html)
+
+    def test_invalid_body(self):
+        status, headers, body = self.post(b"{not json")
+        self.assertEqual(status, 500)
+        self.assertEqual(headers["Content-Type"], "application/json")
+        self.assertIn("error", json.loads(body))
+
+
+if __name__ == "__main__":
+    unittest.main()
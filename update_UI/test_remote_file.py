@@ -0,0 +1,139 @@
+import hashlib
+import os
+import sys
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Add the directory containing the library to the python path
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "lib", "python"))
+
+import remote_file
+
+REPORT = hashlib.sha256(b"report").digest() * 1024  # 32 KiB
+BIG = b"x" * (256 * 1024)
+
+
+class StorageStandIn(BaseHTTPRequestHandler):
+    """A local stand-in for the storage bucket (keep-alive HTTP/1.1)."""
+    protocol_version = "HTTP/1.1"
+    connections = set()
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        StorageStandIn.connections.add(self.client_address)
+        if self.path == "/report.docx":
+            self._send(REPORT)
+        elif self.path == "/big":
+            self._send(BIG)
+        elif self.path == "/big-no-length":
+            # Body delimited by closing the connection, so the size is only known while reading
+            self.send_response(200)
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.wfile.write(BIG)
+            self.close_connection = True
+        elif self.path == "/slow":
+            time.sleep(1.0)
+            self._send(REPORT)
+        else:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+    def _send(self, data):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class QuietServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # The client hangs up on purpose (size limit, timeout)
+        pass
+
+
+class FetchFileTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = QuietServer(("127.0.0.1", 0), StorageStandIn)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base = f"http://127.0.0.1:{cls.server.server_address[1]}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        # A fresh pool with short timeouts for every test
+        self._saved = (remote_file.CONNECT_TIMEOUT, remote_file.READ_TIMEOUT, remote_file.urllib3)
+        remote_file.CONNECT_TIMEOUT = remote_file.READ_TIMEOUT = 0.3
+        remote_file._pool = None
+        StorageStandIn.connections.clear()
+
+    def tearDown(self):
+        remote_file.CONNECT_TIMEOUT, remote_file.READ_TIMEOUT, remote_file.urllib3 = self._saved
+        remote_file._pool = None
+
+    def test_fetch_hashes_content(self):
+        fetched = remote_file.fetch_file(self.base + "/report.docx")
+        self.assertEqual(fetched.data, REPORT)
+        self.assertEqual(fetched.sha256, hashlib.sha256(REPORT).hexdigest())
+        self.assertEqual(fetched.content_type, "application/octet-stream")
+
+    @unittest.skipIf(remote_file.urllib3 is None, "urllib3 is not installed")
+    def test_connection_reuse(self):
+        for _ in range(3):
+            remote_file.fetch_file(self.base + "/report.docx")
+        self.assertEqual(len(StorageStandIn.connections), 1)
+
+    def test_over_limit_with_content_length(self):
+        with self.assertRaises(remote_file.DownloadTooLarge) as cm:
+            remote_file.fetch_file(self.base + "/big", max_bytes=64 * 1024)
+        self.assertEqual(cm.exception.status, 413)
+
+    def test_over_limit_without_content_length(self):
+        with self.assertRaises(remote_file.DownloadTooLarge):
+            remote_file.fetch_file(self.base + "/big-no-length", max_bytes=64 * 1024, chunk_size=16 * 1024)
+
+    def test_not_found(self):
+        with self.assertRaises(remote_file.DownloadError) as cm:
+            remote_file.fetch_file(self.base + "/missing")
+        self.assertNotIsInstance(cm.exception, remote_file.DownloadTooLarge)
+        self.assertEqual(cm.exception.status, 502)
+
+    def test_timeout(self):
+        with self.assertRaises(remote_file.DownloadError) as cm:
+            remote_file.fetch_file(self.base + "/slow")
+        self.assertEqual(cm.exception.status, 502)
+
+    def test_bad_scheme(self):
+        for url in ("file:///etc/passwd", "ftp://example.com/report.docx", "report.docx"):
+            with self.assertRaises(remote_file.InvalidFileUrl) as cm:
+                remote_file.fetch_file(url)
+            self.assertEqual(cm.exception.status, 400)
+
+    def test_urllib_fallback(self):
+        remote_file.urllib3 = None
+        fetched = remote_file.fetch_file(self.base + "/report.docx")
+        self.assertEqual(fetched.sha256, hashlib.sha256(REPORT).hexdigest())
+        with self.assertRaises(remote_file.DownloadTooLarge):
+            remote_file.fetch_file(self.base + "/big", max_bytes=64 * 1024)
+        with self.assertRaises(remote_file.DownloadTooLarge):
+            remote_file.fetch_file(self.base + "/big-no-length", max_bytes=64 * 1024, chunk_size=16 * 1024)
+        with self.assertRaises(remote_file.DownloadError):
+            remote_file.fetch_file(self.base + "/missing")
+        with self.assertRaises(remote_file.DownloadError):
+            remote_file.fetch_file(self.base + "/slow")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+import os
+import sys
+import zipfile
+from io import BytesIO
+
+# Add the directory containing the library to the python path
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(ROOT, "lib", "docx"))
+
+from render_with_docxtpl import render_report
+
+TEMPLATE_PATH = os.path.join(ROOT, "templates", "chapter_fixed.docx")
+
+# Payload keys that are optional in practice; a missing key must render as nothing, not "None".
+CASES = {
+    "no description_brief": {
+        "idx": 1, "name": "反転増幅回路",
+    },
+    "figure block without figures": {
+        "idx": 1, "name": "反転増幅回路", "description_brief": "概要",
+        "figures": [],
+        "blocks": [{"type": "figure"}],
+    },
+    "table ref without rows": {
+        "idx": 1, "name": "反転増幅回路", "description_brief": "概要",
+        "tables": [{"label": "表5.1", "caption": "入出力特性"}],
+        "blocks": [{"type": "table", "table": {"label": "表5.1", "caption": "入出力特性"}}],
+    },
+}
+
+
+def render_document_xml(experiment):
+    payload = {
+        "template_path": TEMPLATE_PATH,
+        "context": {"chapter": 5, "experiments": [experiment]},
+        "no_cache": True,
+    }
+    docx_bytes = render_report(payload)
+    return zipfile.ZipFile(BytesIO(docx_bytes)).read("word/document.xml").decode("utf-8")
+
+
+def test_missing_fields_render_empty():
+    for name, experiment in CASES.items():
+        xml = render_document_xml(experiment)
+        assert ">None<" not in xml, f"{name}: a missing key was rendered as 'None'"
+
+
+if __name__ == "__main__":
+    test_missing_fields_render_empty()
+    print("SUCCESS: Missing payload keys render as empty.")
@@ -0,0 +1,104 @@
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+from docx import Document
+
+# Add the directory containing the library to the python path
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "lib", "python"))
+
+from extract_experiments_from_docx import extract_experiments_from_docx
+from report_index import ReportIndex
+
+OPAMP = [
+    "5. 実験結果", "5.1 反転増幅回路", "(1-1) 入出力特性",
+    "図5.1.1 回路図", "表5.1.1 入力電圧と出力電圧", "図5.1.2 入出力特性",
+    "5.2 周波数特性", "表5.2.1 利得の周波数特性",
+]
+DIODE = ["3. 実験結果", "3.1 静特性", "図3.1.1 ダイオードの電圧電流特性"]
+
+
+def write_docx(path, lines):
+    doc = Document()
+    for line in lines:
+        doc.add_paragraph(line)
+    doc.save(path)
+
+
+class ReportIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.reports = os.path.join(self.tmp, "reports")
+        os.makedirs(os.path.join(self.reports, "2023"))
+        self.opamp = os.path.join(self.reports, "opamp.docx")
+        self.diode = os.path.join(self.reports, "2023", "diode.docx")
+        write_docx(self.opamp, OPAMP)
+        write_docx(self.diode, DIODE)
+        self.db_path = os.path.join(self.tmp, "index.sqlite3")
+        self.index = ReportIndex(self.db_path)
+
+    def tearDown(self):
+        self.index.close()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def count(self, table):
+        return self.index.conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+    def test_index_and_get_report(self):
+        stats = self.index.update(self.reports, recursive=True)
+        self.assertEqual(stats, {"indexed": 2, "unchanged": 0, "failed": 0, "removed": 0})
+        # Same output as the extractor, including blocks in document order
+        self.assertEqual(self.index.get_report(self.opamp), extract_experiments_from_docx(self.opamp))
+        blocks = self.index.get_report(self.opamp)["experiments"][1]["blocks"]
+        self.assertEqual([b["label"] for b in blocks], ["図5.1.1", "表5.1.1", "図5.1.2"])
+        self.assertIsNone(self.index.get_report(os.path.join(self.reports, "missing.docx")))
+
+        stats = self.index.update(self.reports, recursive=True)
+        self.assertEqual(stats["unchanged"], 2)
+
+    def test_search_captions(self):
+        self.index.update(self.reports, recursive=True)
+        hits = self.index.search_captions("周波数特性")
+        self.assertEqual([(h["label"], h["section"]) for h in hits], [("表5.2.1", "5.2")])
+        # Shorter than a trigram: LIKE fallback
+        self.assertEqual([h["label"] for h in self.index.search_captions("回路")], ["図5.1.1"])
+        self.assertEqual(self.index.find_reports("特性", kind="figure"), [self.diode, self.opamp])
+        self.assertEqual(self.index.find_reports("特性", kind="table"), [self.opamp])
+
+    def test_replacing_a_report_cascades(self):
+        self.index.update(self.opamp)
+        self.assertEqual(self.count("blocks"), 4)
+        write_docx(self.opamp, ["5. 実験結果", "5.1 反転増幅回路", "表5.1.1 入力電圧と出力電圧"])
+        self.assertEqual(self.index.update(self.opamp)["indexed"], 1)
+        self.assertEqual(self.count("experiments"), 1)
+        self.assertEqual(self.count("blocks"), 1)
+        self.assertEqual(self.index.search_captions("周波数特性"), [])
+
+    def test_prune_removed_files(self):
+        self.index.update(self.reports, recursive=True)
+        os.remove(self.diode)
+        # Without recursion only files directly under the directory are pruned
+        self.assertEqual(self.index.update(self.reports)["removed"], 0)
+        stats = self.index.update(self.reports, recursive=True)
+        self.assertEqual(stats["removed"], 1)
+        self.assertIsNone(self.index.get_report(self.diode))
+        self.assertEqual(self.count("blocks"), 4)
+        self.assertEqual(self.index.search_captions("ダイオード"), [])
+
+    def test_old_schema_is_rebuilt(self):
+        self.index.update(self.opamp)
+        self.index.close()
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("PRAGMA user_version = 1")
+        conn.commit()
+        conn.close()
+        self.index = ReportIndex(self.db_path)
+        self.assertIsNone(self.index.get_report(self.opamp))
+        self.assertEqual(self.index.update(self.opamp)["indexed"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
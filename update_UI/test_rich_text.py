@@ -0,0 +1,39 @@
+import os
+import sys
+
+from docxtpl import RichText
+
+# Add the directory containing the library to the python path
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(ROOT, "lib", "docx"))
+
+from content_rules import consideration_unit_parts
+from render_with_docxtpl import create_consideration_units_rt, _rich_text_from_parts
+
+PARTS = ["Vout = -(Rf/Ri)·Vin", "<w:t>", "R&D \"quoted\" 'single'", "", "単位\t[V]"]
+
+
+def test_runs_match_rich_text_add():
+    expected = RichText()
+    for part in PARTS:
+        expected.add(part)
+    assert _rich_text_from_parts(PARTS).xml == expected.xml
+
+
+def test_consideration_units_match_rich_text_add():
+    units = [
+        {"index": "1", "discussion_active": "Vout < 0 & |A| > 1 となった理由", "answer": "反転増幅のため"},
+        {"index": "2", "discussion_active": "誤差の原因"},
+    ]
+    expected = RichText()
+    for part in consideration_unit_parts(units):
+        expected.add(part)
+    xml = create_consideration_units_rt(units).xml
+    assert xml == expected.xml
+    assert "Vout &lt; 0 &amp; |A| &gt; 1" in xml
+
+
+if __name__ == "__main__":
+    test_runs_match_rich_text_add()
+    test_consideration_units_match_rich_text_add()
+    print("SUCCESS: RichText runs match RichText.add.")
@@ -0,0 +1,40 @@
+import os
+import sys
+import unittest
+
+# Add the directory containing the library to the python path
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "lib", "python"))
+
+from smart_splitter import SmartSplitter
+
+
+class SmartSplitterTest(unittest.TestCase):
+    def setUp(self):
+        self.splitter = SmartSplitter()
+
+    def test_sentence_starting_with_keyword_is_not_a_heading(self):
+        text = "4. 実験方法\n回路を組んだ。\n結果を表に記録した。\n電源を入れて測定した。\n5. 実験結果\n表1に示す。\n"
+        contexts = self.splitter.split(text)
+        self.assertEqual(contexts.method_text, "4. 実験方法\n回路を組んだ。\n結果を表に記録した。\n電源を入れて測定した。\n")
+        self.assertEqual(contexts.section("results"), "5. 実験結果\n表1に示す。\n")
+
+    def test_unnumbered_keyword_heading(self):
+        text = "目的\nトランジスタの特性を調べる。\n実験方法\n回路を組んだ。\n考察\n妥当である。\n"
+        spans = self.splitter.index_sections(text)
+        self.assertEqual(text[slice(*spans["method"])], "実験方法\n回路を組んだ。\n")
+        self.assertEqual(text[slice(*spans["discussion"])], "考察\n妥当である。\n")
+
+    def test_keyword_inside_numbered_title(self):
+        text = "1. 実験の目的\n特性を調べる。\n2. 実験方法\n1. 電源を入れて目的の電圧にする。\n3. 考察\n妥当である。\n"
+        spans = self.splitter.index_sections(text)
+        self.assertEqual(text[slice(*spans["purpose"])], "1. 実験の目的\n特性を調べる。\n")
+        self.assertEqual(text[slice(*spans["method"])], "2. 実験方法\n1. 電源を入れて目的の電圧にする。\n")
+
+    def test_measurement_lines_do_not_end_a_section(self):
+        text = "4. 実験方法\n4.1 回路\n12.5 mA で測定した\n5.0 V\n5. 実験結果\n"
+        spans = self.splitter.index_sections(text)
+        self.assertEqual(text[slice(*spans["method"])], "4. 実験方法\n4.1 回路\n12.5 mA で測定した\n5.0 V\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
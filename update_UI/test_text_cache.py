@@ -0,0 +1,105 @@
+import asyncio
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import unittest
+from io import BytesIO
+from unittest import mock
+
+# Add the directory containing the library to the python path
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "lib", "python"))
+# optimized_workflow creates its OpenAI client on import; no request is sent in these tests
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+from docx import Document
+
+try:
+    import pymupdf
+except ImportError:  # pragma: no cover
+    import fitz as pymupdf
+
+import optimized_workflow as ow
+import text_cache
+
+
+def make_docx() -> bytes:
+    doc = Document()
+    for line in ("1. 目的", "特性を調べる。", "4. 実験方法", "回路を組んだ。", "6. 考察", "妥当である。"):
+        doc.add_paragraph(line)
+    out = BytesIO()
+    doc.save(out)
+    return out.getvalue()
+
+
+def make_pdf() -> bytes:
+    doc = pymupdf.open()
+    doc.new_page().insert_text((72, 72), "4. Method")
+    return doc.tobytes()
+
+
+class ExtractContextsCachedTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.data = make_docx()
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmp, "text_cache.sqlite3")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def extract(self, source=None, filename="manual.docx", db_path=None):
+        source = self.data if source is None else source
+        return asyncio.run(ow.extract_contexts_cached(source, filename, db_path=db_path or self.db_path))
+
+    def test_miss_then_hit(self):
+        contexts, entry = self.extract()
+        self.assertFalse(entry.hit)
+        self.assertEqual(entry.file_type, "docx")
+        self.assertIn("回路を組んだ。", contexts.method_text)
+
+        cached, cached_entry = self.extract()
+        self.assertTrue(cached_entry.hit)
+        self.assertEqual(cached.full_text, contexts.full_text)
+        self.assertEqual(cached.section_spans, contexts.section_spans)
+
+    def test_token_counts_use_the_same_database(self):
+        _, entry = self.extract()
+        counts = ow.cached_token_counts(entry, db_path=self.db_path)
+        self.assertGreater(counts["tokens"]["full"], 0)
+
+    def test_unopenable_database_falls_back_to_extraction(self):
+        contexts, entry = self.extract(db_path=os.path.join(self.tmp, "missing", "cache.sqlite3"))
+        self.assertFalse(entry.hit)
+        self.assertIn("回路を組んだ。", contexts.method_text)
+
+    def test_lookup_and_store_errors_fall_back_to_extraction(self):
+        locked = sqlite3.OperationalError("database is locked")
+        with mock.patch.object(text_cache.TextCache, "get", side_effect=locked), \
+                mock.patch.object(text_cache.TextCache, "put", side_effect=locked):
+            contexts, entry = self.extract()
+        self.assertFalse(entry.hit)
+        self.assertEqual(entry.size, len(self.data))
+        self.assertIn("回路を組んだ。", contexts.method_text)
+
+    def test_stream_without_filename_and_cache_disabled(self):
+        with mock.patch.object(text_cache, "ENABLED", False):
+            contexts, entry = self.extract(BytesIO(self.data), filename=None)
+        self.assertEqual(entry.file_type, "docx")
+        self.assertEqual(entry.size, len(self.data))
+        self.assertIn("回路を組んだ。", contexts.method_text)
+
+    def test_pdf_stream_without_filename_and_cache_disabled(self):
+        # The PDF reader consumes the stream, so the type must be detected before extracting
+        data = make_pdf()
+        with mock.patch.object(text_cache, "ENABLED", False):
+            _, entry = self.extract(BytesIO(data), filename=None)
+        self.assertEqual(entry.file_type, "pdf")
+        self.assertEqual(entry.size, len(data))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import os
+import sys
+import unittest
+from unittest import mock
+
+# Add the directory containing the library to the python path
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "lib", "python"))
+# optimized_workflow creates its OpenAI client on import; no request is sent in these tests
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+import optimized_workflow as ow
+import token_budget
+from smart_splitter import SmartSplitter
+
+BUDGET_VARS = ("OPENAI_MAX_INPUT_TOKENS", "OPENAI_MAX_COST_USD", "OPENAI_BUDGET_ACTION")
+
+
+def large_report():
+    lines = ["1. 目的", "トランジスタの静特性を調べる。", "4. 実験方法"]
+    lines += [f"手順{i}: コレクタ電圧を {i * 0.1:.1f} V に設定し、コレクタ電流を測定した。" for i in range(2000)]
+    lines += ["6. 考察", "測定値は理論値とよく一致しており、妥当である。" * 200]
+    return SmartSplitter().split("\n".join(lines) + "\n")
+
+
+class TokenBudgetTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.contexts = large_report()
+
+    def setUp(self):
+        patcher = mock.patch.dict(os.environ)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        for name in BUDGET_VARS:
+            os.environ.pop(name, None)
+
+    def test_no_limit_by_default(self):
+        budget = token_budget.Budget.from_env()
+        self.assertEqual((budget.max_input_tokens, budget.max_cost_usd, budget.action), (0, 0.0, "chunk"))
+
+        plan = ow.plan_workflow(self.contexts)
+        self.assertTrue(plan.within_budget)
+        plan.enforce()
+        for task in plan.tasks:
+            self.assertEqual(task.calls, 1, task.name)
+            self.assertFalse(task.chunked, task.name)
+        self.assertGreater(plan.task("methods").input_tokens, 10000)
+
+    def test_explicit_limit_chunks(self):
+        os.environ["OPENAI_MAX_INPUT_TOKENS"] = "8000"
+        plan = ow.plan_workflow(self.contexts)
+        methods = plan.task("methods")
+        self.assertTrue(methods.chunked)
+        self.assertGreater(methods.calls, 1)
+        self.assertLessEqual(methods.max_call_input_tokens, 8000)
+        self.assertEqual("".join(methods.chunks), self.contexts.method_text)
+        self.assertTrue(plan.within_budget)
+
+    def test_explicit_limit_refuses(self):
+        os.environ["OPENAI_MAX_INPUT_TOKENS"] = "8000"
+        os.environ["OPENAI_BUDGET_ACTION"] = "refuse"
+        plan = ow.plan_workflow(self.contexts)
+        self.assertFalse(plan.within_budget)
+        self.assertEqual(plan.task("methods").calls, 0)
+        with self.assertRaises(token_budget.BudgetExceeded):
+            plan.enforce()
+
+    def test_cost_limit(self):
+        os.environ["OPENAI_MAX_COST_USD"] = "0.000001"
+        plan = ow.plan_workflow(self.contexts)
+        self.assertEqual(len(plan.violations), 1)
+        self.assertIn("estimated cost", plan.violations[0])
+
+    def test_invalid_action(self):
+        os.environ["OPENAI_BUDGET_ACTION"] = "truncate"
+        with self.assertRaises(ValueError):
+            token_budget.Budget.from_env()
+
+    def test_split_to_budget(self):
+        text = "".join(f"行{i}: 測定値を記録した。\n" for i in range(500))
+        encoding = token_budget.encoding_for(ow.MODEL)
+        chunks = token_budget.split_to_budget(text, 200, encoding)
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual("".join(chunks), text)
+        for chunk in chunks:
+            self.assertLessEqual(token_budget.count_tokens(chunk, encoding)[1], 200)
+        self.assertEqual(token_budget.split_to_budget(text, 0, encoding), [text])
+
+
+if __name__ == "__main__":
+    unittest.main()